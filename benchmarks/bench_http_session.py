@@ -0,0 +1,71 @@
+"""
+Сравнение задержки запроса к LLM: новая aiohttp-сессия на каждый вызов
+против одной долгоживущей сессии с пулом соединений.
+
+Запуск: python -m benchmarks.bench_http_session --requests 500 --concurrency 4
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime
+
+from benchmarks.stub_llm import StubLLMServer
+from src.core.dtypes import Transaction
+from src.infrastructure.llm.ollama import OllamaProvider
+
+CATEGORIES = ["Еда", "Транспорт"]
+
+
+async def _run(provider: OllamaProvider, total: int, concurrency: int, per_call_session: bool) -> list:
+    tx = Transaction(date=datetime(2024, 1, 1), amount=100.0, description="Магнит")
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            if per_call_session:
+                # Старое поведение: отдельная сессия (и TCP-соединение) на вызов
+                single = OllamaProvider(provider.base_url, provider.model)
+                await single.categorize_transaction(tx, [], CATEGORIES, "")
+                await single.close()
+            else:
+                await provider.categorize_transaction(tx, [], CATEGORIES, "")
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one() for _ in range(total)))
+    return latencies
+
+
+def _report(name: str, latencies: list):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+    mean = statistics.mean(latencies) * 1000
+    print(f"{name:<22} mean={mean:7.3f} ms  p50={p50:7.3f} ms  p95={p95:7.3f} ms")
+
+
+async def main(total: int, concurrency: int, latency: float):
+    server = StubLLMServer(latency=latency)
+    await server.start()
+    try:
+        provider = OllamaProvider(server.url, "stub", max_connections=concurrency)
+        await provider.start()
+        # Прогрев, чтобы не мерить первый connect
+        await _run(provider, concurrency, concurrency, per_call_session=False)
+
+        _report("per-call session", await _run(provider, total, concurrency, per_call_session=True))
+        _report("shared pooled session", await _run(provider, total, concurrency, per_call_session=False))
+        await provider.close()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.0, help="Искусственная задержка ответа сервера, с")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.latency))
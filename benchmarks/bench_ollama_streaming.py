@@ -0,0 +1,56 @@
+"""
+Время до результата для Ollama: полный ответ ("stream": false) против
+потокового чтения с закрытием запроса после готового JSON.
+Заглушка генерирует "хвост" после закрывающей скобки, как медленная CPU-модель.
+
+Запуск: python -m benchmarks.bench_ollama_streaming --requests 20 --token-delay 0.01 --tail 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime
+
+from benchmarks.stub_llm import StubLLMServer
+from src.core.dtypes import Transaction
+from src.infrastructure.llm.ollama import OllamaProvider
+
+CATEGORIES = ["Еда", "Транспорт"]
+
+
+async def _run(provider: OllamaProvider, total: int) -> list:
+    tx = Transaction(date=datetime(2024, 1, 1), amount=100.0, description="Магнит")
+    latencies = []
+    for _ in range(total):
+        started = time.perf_counter()
+        await provider.categorize_transaction(tx, [], CATEGORIES, "")
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+async def main(total: int, token_delay: float, tail: int):
+    server = StubLLMServer(token_delay=token_delay, tail_tokens=tail)
+    await server.start()
+    try:
+        for streaming in (False, True):
+            provider = OllamaProvider(server.url, "stub", streaming=streaming)
+            try:
+                latencies = await _run(provider, total)
+            finally:
+                await provider.close()
+            label = "stream + early stop" if streaming else "stream: false     "
+            print(
+                f"{label}: p50 {statistics.median(latencies) * 1000:.1f} ms, "
+                f"max {max(latencies) * 1000:.1f} ms"
+            )
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--tail", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.token_delay, args.tail))
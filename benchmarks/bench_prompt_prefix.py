@@ -0,0 +1,58 @@
+"""
+Сколько токенов промпта вычисляет Ollama: старая раскладка (всё одним сообщением,
+транзакция в середине) против неизменного системного префикса + короткого сообщения.
+Заглушка кэширует уже виденные системные сообщения, как кэш префикса Ollama.
+
+Запуск: python -m benchmarks.bench_prompt_prefix --requests 50 --prompt-token-delay 0.0005
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from benchmarks.stub_llm import StubLLMServer
+from src.core.dtypes import Transaction
+from src.infrastructure.llm.ollama import OllamaProvider
+
+CATEGORIES = ["Продукты", "Кафе и рестораны", "Транспорт", "Жилье и ЖКХ", "Здоровье", "Прочее"]
+HINTS = "Если транзакция в 'ВкусВилл' или 'Пятерочка' — это Продукты. Uber и Яндекс — это Транспорт."
+
+
+class SinglePromptOllama(OllamaProvider):
+    """Старая раскладка: системная часть склеена с транзакцией в одно сообщение."""
+
+    async def _complete(self, prompt, system=None, accept=None):
+        return await super()._complete((system or "") + prompt, system=None, accept=accept)
+
+
+async def _run(provider: OllamaProvider, total: int) -> float:
+    started = time.perf_counter()
+    for i in range(total):
+        tx = Transaction(date=datetime(2024, 1, 1 + i % 28), amount=100.0 + i, description=f"Магазин {i}")
+        await provider.categorize_transaction(tx, [], CATEGORIES, HINTS)
+    return time.perf_counter() - started
+
+
+async def main(total: int, prompt_token_delay: float):
+    for label, provider_cls in (("single prompt ", SinglePromptOllama), ("stable prefix", OllamaProvider)):
+        server = StubLLMServer(category="Продукты", prompt_token_delay=prompt_token_delay)
+        await server.start()
+        provider = provider_cls(server.url, "stub")
+        try:
+            elapsed = await _run(provider, total)
+        finally:
+            await provider.close()
+            await server.stop()
+        usage = provider.usage
+        print(
+            f"{label}: {usage['prompt_eval_count'] / usage['calls']:.0f} prompt tokens/call, "
+            f"{elapsed / total * 1000:.1f} ms/call"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--prompt-token-delay", type=float, default=0.0005)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.prompt_token_delay))
@@ -0,0 +1,240 @@
+"""
+Сквозной бенчмарк: синтетическая выписка -> Processor.process_statement -> отчет,
+LLM — локальная заглушка (Ollama или Yandex API) с заданной задержкой и долей ошибок.
+
+Печатает строки/с, p50/p95 задержки запросов к LLM и выписки целиком, пиковую память;
+результат сохраняется в JSON (benchmarks/results/). С --baseline сравнивает
+пропускную способность с прошлым прогоном и завершается с кодом 1 при регрессии.
+
+Запуск:
+    python -m benchmarks.run_benchmark --rows 2000 --latency 0.05 --batch-size 10
+    python -m benchmarks.run_benchmark --provider yandex --error-rate 0.05 --baseline benchmarks/results/base.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from benchmarks.stub_llm import StubLLMServer
+from benchmarks.synthetic import generate_statement
+from src.core.processor import Processor
+from src.infrastructure.database.cache import CategorizationCache
+from src.infrastructure.database.engine import build_engine
+from src.infrastructure.database.models import Base, Note, User
+from src.infrastructure.database.transactions import TransactionStore
+from src.infrastructure.llm.ollama import OllamaProvider
+from src.infrastructure.llm.yandex import YandexGPTProvider
+from src.infrastructure.parsers.sber import SberParser
+from src.infrastructure.parsers.sber_stream import SberStreamParser
+from src.infrastructure.reporters.basic_csv import BasicCSVReportGenerator
+
+CATEGORIES = [
+    "Продукты", "Кафе и рестораны", "Транспорт", "Жилье и ЖКХ", "Здоровье",
+    "Подписки и сервисы", "Одежда", "Развлечения", "Переводы", "Прочее",
+]
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Перцентиль по ближайшему рангу; None для пустого списка."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _build_provider(args, server: StubLLMServer):
+    if args.provider == "yandex":
+        provider = YandexGPTProvider("stub-key", "stub-folder", max_connections=args.max_concurrency_limit)
+        provider.url = f"{server.url}/v1/responses"
+        return provider
+    return OllamaProvider(
+        server.url, "stub", max_connections=args.max_concurrency_limit, streaming=args.ollama_streaming
+    )
+
+
+async def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="fingram-bench-")
+    statement = generate_statement(
+        os.path.join(workdir, "statement.xlsx"),
+        rows=args.rows,
+        merchants=args.merchants,
+        notes_density=args.notes_density,
+        seed=args.seed
+    )
+
+    server = StubLLMServer(
+        latency=args.latency,
+        latency_jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed
+    )
+    await server.start()
+    # Те же PRAGMA, что и у бота; схема — из моделей, временной базе миграции не нужны
+    engine = build_engine(f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+
+    provider = _build_provider(args, server)
+    parser = SberStreamParser() if args.streaming_parser else SberParser(vectorized=not args.legacy_parser)
+    processor = Processor(
+        parser=parser,
+        llm=provider,
+        report_gen=BasicCSVReportGenerator(),
+        max_concurrency=args.max_concurrency,
+        max_concurrency_limit=args.max_concurrency_limit,
+        batch_size=args.batch_size,
+        cache=CategorizationCache() if args.cache else None,
+        store=TransactionStore() if args.store else None
+    )
+
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    durations, llm_latencies, fallbacks = [], [], 0
+    try:
+        for repeat in range(args.repeat):
+            async with session_maker() as db:
+                # Новый пользователь на каждый повтор: кэш и сохраненные строки не переиспользуются между ними
+                user = User(telegram_id=10_000 + repeat, username="bench")
+                user.set_categories(CATEGORIES)
+                db.add(user)
+                await db.commit()
+                db.add_all(Note(user_id=user.id, raw_text=text, created_at=when) for when, text in statement.notes)
+                await db.commit()
+
+                started = time.perf_counter()
+                await processor.process_statement(user, statement.path, db)
+                durations.append(time.perf_counter() - started)
+
+                stats = processor.last_runs[user.id]
+                llm_latencies.extend(stats.spans.get('llm', []))
+                fallbacks += sum(v for k, v in stats.counters.items() if k.startswith('fallback'))
+    finally:
+        traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+        if args.tracemalloc:
+            tracemalloc.stop()
+        await provider.close()
+        await server.stop()
+        await engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    total_rows = args.rows * args.repeat
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "tolerance")},
+        "results": {
+            "rows_per_sec": total_rows / sum(durations),
+            "statement_p50_s": percentile(durations, 50),
+            "statement_p95_s": percentile(durations, 95),
+            "llm_requests": len(llm_latencies),
+            "llm_p50_ms": (percentile(llm_latencies, 50) or 0) * 1000,
+            "llm_p95_ms": (percentile(llm_latencies, 95) or 0) * 1000,
+            "llm_server_errors": server.errors,
+            "fallback_rows": fallbacks,
+            "final_concurrency_limit": processor.limiter.limit,
+            "peak_rss_mb": _peak_rss_mb(),
+            "peak_traced_mb": traced_peak / (1024 * 1024) if traced_peak is not None else None,
+        },
+    }
+
+
+def _save(result: dict, output: Optional[str]) -> str:
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"bench-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return output
+
+
+def _check_regression(result: dict, baseline_path: str, tolerance: float) -> bool:
+    """True, если строк/с меньше базового прогона больше чем на tolerance."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    base = baseline["results"]["rows_per_sec"]
+    current = result["results"]["rows_per_sec"]
+    change = (current - base) / base
+    print(f"rows/sec vs baseline: {base:.1f} -> {current:.1f} ({change:+.1%})")
+    return change < -tolerance
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--merchants", type=int, default=20)
+    parser.add_argument("--notes-density", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--provider", choices=("ollama", "yandex"), default="ollama")
+    parser.add_argument("--latency", type=float, default=0.02, help="Задержка ответа заглушки, с")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Разброс задержки, доля")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Доля ответов 429")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--max-concurrency", type=int, default=4)
+    parser.add_argument("--max-concurrency-limit", type=int, default=16)
+    parser.add_argument("--ollama-streaming", action="store_true")
+    parser.add_argument("--streaming-parser", action="store_true")
+    parser.add_argument("--legacy-parser", action="store_true")
+    parser.add_argument("--cache", action="store_true", help="Включить кэш категоризации")
+    parser.add_argument("--store", action="store_true", help="Включить сохранение транзакций")
+    parser.add_argument("--tracemalloc", action="store_true", help="Пик памяти Python-объектов (медленнее)")
+    parser.add_argument("--output", help="Куда сохранить JSON (по умолчанию benchmarks/results/)")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Допустимое падение строк/с")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.ERROR)
+    result = asyncio.run(run(args))
+    path = _save(result, args.output)
+
+    r = result["results"]
+    print(
+        f"{args.rows} rows x {args.repeat}: {r['rows_per_sec']:.1f} rows/s, "
+        f"statement p50 {r['statement_p50_s']:.2f} s / p95 {r['statement_p95_s']:.2f} s, "
+        f"LLM p50 {r['llm_p50_ms']:.1f} ms / p95 {r['llm_p95_ms']:.1f} ms ({r['llm_requests']} req), "
+        f"peak RSS {r['peak_rss_mb']:.0f} MB"
+    )
+    print(f"saved: {path}")
+
+    if args.baseline and _check_regression(result, args.baseline, args.tolerance):
+        print("REGRESSION: throughput dropped beyond tolerance")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
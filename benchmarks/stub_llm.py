@@ -0,0 +1,170 @@
+"""
+Локальный заглушечный LLM-сервер для бенчмарков.
+Отвечает в формате Ollama /api/generate и /api/chat фиксированной категорией.
+При "stream": true отдает NDJSON по токену с задержкой token_delay,
+а после JSON дописывает tail_tokens пробельных токенов (как медленная модель).
+Для /api/chat имитирует кэш префикса: уже виденное системное сообщение
+не входит в prompt_eval_count (prompt_token_delay — цена токена промпта).
+
+Также отвечает как Yandex Assistant API (/v1/responses). Категория выбирается
+детерминированно по описанию из списка категорий в промпте; пачки получают
+ответ {"results": [...]}. error_rate и rate_limit_rate — доли ответов 503 и 429.
+"""
+import asyncio
+import json
+import random
+import re
+import zlib
+
+from aiohttp import web
+
+_CATEGORIES_RE = re.compile(r'\[\s*"[^\]]*\]')
+_BATCH_LINE_RE = re.compile(r'^(\d+)\. Транзакция: "(.*?)"', re.MULTILINE)
+_SINGLE_RE = re.compile(r'Транзакция: "(.*?)"')
+
+
+class StubLLMServer:
+    def __init__(
+            self,
+            host: str = "127.0.0.1",
+            port: int = 0,
+            latency: float = 0.0,
+            category: str = "Еда",
+            token_delay: float = 0.0,
+            tail_tokens: int = 0,
+            prompt_token_delay: float = 0.0,
+            latency_jitter: float = 0.0,  # Доля разброса задержки: 0.2 — ±20%
+            error_rate: float = 0.0,
+            rate_limit_rate: float = 0.0,
+            seed: int = 0
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.category = category
+        self.token_delay = token_delay
+        self.tail_tokens = tail_tokens
+        self.prompt_token_delay = prompt_token_delay
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._rng = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self._seen_prefixes = set()
+        self._runner = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def _prompt_tokens(self, body: dict) -> int:
+        """Грубая оценка 'токенов' промпта (4 символа); кэшированный системный префикс бесплатен."""
+        if "messages" not in body:
+            return len(body.get("prompt", "")) // 4
+        tokens = 0
+        for message in body["messages"]:
+            content = message.get("content", "")
+            if message.get("role") == "system":
+                if content in self._seen_prefixes:
+                    continue
+                self._seen_prefixes.add(content)
+            tokens += len(content) // 4
+        return tokens
+
+    def _answer(self, text: str) -> str:
+        """JSON-ответ модели: одна категория или {"results": [...]} для пачки."""
+        found = _CATEGORIES_RE.search(text)
+        try:
+            categories = json.loads(found.group(0)) if found else [self.category]
+        except json.JSONDecodeError:
+            categories = [self.category]
+
+        def pick(description: str) -> str:
+            return categories[zlib.crc32(description.encode('utf-8')) % len(categories)]
+
+        batch = _BATCH_LINE_RE.findall(text)
+        if batch:
+            results = [{"id": int(idx), "category": pick(desc), "comment": "stub"} for idx, desc in batch]
+            return json.dumps({"results": results}, ensure_ascii=False)
+        single = _SINGLE_RE.search(text)
+        return json.dumps({"category": pick(single.group(1) if single else ""), "comment": "stub"},
+                          ensure_ascii=False)
+
+    async def _delay_or_fail(self, prompt_tokens: int):
+        """Задержка ответа; иногда вместо ответа — ошибка перегрузки."""
+        jitter = self._rng.uniform(1 - self.latency_jitter, 1 + self.latency_jitter) if self.latency_jitter else 1
+        delay = self.latency * jitter + self.prompt_token_delay * prompt_tokens
+        if delay:
+            await asyncio.sleep(delay)
+        roll = self._rng.random()
+        if roll < self.rate_limit_rate:
+            self.errors += 1
+            raise web.HTTPTooManyRequests()
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.errors += 1
+            raise web.HTTPServiceUnavailable()
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        chat = request.path.endswith("/chat")
+        self.requests += 1
+        prompt_tokens = self._prompt_tokens(body)
+        await self._delay_or_fail(prompt_tokens)
+
+        text = body.get("prompt", "") + "\n".join(m.get("content", "") for m in body.get("messages", []))
+        answer = self._answer(text)
+        # Токены по 4 символа, затем "хвост" генерации после закрывающей скобки
+        tokens = [answer[i:i + 4] for i in range(0, len(answer), 4)] + ["\n"] * self.tail_tokens
+        stats = {
+            "done": True,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(self.prompt_token_delay * prompt_tokens * 1e9),
+            "eval_count": len(tokens),
+            "eval_duration": int(self.token_delay * len(tokens) * 1e9),
+        }
+
+        def chunk(text: str) -> dict:
+            return {"message": {"role": "assistant", "content": text}} if chat else {"response": text}
+
+        if not body.get("stream"):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay * len(tokens))
+            return web.json_response({**chunk(answer), **stats})
+
+        resp = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await resp.prepare(request)
+        try:
+            for token in tokens:
+                await resp.write((json.dumps({**chunk(token), "done": False}) + "\n").encode())
+                if self.token_delay:
+                    await asyncio.sleep(self.token_delay)
+            await resp.write((json.dumps({**chunk(""), **stats}) + "\n").encode())
+        except ConnectionResetError:
+            # Клиент закрыл запрос досрочно
+            pass
+        return resp
+
+    async def _handle_yandex(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.requests += 1
+        text = f"{body.get('instructions', '')}\n{body.get('input', '')}"
+        await self._delay_or_fail(len(text) // 4)
+        return web.json_response({"output": [{"content": [{"text": self._answer(text)}]}]})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/api/generate", self._handle)
+        app.router.add_post("/api/chat", self._handle)
+        app.router.add_post("/v1/responses", self._handle_yandex)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Порт 0 — выбирается свободный, узнаем какой
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,131 @@
+"""
+Генератор синтетических выписок в формате Сбера (xlsx) для бенчмарков.
+Детерминирован при одинаковом seed: одни и те же строки, суммы и заметки.
+
+Запуск: python -m benchmarks.synthetic --rows 10000 --out data/bench/statement.xlsx
+"""
+import argparse
+import os
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+import openpyxl
+
+# (описание, категория банка, типичная сумма)
+MERCHANTS = [
+    ("PYATEROCHKA", "Супермаркеты", 900),
+    ("VKUSVILL", "Супермаркеты", 1200),
+    ("MAGNIT", "Супермаркеты", 700),
+    ("PEREKRESTOK", "Супермаркеты", 1500),
+    ("YANDEX.TAXI", "Транспорт", 450),
+    ("YANDEX.GO", "Транспорт", 380),
+    ("MOSCOW METRO", "Транспорт", 62),
+    ("UBER", "Транспорт", 520),
+    ("SHOKOLADNITSA", "Рестораны", 850),
+    ("COFIX", "Рестораны", 250),
+    ("KFC", "Рестораны", 600),
+    ("APTEKA RIGLA", "Здоровье", 1100),
+    ("ZHKH MOSENERGOSBYT", "Коммунальные платежи", 4200),
+    ("YANDEX PLUS", "Подписки", 299),
+    ("OZON.RU", "Маркетплейсы", 2300),
+    ("WILDBERRIES", "Маркетплейсы", 1800),
+    ("ZARA", "Одежда", 5400),
+    ("KINO MORI", "Развлечения", 900),
+    ("PEREVOD SBP", "Переводы", 3000),
+    ("AZS LUKOIL", "Транспорт", 2500),
+]
+
+NOTE_TEMPLATES = [
+    "{amount} кофе с коллегами",
+    "{amount} продукты на неделю",
+    "{amount} подарок маме",
+    "такси до аэропорта {amount}",
+    "{amount} лекарства",
+]
+
+HEADER = ["Дата операции", "Категория", "Описание операции", "Сумма в рублях"]
+
+
+def _letters(n: int) -> str:
+    text = ""
+    while True:
+        n, rest = divmod(n, 26)
+        text = chr(ord('A') + rest) + text
+        if n == 0:
+            return text
+        n -= 1
+
+
+@dataclass
+class SyntheticStatement:
+    path: str
+    rows: int
+    # (время, текст) заметок, которые нужно положить в БД перед обработкой
+    notes: List[Tuple[datetime, str]]
+
+
+def generate_statement(
+        path: str,
+        rows: int = 1000,
+        merchants: int = len(MERCHANTS),
+        start: datetime = datetime(2024, 1, 1),
+        days: int = 30,
+        notes_density: float = 0.05,
+        seed: int = 42
+) -> SyntheticStatement:
+    """
+    rows — число операций; merchants — сколько разных продавцов (с суффиксами-терминалами,
+    если больше базового списка); notes_density — доля операций, у которых есть заметка рядом.
+    """
+    rng = random.Random(seed)
+    pool = []
+    for i in range(max(1, merchants)):
+        name, category, amount = MERCHANTS[i % len(MERCHANTS)]
+        if i >= len(MERCHANTS):
+            # Буквенный суффикс: цифры при нормализации описания отбрасываются
+            name = f"{name} {_letters(i // len(MERCHANTS))}"
+        pool.append((name, category, amount))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet()
+    # Шапка как в настоящей выгрузке: заголовок не в первой строке
+    ws.append(["Выписка по счету дебетовой карты"])
+    ws.append([f"за период {start:%d.%m.%Y} — {start + timedelta(days=days):%d.%m.%Y}"])
+    ws.append([])
+    ws.append(HEADER)
+
+    notes = []
+    span_seconds = days * 24 * 3600
+    for _ in range(rows):
+        name, category, typical = rng.choice(pool)
+        when = start + timedelta(seconds=rng.randrange(span_seconds))
+        amount = round(typical * rng.uniform(0.5, 1.5), 2)
+        terminal = rng.randrange(1000, 9999)
+        # Даты в двух форматах, как в реальных выгрузках
+        date_value = when if rng.random() < 0.5 else when.strftime("%d.%m.%Y %H:%M")
+        ws.append([date_value, category, f"{name} {terminal} MOSCOW RUS", f"-{amount:.2f}".replace('.', ',')])
+
+        if rng.random() < notes_density:
+            note_time = when + timedelta(minutes=rng.randrange(-120, 120))
+            notes.append((note_time, rng.choice(NOTE_TEMPLATES).format(amount=int(amount))))
+
+    wb.save(path)
+    return SyntheticStatement(path=path, rows=rows, notes=notes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--merchants", type=int, default=len(MERCHANTS))
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--notes-density", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="data/bench/statement.xlsx")
+    args = parser.parse_args()
+    statement = generate_statement(
+        args.out, args.rows, args.merchants, days=args.days, notes_density=args.notes_density, seed=args.seed
+    )
+    print(f"{statement.path}: {statement.rows} rows, {len(statement.notes)} notes")
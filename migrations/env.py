@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import os
+from logging.config import fileConfig
+
+from alembic import context
+from alembic.script import ScriptDirectory
+from dotenv import load_dotenv
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.infrastructure.database.models import Base
+
+config = context.config
+if config.config_file_name is not None and config.attributes.get('configure_logger', True):
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+logger = logging.getLogger(__name__)
+
+# Схема, которую до миграций создавал create_all при старте бота (users и notes)
+LEGACY_REVISION = '0001'
+
+
+def _database_url() -> str:
+    url = config.get_main_option("sqlalchemy.url")
+    if url:
+        return url
+    load_dotenv('config/.env')
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        raise RuntimeError("DATABASE_URL is not set")
+    return url
+
+
+def _configure(**kwargs):
+    context.configure(
+        target_metadata=target_metadata,
+        compare_type=True,
+        # SQLite не умеет ALTER COLUMN — изменения таблиц идут через пересоздание
+        render_as_batch=True,
+        **kwargs
+    )
+
+
+def run_migrations_offline():
+    _configure(url=_database_url(), literal_binds=True, dialect_opts={"paramstyle": "named"})
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def _stamp_legacy_schema(connection: Connection):
+    """
+    База прежней версии бота: таблицы есть, а alembic_version нет. Помечаем ее
+    ревизией 0001, иначе upgrade упадет на создании уже существующих таблиц.
+    """
+    tables = set(inspect(connection).get_table_names())
+    if 'users' in tables and 'alembic_version' not in tables:
+        logger.info("Existing schema without alembic_version, stamping %s", LEGACY_REVISION)
+        context.get_context().stamp(ScriptDirectory.from_config(config), LEGACY_REVISION)
+
+
+def _run_sync(connection: Connection):
+    _configure(connection=connection)
+    with context.begin_transaction():
+        _stamp_legacy_schema(connection)
+        context.run_migrations()
+
+
+async def run_migrations_online():
+    engine = create_async_engine(_database_url(), poolclass=NullPool)
+    async with engine.connect() as connection:
+        await connection.run_sync(_run_sync)
+    await engine.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    asyncio.run(run_migrations_online())
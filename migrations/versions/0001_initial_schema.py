@@ -0,0 +1,44 @@
+"""Исходная схема бота: users и notes, которые создавал create_all
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+
+Базу, созданную прежним create_all (без alembic_version), env.py помечает
+этой ревизией сам, и upgrade head добавляет остальные таблицы и индексы.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('telegram_id', sa.BigInteger(), nullable=False),
+        sa.Column('username', sa.String(), nullable=True),
+        sa.Column('categories', sa.Text(), nullable=True),
+        sa.Column('custom_prompts', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('telegram_id'),
+    )
+    op.create_table(
+        'notes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('raw_text', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade():
+    op.drop_table('notes')
+    op.drop_table('users')
@@ -0,0 +1,33 @@
+"""Кэш категорий по описанию операции
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'category_cache',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('description_key', sa.String(), nullable=False),
+        sa.Column('categories_hash', sa.String(length=40), nullable=False),
+        sa.Column('category', sa.String(), nullable=False),
+        sa.Column('comment', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'description_key', 'categories_hash', name='uq_category_cache_key'),
+    )
+
+
+def downgrade():
+    op.drop_table('category_cache')
@@ -0,0 +1,21 @@
+"""Индекс заметок по пользователю и дате
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_notes_user_created', 'notes', ['user_id', 'created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_notes_user_created', table_name='notes')
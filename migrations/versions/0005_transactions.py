@@ -0,0 +1,38 @@
+"""Сохраненные строки выписок
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'transactions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('fingerprint', sa.String(length=40), nullable=False),
+        sa.Column('date', sa.DateTime(), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('description', sa.Text(), nullable=False),
+        sa.Column('category', sa.String(), nullable=False),
+        sa.Column('comment', sa.Text(), nullable=True),
+        sa.Column('dirty', sa.Boolean(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'fingerprint', name='uq_transactions_fingerprint'),
+    )
+    op.create_index('ix_transactions_user_date', 'transactions', ['user_id', 'date'])
+
+
+def downgrade():
+    op.drop_index('ix_transactions_user_date', table_name='transactions')
+    op.drop_table('transactions')
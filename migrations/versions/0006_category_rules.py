@@ -0,0 +1,33 @@
+"""Правила категорий пользователя
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'category_rules',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.Column('pattern', sa.Text(), nullable=False),
+        sa.Column('is_regex', sa.Boolean(), nullable=False),
+        sa.Column('category', sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_category_rules_user', 'category_rules', ['user_id', 'position'])
+
+
+def downgrade():
+    op.drop_index('ix_category_rules_user', table_name='category_rules')
+    op.drop_table('category_rules')
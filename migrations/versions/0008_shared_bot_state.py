@@ -0,0 +1,38 @@
+"""Общее состояние процессов бота (webhook): FSM, блокировки событий, захват задач
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'fsm_states',
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('state', sa.String(), nullable=True),
+        sa.Column('data', sa.Text(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('key'),
+    )
+    op.create_table(
+        'event_locks',
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('owner', sa.String(length=32), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+    )
+    op.create_index('ix_jobs_user_status', 'jobs', ['user_id', 'status'])
+
+
+def downgrade():
+    op.drop_index('ix_jobs_user_status', table_name='jobs')
+    op.drop_table('event_locks')
+    op.drop_table('fsm_states')
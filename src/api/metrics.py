@@ -0,0 +1,62 @@
+import asyncio
+import contextlib
+import logging
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+from src.core.metrics import REGISTRY, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def create_metrics_app(registry: MetricsRegistry = REGISTRY) -> FastAPI:
+    app = FastAPI(title="FinGram metrics", docs_url=None, redoc_url=None, openapi_url=None)
+    add_metrics_routes(app, registry)
+    return app
+
+
+def add_metrics_routes(app: FastAPI, registry: MetricsRegistry = REGISTRY):
+    """/metrics и /healthz — и в отдельном сервере метрик, и в приложении webhook."""
+
+    @app.get("/metrics")
+    async def prometheus_metrics():
+        return PlainTextResponse(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+    @app.get("/healthz")
+    async def healthz():
+        return {"status": "ok"}
+
+
+class _EmbeddedServer(uvicorn.Server):
+    """uvicorn внутри event loop бота: сигналы остаются за aiogram."""
+
+    def install_signal_handlers(self):  # uvicorn < 0.29
+        pass
+
+    def capture_signals(self):
+        return contextlib.nullcontext()
+
+
+class MetricsServer:
+    """Эндпоинт /metrics для Prometheus, работает в том же процессе, что и бот."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9100, registry: MetricsRegistry = REGISTRY):
+        config = uvicorn.Config(create_metrics_app(registry), host=host, port=port, log_level="warning")
+        self._server = _EmbeddedServer(config)
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._server.serve())
+        logger.info("Metrics endpoint on http://%s:%d/metrics", self._server.config.host, self._server.config.port)
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._server.should_exit = True
+        await self._task
+        self._task = None
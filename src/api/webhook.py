@@ -0,0 +1,79 @@
+import asyncio
+import hmac
+import logging
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional, Set, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from fastapi import FastAPI, Request, Response
+
+from src.api.metrics import add_metrics_routes
+from src.core import metrics
+from src.core.metrics import REGISTRY, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = "/telegram/webhook"
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Собирает бота и диспетчер при старте процесса (в каждом воркере uvicorn — свои)
+BotFactory = Callable[[], Awaitable[Tuple[Bot, Dispatcher]]]
+
+
+def create_webhook_app(
+        build: BotFactory,
+        secret_token: Optional[str] = None,
+        registry: MetricsRegistry = REGISTRY
+) -> FastAPI:
+    """
+    Прием апдейтов Telegram через webhook. Приложение не хранит состояния между
+    запросами, поэтому uvicorn может запускать его в нескольких процессах:
+    FSM, блокировки чатов и очередь выписок общие — в БД.
+    Апдейт подтверждается сразу, обрабатывается в фоне: Telegram не ждет
+    скачивания выписки и не присылает апдейт повторно по таймауту.
+    Эндпоинт публичный, поэтому без secret_token приложение отклоняет все апдейты:
+    иначе любой мог бы прислать поддельный апдейт от имени разрешенного пользователя.
+    """
+    if not secret_token:
+        logger.error("Webhook secret is not set, all updates will be rejected")
+    runtime = {}
+    tasks: Set[asyncio.Task] = set()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        bot, dp = await build()
+        runtime['bot'], runtime['dp'] = bot, dp
+        workflow_data = {**dp.workflow_data, "bot": bot, "dispatcher": dp, "bots": [bot]}
+        await dp.emit_startup(**workflow_data)
+        try:
+            yield
+        finally:
+            # Начатые апдейты дорабатываются до остановки воркеров очереди и сессий
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            await dp.emit_shutdown(**workflow_data)
+            await bot.session.close()
+
+    app = FastAPI(title="FinGram webhook", docs_url=None, redoc_url=None, openapi_url=None, lifespan=lifespan)
+    add_metrics_routes(app, registry)
+
+    async def feed(update: dict):
+        bot, dp = runtime['bot'], runtime['dp']
+        try:
+            with metrics.span('webhook_update'):
+                await dp.feed_update(bot, Update.model_validate(update, context={"bot": bot}))
+        except Exception:
+            logger.exception("Failed to process update %s", update.get('update_id'))
+
+    @app.post(WEBHOOK_PATH)
+    async def telegram_webhook(request: Request):
+        if not secret_token or not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret_token):
+            return Response(status_code=401)
+        update = await request.json()
+        task = asyncio.create_task(feed(update))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        return Response(status_code=200)
+
+    return app
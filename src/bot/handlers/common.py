@@ -1,61 +1,66 @@
 from aiogram import Router, types, F
 from aiogram.filters import Command
-from aiogram.types import BufferedInputFile
+import asyncio
+import logging
 import os
+import uuid
 
-from src.core.dtypes import ExportFile
-from src.infrastructure.database.models import Note
+logger = logging.getLogger(__name__)
 
 router = Router()
 
+JOBS_DIR = "data/jobs"
+
+# Банк и формат определяются по содержимому файла, здесь — только грубый фильтр
+STATEMENT_EXTENSIONS = ('.xlsx', '.xls', '.csv')
+
 
 @router.message(Command("start"))
 async def cmd_start(message: types.Message):
     await message.answer(
         "👋 Привет! Я FinGram.\n\n"
         "1. Пиши мне о тратах текстом: '500 кофе', '15000 продукты'.\n"
-        "2. Раз в месяц скидывай Excel файл от Сбера.\n"
+        "2. Раз в месяц скидывай выписку: Excel от Сбера или Тинькофф, CSV от Тинькофф или Альфа-Банка.\n"
         "3. Настрой свои категории через /settings."
     )
 
 
 @router.message(F.document)
-async def handle_document(message: types.Message, user, db_session, bot, processor):
+async def handle_document(message: types.Message, user, bot, job_queue, processor):
     doc = message.document
-    if not (doc.file_name.endswith('.xlsx') or doc.file_name.endswith('.xls')):
-        await message.answer("❌ Жду файл Excel (.xlsx).")
+    if not (doc.file_name or '').lower().endswith(STATEMENT_EXTENSIONS):
+        await message.answer("❌ Жду выписку: Excel (.xlsx) или CSV.")
         return
 
-    await message.answer("⏳ Анализирую выписку... Это может занять пару минут.")
-
+    # Файл живет в data/jobs до конца обработки: очередь переживает перезапуск бота
+    os.makedirs(JOBS_DIR, exist_ok=True)
     file = await bot.get_file(doc.file_id)
-    file_path = f"data/temp_{doc.file_name}"
+    file_path = os.path.join(JOBS_DIR, f"{uuid.uuid4().hex}_{doc.file_name}")
     await bot.download_file(file.file_path, file_path)
 
-    try:
-        report: ExportFile = await processor.process_statement(user, file_path, db_session)
-        report_bytes = report.file_content
-        report_ext = report.file_ext
-        input_file = BufferedInputFile(
-            report_bytes.read(),
-            filename=f"report_{doc.file_name.split('.')[0]}.{report_ext}"
+    # Чужой файл отклоняем сразу, а не после очереди; читается только начало файла
+    if not await asyncio.to_thread(processor.parser.validate_format, file_path):
+        os.remove(file_path)
+        await message.answer(
+            "❌ Не узнал выписку. Подходят Excel от Сбера или Тинькофф, CSV от Тинькофф или Альфа-Банка."
         )
-        await message.answer_document(input_file, caption="✅ Твой отчет готов!")
-    except Exception as e:
-        await message.answer(f"❌ Ошибка: {str(e)}")
-    finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        return
+
+    job = await job_queue.enqueue(user.id, message.chat.id, file_path, doc.file_name)
+    await message.answer(
+        f"⏳ Выписка принята (задача #{job.id}). Пришлю отчет, как только обработаю.\n"
+        f"Статус: /jobs, отмена: /cancel {job.id}"
+    )
 
 
 @router.message(F.text & ~F.text.startswith('/'))
-async def handle_note(message: types.Message, user, db_session):
-    """Принимает любой текст как заметку"""
-    note = Note(
-        user_id=user.id,
-        raw_text=message.text,
-        created_at=message.date
-    )
-    db_session.add(note)
-    await db_session.commit()
+async def handle_note(message: types.Message, user, note_buffer):
+    """Принимает любой текст как заметку. Подтверждение — только после записи в БД."""
+    try:
+        # Пачка заметок пишется одной транзакцией; там же помечаются строки для пересчета
+        await note_buffer.add(user.id, message.text, message.date)
+    except Exception:
+        logger.warning("Note from user %s was not saved", user.id)
+        await message.answer("❌ Не получилось сохранить заметку, отправь ее еще раз.")
+        return
     await message.answer("✍️ Запомнил.")
\ No newline at end of file
@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import time
+from typing import AsyncGenerator, BinaryIO, Callable, Coroutine, List, Optional, Sequence, Set
+
+from aiogram import Bot, Router, types
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command
+from aiogram.types import InputFile
+
+from src.core.dtypes import ExportFile, StatementProgress, Transaction
+from src.core.interfaces import BaseProgressReporter, BaseReportGenerator
+from src.infrastructure.database.models import Job, JobStatus
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+STATUS_LABELS = {
+    JobStatus.QUEUED: "⏳ в очереди",
+    JobStatus.RUNNING: "⚙️ обрабатывается",
+    JobStatus.DONE: "✅ готово",
+    JobStatus.FAILED: "❌ ошибка",
+    JobStatus.CANCELLED: "🚫 отменено",
+}
+
+
+class ReportInputFile(InputFile):
+    """Отчет отправляется кусками прямо из временного файла, без чтения в память целиком."""
+
+    def __init__(self, file: BinaryIO, filename: str):
+        super().__init__(filename=filename)
+        self.file = file
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        self.file.seek(0)
+        while chunk := self.file.read(self.chunk_size):
+            yield chunk
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds} с"
+    if seconds < 3600:
+        return f"{seconds // 60} мин {seconds % 60:02d} с"
+    return f"{seconds // 3600} ч {seconds % 3600 // 60:02d} мин"
+
+
+def report_file_name(job: Job, report: ExportFile, prefix: str = "report") -> str:
+    return f"{prefix}_{job.file_name.split('.')[0]}.{report.file_ext}"
+
+
+class ProgressMessage(BaseProgressReporter):
+    """
+    Сообщение с ходом обработки выписки. Правится не чаще раза в interval секунд
+    (Telegram ограничивает частоту правок), оценка оставшегося времени — по средней
+    скорости. Когда готовое начало выписки доходит до очередной контрольной точки
+    (checkpoints, в строках), по нему отправляется промежуточный отчет.
+    """
+
+    def __init__(
+            self,
+            bot: Bot,
+            job: Job,
+            message_id: int,
+            report_gen: BaseReportGenerator,
+            interval: float = 5.0,
+            checkpoints: Sequence[int] = (),
+            clock: Callable[[], float] = time.monotonic
+    ):
+        self.bot = bot
+        self.job = job
+        self.message_id = message_id
+        self.report_gen = report_gen
+        self.interval = interval
+        self.clock = clock
+        # Готовое начало выписки, по порядку
+        self.rows: List[Transaction] = []
+        self.latest: Optional[StatementProgress] = None
+        self._checkpoints = sorted(c for c in checkpoints if c > 0)
+        self._last_edit = clock()
+        self._edit_task: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+        # Промежуточные отчеты уходят по одному и по порядку
+        self._send_lock = asyncio.Lock()
+
+    def update(self, progress: StatementProgress):
+        self.rows.extend(progress.ready)
+        self.latest = progress
+
+        reached = False
+        while self._checkpoints and len(self.rows) >= self._checkpoints[0]:
+            self._checkpoints.pop(0)
+            reached = True
+        # Когда готово все, промежуточный отчет не нужен — следом придет полный
+        if reached and (progress.reading or len(self.rows) < progress.total):
+            self._spawn(self._send_partial(list(self.rows)))
+
+        now = self.clock()
+        if now - self._last_edit >= self.interval and (self._edit_task is None or self._edit_task.done()):
+            self._last_edit = now
+            self._edit_task = self._spawn(self._edit(self.progress_text(progress)))
+
+    def progress_text(self, progress: StatementProgress) -> str:
+        total = f"{progress.total}+" if progress.reading else str(progress.total)
+        text = f"⚙️ Задача #{self.job.id} ({self.job.file_name}): готово {progress.done} из {total} строк"
+        if not progress.reading and progress.total:
+            text += f" ({progress.done / progress.total:.0%})"
+        eta = progress.eta()
+        if eta is not None:
+            text += f"\nОсталось примерно {format_duration(eta)}"
+        return text
+
+    async def finish(self, status: str, error: Optional[str] = None):
+        # Полный отчет уже готов: промежуточные больше не нужны
+        self.abort()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        if status == JobStatus.DONE and self.latest is not None:
+            text = (
+                f"✅ Задача #{self.job.id} ({self.job.file_name}): {self.latest.total} строк "
+                f"за {format_duration(self.latest.elapsed)}"
+            )
+        elif status == JobStatus.DONE:
+            text = f"✅ Задача #{self.job.id} ({self.job.file_name}) обработана"
+        else:
+            text = f"❌ Задача #{self.job.id} ({self.job.file_name}): ошибка"
+        await self._edit(text)
+
+    def abort(self):
+        for task in self._tasks:
+            task.cancel()
+
+    def _spawn(self, coro: Coroutine) -> asyncio.Task:
+        task = asyncio.create_task(self._guard(coro))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _guard(self, coro: Coroutine):
+        try:
+            await coro
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Progress update for job %s failed", self.job.id)
+
+    async def _edit(self, text: str):
+        try:
+            await self.bot.edit_message_text(text, chat_id=self.job.chat_id, message_id=self.message_id)
+        except TelegramBadRequest as e:
+            # "message is not modified" и удаленное пользователем сообщение — не ошибка обработки
+            logger.debug("Progress message not edited: %s", e)
+
+    async def _send_partial(self, rows: List[Transaction]):
+        async with self._send_lock:
+            report = await asyncio.to_thread(self.report_gen.generate, rows)
+            try:
+                await self.bot.send_document(
+                    self.job.chat_id,
+                    ReportInputFile(report.file_content, filename=report_file_name(self.job, report, "partial")),
+                    caption=f"📄 Первые {len(rows)} строк (задача #{self.job.id}), обработка продолжается"
+                )
+            finally:
+                report.close()
+
+
+def build_progress_tracker(bot: Bot, interval: float = 5.0, checkpoints: Sequence[int] = ()):
+    """Фабрика для JobQueue: при старте задачи отправляет сообщение, которое дальше правится."""
+
+    async def start(job: Job, report_gen: BaseReportGenerator) -> ProgressMessage:
+        message = await bot.send_message(job.chat_id, f"⚙️ Задача #{job.id} ({job.file_name}): начинаю обработку")
+        return ProgressMessage(bot, job, message.message_id, report_gen, interval, checkpoints)
+
+    return start
+
+
+def build_job_notifier(bot: Bot):
+    """Колбэк для JobQueue: отправляет пользователю отчет или текст ошибки."""
+
+    async def deliver(job: Job, report: Optional[ExportFile], error: Optional[str]):
+        if report is None:
+            await bot.send_message(job.chat_id, f"❌ Ошибка (задача #{job.id}): {error}")
+            return
+
+        input_file = ReportInputFile(report.file_content, filename=report_file_name(job, report))
+        try:
+            await bot.send_document(job.chat_id, input_file, caption="✅ Твой отчет готов!")
+        finally:
+            report.close()
+
+    return deliver
+
+
+@router.message(Command("jobs"))
+async def cmd_jobs(message: types.Message, user, job_queue):
+    jobs = await job_queue.list_jobs(user.id)
+    if not jobs:
+        await message.answer("📭 Задач пока нет.")
+        return
+
+    lines = []
+    for job in jobs:
+        line = f"#{job.id} {job.file_name} — {STATUS_LABELS.get(job.status, job.status)}"
+        position = job_queue.position(job.id)
+        if position:
+            line += f" (место в очереди: {position})"
+        lines.append(line)
+    await message.answer("📋 Твои задачи:\n" + "\n".join(lines) + "\n\nОтменить: /cancel <номер>")
+
+
+@router.message(Command("cancel"))
+async def cmd_cancel(message: types.Message, user, job_queue):
+    args = message.text.split(" ", 1)
+    if len(args) < 2 or not args[1].strip().lstrip('#').isdigit():
+        await message.answer("⚠️ Укажи номер задачи: /cancel 12")
+        return
+
+    job_id = int(args[1].strip().lstrip('#'))
+    if await job_queue.cancel(job_id, user.id):
+        await message.answer(f"🚫 Задача #{job_id} отменена.")
+    else:
+        await message.answer(f"⚠️ Задача #{job_id} не найдена или уже завершена.")
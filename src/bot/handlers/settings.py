@@ -1,34 +1,51 @@
+import re
+
 from aiogram import Router, types
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
+from src.core.preclassifier import format_rules, parse_rules
+from src.infrastructure.database.users import update_settings
+
 router = Router()
 
+# Спецсимволы Markdown (legacy) в тексте пользователя: правила-регулярки почти всегда их содержат
+MARKDOWN_SPECIAL = re.compile(r'([_*`\[])')
+
 
 class SettingsStates(StatesGroup):
     waiting_categories = State()
     waiting_hints = State()
 
 
+def escape_markdown(text: str) -> str:
+    return MARKDOWN_SPECIAL.sub(r'\\\1', text)
+
+
 @router.message(Command("settings"))
-async def cmd_settings(message: types.Message, user):
-    cats = ", ".join(user.get_categories())
-    hints = user.custom_prompts
+async def cmd_settings(message: types.Message, user, db_session, rule_store):
+    cats = escape_markdown(", ".join(user.get_categories()))
+    hints = escape_markdown(str(user.custom_prompts))
+    rules = escape_markdown(format_rules(await rule_store.load(db_session, user.id)) or "нет")
 
     text = (
         f"⚙️ **Настройки**\n\n"
         f"📂 **Текущие категории:**\n{cats}\n\n"
         f"💡 **Твои подсказки для ИИ:**\n{hints}\n\n"
+        f"📏 **Правила (без ИИ):**\n{rules}\n\n"
+        f"📄 **Формат отчета:** {user.report_format}\n\n"
         f"Для изменения отправь:\n"
         f"/set\_cats <список через запятую>\n"
-        f"/set\_hints <текст подсказки>"
+        f"/set\_hints <текст подсказки>\n"
+        f"/set\_rules <правила, по одному на строку: Пятерочка, ВкусВилл -> Продукты>\n"
+        f"/set\_format <формат отчета>"
     )
     await message.answer(text, parse_mode="Markdown")
 
 
 @router.message(Command("set_cats"))
-async def set_categories(message: types.Message, user, db_session):
+async def set_categories(message: types.Message, user, db_session, processor, user_cache):
     args = message.text.split(" ", 1)
     if len(args) < 2:
         await message.answer("⚠️ Напиши список категорий через запятую после команды.")
@@ -37,18 +54,70 @@ async def set_categories(message: types.Message, user, db_session):
     raw_cats = args[1]
     new_cats = [c.strip() for c in raw_cats.split(',') if c.strip()]
 
-    user.set_categories(new_cats)
+    await update_settings(db_session, user, categories=new_cats)
+    await processor.settings_changed(db_session, user.id)
     await db_session.commit()
+    user_cache.invalidate(user.telegram_id)
     await message.answer("✅ Категории обновлены!")
 
 
 @router.message(Command("set_hints"))
-async def set_hints(message: types.Message, user, db_session):
+async def set_hints(message: types.Message, user, db_session, processor, user_cache):
     args = message.text.split(" ", 1)
     if len(args) < 2:
         await message.answer("⚠️ Напиши текст подсказки после команды.")
         return
 
-    user.custom_prompts = args[1]
+    await update_settings(db_session, user, custom_prompts=args[1])
+    await processor.settings_changed(db_session, user.id)
+    await db_session.commit()
+    user_cache.invalidate(user.telegram_id)
+    await message.answer("✅ Подсказки обновлены!")
+
+
+@router.message(Command("set_rules"))
+async def set_rules(message: types.Message, user, db_session, processor, rule_store):
+    args = message.text.split(maxsplit=1)
+    if len(args) < 2:
+        await message.answer(
+            "⚠️ Напиши правила после команды, по одному на строку:\n"
+            "Пятерочка, ВкусВилл -> Продукты\n"
+            "/яндекс\\s*go/ -> Транспорт"
+        )
+        return
+
+    try:
+        rules = parse_rules(args[1])
+    except ValueError as e:
+        await message.answer(f"⚠️ {e}")
+        return
+
+    categories = user.get_categories()
+    unknown = sorted({r.category for r in rules if r.category not in categories})
+    if unknown:
+        await message.answer(f"⚠️ Таких категорий нет: {', '.join(unknown)}. Проверь /settings.")
+        return
+
+    await rule_store.replace(db_session, user.id, rules)
+    await processor.rules_changed(db_session, user.id)
+    await db_session.commit()
+    await message.answer(f"✅ Правила обновлены ({len(rules)}).")
+
+
+@router.message(Command("set_format"))
+async def set_format(message: types.Message, user, db_session, processor, user_cache):
+    formats = ", ".join(sorted(processor.report_formats))
+    args = message.text.split(maxsplit=1)
+    if len(args) < 2:
+        await message.answer(f"⚠️ Укажи формат отчета: {formats}.")
+        return
+
+    report_format = args[1].strip().lower().lstrip('.')
+    if report_format not in processor.report_formats:
+        await message.answer(f"⚠️ Формат {report_format} недоступен. Можно: {formats}.")
+        return
+
+    await update_settings(db_session, user, report_format=report_format)
     await db_session.commit()
-    await message.answer("✅ Подсказки обновлены!")
\ No newline at end of file
+    user_cache.invalidate(user.telegram_id)
+    await message.answer(f"✅ Отчеты будут в формате {report_format}.")
@@ -0,0 +1,29 @@
+from datetime import datetime
+
+from aiogram import Router, types
+from aiogram.filters import Command
+
+router = Router()
+
+
+@router.message(Command("stats"))
+async def cmd_stats(message: types.Message, user, processor):
+    stats = processor.last_runs.get(user.id)
+    limiter = processor.limiter
+    p50 = limiter.p50()
+    llm_line = f"🔀 Лимит запросов к LLM: {limiter.limit}" + (f", p50 {p50 * 1000:.0f} мс" if p50 else "")
+
+    if stats is None:
+        await message.answer(f"📊 Выписок пока не было.\n{llm_line}")
+        return
+
+    started = datetime.fromtimestamp(stats.started_at).strftime('%d.%m %H:%M')
+    duration = f"{stats.duration:.1f} с" if stats.duration is not None else "еще идет"
+    lines = [
+        f"📊 Последняя выписка: {stats.file_name} ({started})",
+        f"Строк: {stats.rows}, время: {duration}",
+        llm_line,
+        "",
+        *stats.summary(),
+    ]
+    await message.answer("\n".join(lines))
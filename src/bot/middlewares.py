@@ -1,17 +1,20 @@
 from aiogram import BaseMiddleware
 from aiogram.types import Message
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from src.core.preclassifier import parse_rules
 from src.infrastructure.database.models import User
-import yaml
+from src.infrastructure.database.rules import RuleStore
+from src.infrastructure.database.users import UserCache
 
 
 class AuthMiddleware(BaseMiddleware):
-    def __init__(self, session_maker, config):
+    def __init__(self, session_maker, config, user_cache: UserCache = None):
         self.session_maker = session_maker
-        self.allowed_ids = [int(x) for x in str(config['allowed_user_ids']).split(',')]
+        self.allowed_ids = {int(x) for x in str(config['allowed_user_ids']).split(',')}
         self.default_categories = config['defaults']['categories']
         self.default_hints = config['defaults']['llm_hints']
+        self.default_rules = parse_rules("\n".join(config['defaults'].get('rules', [])))
+        # Профиль берется из кэша: на каждое сообщение запрос в БД не нужен
+        self.user_cache = user_cache or UserCache()
 
     async def __call__(self, handler, event, data):
         if isinstance(event, Message):
@@ -21,10 +24,9 @@ class AuthMiddleware(BaseMiddleware):
                 await event.answer("⛔ Нет доступа.")
                 return
 
+            # Сессия не берет соединение из пула, пока хендлер ее не использует
             async with self.session_maker() as session:
-                user = await session.scalar(
-                    select(User).where(User.telegram_id == user_id)
-                )
+                user = await self.user_cache.load(session, user_id)
 
                 if not user:
                     user = User(
@@ -36,8 +38,13 @@ class AuthMiddleware(BaseMiddleware):
                     session.add(user)
                     await session.commit()
                     await session.refresh(user)
+                    if self.default_rules:
+                        await RuleStore().replace(session, user.id, self.default_rules)
+                        await session.commit()
+                    self.user_cache.put(user)
 
                 data['db_session'] = session
                 data['user'] = user
+                data['user_cache'] = self.user_cache
                 return await handler(event, data)
-        return await handler(event, data)
\ No newline at end of file
+        return await handler(event, data)
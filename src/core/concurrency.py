@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from statistics import median
+from typing import Deque, Optional
+
+from src.core import metrics
+from src.core.exceptions import LLMProviderError
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveLimiter:
+    """
+    Адаптивный лимит одновременных запросов к LLM (AIMD).
+    Пока медиана задержки держится около базовой — лимит растет примерно на 1
+    за каждые `limit` успешных запросов. Ошибки перегрузки (429, 5xx, таймауты)
+    уменьшают лимит в backoff раз, но не чаще раза за одну задержку запроса,
+    чтобы пачка одновременных отказов не обрушила лимит до минимума.
+    Состояние живет столько же, сколько объект, — один лимитер на провайдера.
+    """
+
+    def __init__(
+            self,
+            initial: int = 4,
+            min_limit: int = 1,
+            max_limit: int = 32,
+            window: int = 20,  # Сколько последних задержек учитывать в медиане
+            latency_tolerance: float = 2.0,  # Во сколько раз медиана может превысить базовую
+            backoff: float = 0.5
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self._limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+
+        self._latencies: Deque[float] = deque(maxlen=max(1, window))
+        self._baseline: Optional[float] = None
+        self._last_backoff = 0.0
+        self._cooldown = 0.0
+        self._in_flight = 0
+        self._condition = asyncio.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def p50(self) -> Optional[float]:
+        return median(self._latencies) if self._latencies else None
+
+    @asynccontextmanager
+    async def slot(self):
+        """Занимает слот; по выходу учитывает задержку или ошибку перегрузки."""
+        waiting_since = time.perf_counter()
+        async with self._condition:
+            while self._in_flight >= self.limit:
+                await self._condition.wait()
+            self._in_flight += 1
+        metrics.observe('llm_queue_wait', time.perf_counter() - waiting_since)
+
+        started = time.monotonic()
+        try:
+            yield
+        except LLMProviderError as e:
+            if e.overload:
+                self.on_overload()
+            raise
+        else:
+            self.on_success(time.monotonic() - started)
+        finally:
+            async with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+            metrics.REGISTRY.set('llm_concurrency_limit', self.limit)
+
+    def on_success(self, latency: float):
+        self._latencies.append(latency)
+        p50 = median(self._latencies)
+        # Базовая задержка — лучшая медиана без нагрузки; медленно подтягивается вверх,
+        # чтобы случайно быстрый старт не держал лимит внизу навсегда
+        if self._baseline is None or p50 < self._baseline:
+            self._baseline = p50
+        else:
+            self._baseline += (p50 - self._baseline) * 0.01
+
+        if p50 <= self._baseline * self.latency_tolerance:
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+        elif self._decrease(0.9):
+            # Очередь на стороне провайдера растет — мягко отступаем, не дожидаясь ошибок
+            logger.info("LLM latency p50 %.2fs, concurrency limit lowered to %d", p50, self.limit)
+
+    def on_overload(self):
+        if self._decrease(self.backoff):
+            # После отступления прежние задержки уже не показательны
+            self._latencies.clear()
+            logger.warning("LLM overloaded, concurrency limit lowered to %d", self.limit)
+
+    def _decrease(self, factor: float) -> bool:
+        """Уменьшает лимит не чаще раза за одну медианную задержку запроса."""
+        now = time.monotonic()
+        if now - self._last_backoff < self._cooldown:
+            return False
+        self._last_backoff = now
+        self._cooldown = self.p50() or self._cooldown
+        self._limit = max(float(self.min_limit), self._limit * factor)
+        return True
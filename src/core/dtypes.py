@@ -1,7 +1,6 @@
-import io
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional
+from typing import BinaryIO, List, Optional
 
 @dataclass
 class Transaction:
@@ -21,4 +20,43 @@ class UserNote:
 @dataclass
 class ExportFile:
     file_ext: str
-    file_content: io.BytesIO
+    # Файловый объект, перемотанный в начало (BytesIO или временный файл)
+    file_content: BinaryIO
+
+    def close(self):
+        self.file_content.close()
+
+
+@dataclass
+class StatementProgress:
+    """Ход обработки выписки (колбэк Processor.process_statement)"""
+    done: int  # Строк с готовой категорией
+    total: int  # Прочитано строк; пока reading, файл дочитывается и число растет
+    reading: bool
+    elapsed: float  # Секунд с начала обработки
+    # Строки, ставшие готовыми с прошлого вызова и продолжающие готовое начало выписки (по порядку)
+    ready: List[Transaction]
+
+    def eta(self) -> Optional[float]:
+        """Секунд до конца по средней скорости; None, пока оценить не по чему."""
+        if self.reading or not self.done or self.elapsed <= 0:
+            return None
+        return (self.total - self.done) * self.elapsed / self.done
+
+
+@dataclass
+class FileHead:
+    """Начало файла выписки: по нему парсер решает, его ли это формат, не читая файл целиком"""
+    kind: str  # 'xlsx', 'xls', 'csv' или 'unknown'
+    # Первые строки таблицы, значения в нижнем регистре без лишних пробелов
+    rows: List[List[str]]
+    # Для csv: кодировка и разделитель, с которыми файл читается дальше
+    encoding: Optional[str] = None
+    delimiter: Optional[str] = None
+
+    def find_header(self, *keywords: str) -> Optional[int]:
+        """Номер первой строки, где каждое ключевое слово входит в какую-нибудь ячейку."""
+        for i, row in enumerate(self.rows):
+            if all(any(k in cell for cell in row) for k in keywords):
+                return i
+        return None
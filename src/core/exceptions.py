@@ -0,0 +1,33 @@
+class LLMProviderError(Exception):
+    """Ошибка обращения к LLM-провайдеру (сеть, HTTP-статус, формат ответа API)."""
+    # True — провайдер перегружен или не успевает: стоит снизить конкурентность и повторить
+    overload = False
+
+
+class LLMConnectionError(LLMProviderError):
+    """Не удалось установить соединение или получить ответ."""
+    overload = True
+
+
+class LLMTimeoutError(LLMProviderError):
+    """Провайдер не ответил за отведенное время."""
+    overload = True
+
+
+class LLMRateLimitError(LLMProviderError):
+    """HTTP 429: превышен лимит запросов."""
+    overload = True
+
+
+class LLMServerError(LLMProviderError):
+    """HTTP 5xx на стороне провайдера."""
+    overload = True
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
+class LLMResponseError(LLMProviderError):
+    """Ответ API пришел, но в неожиданном формате (или HTTP 4xx, кроме 429)."""
+    pass
@@ -1,7 +1,6 @@
 from abc import ABC, abstractmethod
-from typing import List
-import io
-from src.core.dtypes import Transaction, UserNote, ExportFile
+from typing import Iterator, List, Optional, Tuple
+from src.core.dtypes import Transaction, UserNote, ExportFile, FileHead, StatementProgress
 
 
 class BaseBankParser(ABC):
@@ -14,8 +13,32 @@ class BaseBankParser(ABC):
     def parse(self, file_path: str) -> List[Transaction]:
         pass
 
+    def sniff(self, head: FileHead) -> bool:
+        """Быстрая проверка формата по началу файла (для реестра парсеров). По умолчанию — не узнает файл."""
+        return False
+
+
+class BaseStreamingBankParser(BaseBankParser):
+    """Парсер, отдающий транзакции по мере чтения файла (без загрузки всей выписки в память)"""
+    @abstractmethod
+    def iter_parse(self, file_path: str, head: Optional[FileHead] = None) -> Iterator[Transaction]:
+        """head — уже прочитанное начало файла (его передает реестр парсеров, чтобы не читать файл заново)."""
+        pass
+
+    def parse(self, file_path: str) -> List[Transaction]:
+        return list(self.iter_parse(file_path))
+
+
 class BaseLLMProvider(ABC):
     """Интерфейс для AI-провайдеров"""
+    async def start(self):
+        """Открывает долгоживущие ресурсы (HTTP-сессию). Вызывается при старте бота."""
+        pass
+
+    async def close(self):
+        """Освобождает ресурсы. Вызывается при остановке бота."""
+        pass
+
     @abstractmethod
     async def categorize_transaction(
             self,
@@ -27,9 +50,77 @@ class BaseLLMProvider(ABC):
         """Должен возвращать dict {'category': str, 'comment': str}"""
         pass
 
+    async def categorize_batch(
+            self,
+            items: List[Tuple[Transaction, List[UserNote]]],
+            categories: List[str],
+            user_hints: str
+    ) -> List[dict]:
+        """
+        Категоризация пачки транзакций. Возвращает список dict той же длины и в том же порядке.
+        По умолчанию обрабатывает транзакции по одной; провайдеры, умеющие
+        отвечать одним JSON на всю пачку, переопределяют этот метод.
+        """
+        return [
+            await self.categorize_transaction(tx, notes, categories, user_hints)
+            for tx, notes in items
+        ]
+
 class BaseReportGenerator(ABC):
     """Интерфейс для генерации выходных отчетов"""
     @abstractmethod
     def generate(self, transactions: List[Transaction]) -> ExportFile:
         """Возвращает байтовый поток файла"""
-        pass
\ No newline at end of file
+        pass
+
+
+class BaseReportWriter(ABC):
+    """Отчет, который пишется по мере готовности строк"""
+    @abstractmethod
+    def write(self, transactions: List[Transaction]):
+        """Дописывает строки в конец отчета"""
+        pass
+
+    @abstractmethod
+    def finish(self) -> ExportFile:
+        """Завершает файл и возвращает его, перемотанным в начало"""
+        pass
+
+    @abstractmethod
+    def close(self):
+        """Бросает незавершенный отчет и освобождает временный файл"""
+        pass
+
+
+class BaseStreamingReportGenerator(BaseReportGenerator):
+    """Генератор, пишущий отчет построчно во временный файл (без копии всего отчета в памяти)"""
+    @abstractmethod
+    def open(self) -> BaseReportWriter:
+        pass
+
+    def generate(self, transactions: List[Transaction]) -> ExportFile:
+        writer = self.open()
+        try:
+            writer.write(transactions)
+            return writer.finish()
+        except BaseException:
+            writer.close()
+            raise
+
+
+class BaseProgressReporter(ABC):
+    """Показывает пользователю ход обработки одной выписки"""
+    @abstractmethod
+    def update(self, progress: StatementProgress):
+        """Вызывается из event loop на каждую порцию готовых строк; не должен блокировать"""
+        pass
+
+    @abstractmethod
+    async def finish(self, status: str, error: Optional[str] = None):
+        """Обработка закончилась (статус задачи); дожидается фоновых отправок"""
+        pass
+
+    @abstractmethod
+    def abort(self):
+        """Задачу отменили: фоновые отправки прерываются"""
+        pass
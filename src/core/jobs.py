@@ -0,0 +1,376 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src.core import metrics
+from src.core.dtypes import ExportFile
+from src.core.interfaces import BaseProgressReporter, BaseReportGenerator
+from src.core.processor import Processor
+from src.infrastructure.database.models import Job, JobStatus, User
+
+logger = logging.getLogger(__name__)
+
+# (задача, отчет или None, текст ошибки или None)
+JobCallback = Callable[[Job, Optional[ExportFile], Optional[str]], Awaitable[None]]
+# (задача, генератор отчета пользователя) -> показ хода обработки; вызывается при старте задачи
+ProgressFactory = Callable[[Job, BaseReportGenerator], Awaitable[BaseProgressReporter]]
+
+
+async def requeue_interrupted(session_maker: async_sessionmaker) -> int:
+    """
+    'running' после рестарта означает, что обработка оборвалась — задачи снова в очередь.
+    При нескольких процессах вызывается один раз до их запуска, а не каждым процессом.
+    """
+    async with session_maker() as db:
+        result = await db.execute(
+            update(Job).where(Job.status == JobStatus.RUNNING).values(status=JobStatus.QUEUED, started_at=None)
+        )
+        await db.commit()
+    return result.rowcount
+
+
+class JobQueue:
+    """
+    Очередь обработки выписок.
+    Задачи сохраняются в таблицу jobs, ограниченный пул воркеров берет их
+    по кругу между пользователями (не больше per_user_limit одновременно на пользователя),
+    результат уходит в колбэк deliver, ход обработки — в progress. После
+    перезапуска незавершенные задачи поднимаются из БД заново.
+
+    Несколько процессов (webhook с несколькими воркерами) могут делить одну
+    таблицу jobs: задача захватывается одним UPDATE (status и лимит пользователя
+    проверяются в нем же), а с poll_interval процесс периодически забирает
+    задачи, поставленные другими.
+    """
+
+    def __init__(
+            self,
+            session_maker: async_sessionmaker,
+            processor: Processor,
+            deliver: JobCallback,
+            workers: int = 2,
+            per_user_limit: int = 1,
+            progress: Optional[ProgressFactory] = None,
+            recover: bool = True,  # Вернуть в очередь оборванные задачи при старте (только один процесс)
+            poll_interval: Optional[float] = None,  # Как часто искать в БД чужие задачи; None — не искать
+            retry_delay: float = 1.0,  # Через сколько повторить захват, если лимит пользователя занят
+            max_retry_delay: float = 30.0  # Предел паузы между захватами, которым мешает ошибка БД
+    ):
+        self.session_maker = session_maker
+        self.processor = processor
+        self.deliver = deliver
+        self.progress = progress
+        self.recover = recover
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.workers = max(1, workers)
+        self.per_user_limit = max(1, per_user_limit)
+
+        # user_id -> очередь id задач; порядок пользователей — круговой
+        self._pending: Dict[int, Deque[int]] = {}
+        self._rotation: Deque[int] = deque()
+        self._running_per_user: Dict[int, int] = {}
+        self._running: Dict[int, asyncio.Task] = {}
+        self._condition = asyncio.Condition()
+        self._worker_tasks: List[asyncio.Task] = []
+        # Задачи, отложенные до повторного захвата
+        self._delayed: Set[int] = set()
+        self._retry_tasks: Set[asyncio.Task] = set()
+        # job_id -> сколько раз подряд захват упал с ошибкой БД
+        self._claim_errors: Dict[int, int] = {}
+
+    async def start(self):
+        """Поднимает незавершенные задачи из БД и запускает воркеров."""
+        if self.recover:
+            await requeue_interrupted(self.session_maker)
+        restored = await self._load_queued()
+        if restored:
+            logger.info("Restored %d queued jobs", restored)
+
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self.poll_interval:
+            self._worker_tasks.append(asyncio.create_task(self._poll()))
+
+    def _known(self) -> Set[int]:
+        return {job_id for queue in self._pending.values() for job_id in queue} | set(self._running) | self._delayed
+
+    async def _load_queued(self) -> int:
+        """Ставит в локальную очередь задачи из БД, которых в ней еще нет."""
+        async with self.session_maker() as db:
+            rows = (await db.execute(
+                select(Job.id, Job.user_id).where(Job.status == JobStatus.QUEUED).order_by(Job.id)
+            )).all()
+
+        async with self._condition:
+            known = self._known()
+            fresh = [(job_id, user_id) for job_id, user_id in rows if job_id not in known]
+            for job_id, user_id in fresh:
+                self._push(user_id, job_id)
+            if fresh:
+                self._condition.notify_all()
+        return len(fresh)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self._load_queued()
+            except Exception:
+                logger.exception("Failed to poll queued jobs")
+
+    def _schedule_retry(self, user_id: int, job_id: int, delay: float):
+        task = asyncio.ensure_future(self._retry_later(user_id, job_id, delay))
+        self._retry_tasks.add(task)
+        task.add_done_callback(self._retry_tasks.discard)
+
+    async def _retry_later(self, user_id: int, job_id: int, delay: float):
+        self._delayed.add(job_id)
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self._delayed.discard(job_id)
+        async with self._condition:
+            self._push(user_id, job_id)
+            self._condition.notify()
+
+    async def stop(self):
+        """Останавливает воркеров. Прерванные задачи остаются в БД и продолжатся после старта."""
+        for task in [*self._worker_tasks, *self._retry_tasks, *self._running.values()]:
+            task.cancel()
+        await asyncio.gather(
+            *self._worker_tasks, *self._retry_tasks, *self._running.values(), return_exceptions=True
+        )
+        self._worker_tasks = []
+
+    async def enqueue(self, user_id: int, chat_id: int, file_path: str, file_name: str) -> Job:
+        async with self.session_maker() as db:
+            job = Job(
+                user_id=user_id,
+                chat_id=chat_id,
+                file_path=file_path,
+                file_name=file_name,
+                status=JobStatus.QUEUED
+            )
+            db.add(job)
+            await db.commit()
+            await db.refresh(job)
+
+        async with self._condition:
+            self._push(user_id, job.id)
+            self._condition.notify()
+        return job
+
+    async def list_jobs(self, user_id: int, limit: int = 10) -> List[Job]:
+        async with self.session_maker() as db:
+            result = await db.execute(
+                select(Job).where(Job.user_id == user_id).order_by(Job.id.desc()).limit(limit)
+            )
+            return list(result.scalars().all())
+
+    def position(self, job_id: int) -> Optional[int]:
+        """Номер задачи в очереди своего пользователя (1 — следующая), None если не в очереди."""
+        for queue in self._pending.values():
+            if job_id in queue:
+                return list(queue).index(job_id) + 1
+        return None
+
+    async def cancel(self, job_id: int, user_id: int) -> bool:
+        """Отменяет задачу пользователя: из очереди — сразу, выполняющуюся — через отмену task."""
+        async with self.session_maker() as db:
+            job = await db.get(Job, job_id)
+            if job is None or job.user_id != user_id or job.status not in JobStatus.ACTIVE:
+                return False
+            job.status = JobStatus.CANCELLED
+            job.finished_at = datetime.utcnow()
+            await db.commit()
+
+        async with self._condition:
+            queue = self._pending.get(user_id)
+            if queue and job_id in queue:
+                queue.remove(job_id)
+
+        task = self._running.get(job_id)
+        if task:
+            task.cancel()
+        self._remove_file(job.file_path)
+        return True
+
+    def _push(self, user_id: int, job_id: int):
+        queue = self._pending.setdefault(user_id, deque())
+        queue.append(job_id)
+        if user_id not in self._rotation:
+            self._rotation.append(user_id)
+
+    def _pop_fair(self) -> Optional[Tuple[int, int]]:
+        """Следующая (user_id, job_id) по кругу среди пользователей, не превысивших лимит."""
+        for _ in range(len(self._rotation)):
+            user_id = self._rotation.popleft()
+            queue = self._pending.get(user_id)
+            if not queue:
+                self._pending.pop(user_id, None)
+                continue
+            if self._running_per_user.get(user_id, 0) >= self.per_user_limit:
+                self._rotation.append(user_id)
+                continue
+
+            job_id = queue.popleft()
+            if queue:
+                self._rotation.append(user_id)
+            else:
+                self._pending.pop(user_id, None)
+            self._running_per_user[user_id] = self._running_per_user.get(user_id, 0) + 1
+            return user_id, job_id
+        return None
+
+    async def _worker(self):
+        while True:
+            async with self._condition:
+                picked = self._pop_fair()
+                while picked is None:
+                    await self._condition.wait()
+                    picked = self._pop_fair()
+            user_id, job_id = picked
+
+            task = asyncio.create_task(self._run_job(job_id, user_id))
+            self._running[job_id] = task
+            try:
+                # asyncio.wait не пробрасывает отмену самой задачи (команда /cancel)
+                await asyncio.wait([task])
+                if not task.cancelled() and task.exception() is not None:
+                    logger.error("Job %s crashed", job_id, exc_info=task.exception())
+            finally:
+                self._running.pop(job_id, None)
+                async with self._condition:
+                    self._running_per_user[user_id] -= 1
+                    self._condition.notify_all()
+
+    async def _claim(self, job_id: int, user_id: int) -> Optional[bool]:
+        """
+        Атомарно переводит задачу в running. True — задача наша; False — у пользователя
+        уже идет per_user_limit задач (возможно, в других процессах); None — задачу
+        забрал другой процесс или ее отменили.
+        """
+        async with self.session_maker() as db:
+            if db.get_bind().dialect.name == 'postgresql':
+                # Захваты задач одного пользователя — по очереди, иначе оба процесса увидят лимит свободным
+                await db.execute(select(func.pg_advisory_xact_lock(user_id)))
+            running = select(func.count(Job.id)).where(
+                Job.user_id == user_id, Job.status == JobStatus.RUNNING
+            ).scalar_subquery()
+            result = await db.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == JobStatus.QUEUED, running < self.per_user_limit)
+                .values(status=JobStatus.RUNNING, started_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount:
+                await db.commit()
+                return True
+            status = await db.scalar(select(Job.status).where(Job.id == job_id))
+            await db.commit()
+        return False if status == JobStatus.QUEUED else None
+
+    async def _run_job(self, job_id: int, user_id: int):
+        try:
+            claimed = await self._claim(job_id, user_id)
+        except SQLAlchemyError:
+            # Задача осталась queued: повторяем захват с растущей паузой, пока БД не ответит
+            errors = self._claim_errors[job_id] = self._claim_errors.get(job_id, 0) + 1
+            delay = min(self.retry_delay * 2 ** (errors - 1), self.max_retry_delay)
+            logger.exception("Failed to claim job %s, retrying in %.1f s", job_id, delay)
+            metrics.inc('job_claims', result='error')
+            self._schedule_retry(user_id, job_id, delay)
+            return
+        self._claim_errors.pop(job_id, None)
+        if claimed is False:
+            metrics.inc('job_claims', result='busy')
+            self._schedule_retry(user_id, job_id, self.retry_delay)
+            return
+        if claimed is None:
+            metrics.inc('job_claims', result='lost')
+            return
+
+        async with self.session_maker() as db:
+            job = await db.get(Job, job_id)
+            if job.created_at:
+                metrics.observe('job_queue_wait', (job.started_at - job.created_at).total_seconds())
+
+            reporter = None
+            try:
+                user = await db.get(User, job.user_id)
+                # Транзакция чтения не держится, пока идут сообщения в Telegram и обработка выписки
+                await db.commit()
+                reporter = await self._start_progress(job, user)
+                report = await self.processor.process_statement(
+                    user, job.file_path, db, on_progress=reporter.update if reporter else None
+                )
+            except asyncio.CancelledError:
+                # Отмена через /cancel (статус уже записан) или остановка бота (задача продолжится после рестарта)
+                if reporter is not None:
+                    reporter.abort()
+                raise
+            except Exception as e:
+                logger.exception("Job %s failed", job_id)
+                metrics.inc('jobs', status=JobStatus.FAILED)
+                await self._finish_progress(reporter, JobStatus.FAILED, str(e))
+                await self._finish(job, JobStatus.FAILED, None, str(e))
+            else:
+                metrics.inc('jobs', status=JobStatus.DONE)
+                await self._finish_progress(reporter, JobStatus.DONE, None)
+                await self._finish(job, JobStatus.DONE, report, None)
+
+    async def _start_progress(self, job: Job, user: User) -> Optional[BaseProgressReporter]:
+        """Показ хода обработки; если сообщение отправить не удалось, выписка обрабатывается без него."""
+        if self.progress is None:
+            return None
+        try:
+            return await self.progress(job, self.processor.report_generator(user))
+        except Exception:
+            logger.exception("Failed to start progress for job %s", job.id)
+            return None
+
+    @staticmethod
+    async def _finish_progress(reporter: Optional[BaseProgressReporter], status: str, error: Optional[str]):
+        if reporter is None:
+            return
+        try:
+            await reporter.finish(status, error)
+        except Exception:
+            logger.exception("Failed to finish progress message")
+
+    async def _finish(self, job: Job, status: str, report: Optional[ExportFile], error: Optional[str]):
+        try:
+            # Отдельная сессия: сессия обработки могла остаться в сломанной транзакции
+            async with self.session_maker() as db:
+                result = await db.execute(
+                    update(Job).where(Job.id == job.id, Job.status == JobStatus.RUNNING).values(
+                        status=status, error=error, finished_at=datetime.utcnow()
+                    )
+                )
+                await db.commit()
+            self._remove_file(job.file_path)
+
+            if result.rowcount == 0:
+                # Задачу успели отменить
+                return
+            try:
+                await self.deliver(job, report, error)
+            except Exception:
+                logger.exception("Failed to deliver job %s result", job.id)
+        finally:
+            # Отчет (временный файл) закрывается, даже если его не отправили; повторный close безопасен
+            if report is not None:
+                report.close()
+
+    @staticmethod
+    def _remove_file(file_path: str):
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
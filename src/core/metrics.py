@@ -0,0 +1,173 @@
+import bisect
+import contextvars
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from statistics import median
+from typing import Dict, List, Optional, Tuple
+
+# Границы корзин гистограммы длительностей, секунды
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        idx = bisect.bisect_left(self.buckets, value)
+        if idx < len(self.counts):
+            self.counts[idx] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Счетчики, значения и гистограммы длительностей процесса.
+    Пишется из event loop и из потоков парсера, поэтому под замком.
+    Отдается в текстовом формате Prometheus.
+    """
+
+    def __init__(self, prefix: str = "fingram", buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = defaultdict(dict)
+        self._gauges: Dict[str, Dict[LabelKey, float]] = defaultdict(dict)
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = defaultdict(dict)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[name][_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms[name]
+            if key not in series:
+                series[key] = _Histogram(self.buckets)
+            series[key].observe(value)
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                full = f"{self.prefix}_{name}_total"
+                lines.append(f"# TYPE {full} counter")
+                lines.extend(f"{full}{_format_labels(key)} {value:g}" for key, value in sorted(series.items()))
+            for name, series in sorted(self._gauges.items()):
+                full = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {full} gauge")
+                lines.extend(f"{full}{_format_labels(key)} {value:g}" for key, value in sorted(series.items()))
+            for name, series in sorted(self._histograms.items()):
+                full = f"{self.prefix}_{name}_seconds"
+                lines.append(f"# TYPE {full} histogram")
+                for key, hist in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f"{full}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {cumulative}")
+                    lines.append(f"{full}_bucket{_format_labels(key, ('le', '+Inf'))} {hist.count}")
+                    lines.append(f"{full}_sum{_format_labels(key)} {hist.sum:g}")
+                    lines.append(f"{full}_count{_format_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+class RunStats:
+    """Сводка по одной выписке: длительности этапов и счетчики (для /stats)."""
+
+    def __init__(self, file_name: str = ""):
+        self.file_name = file_name
+        self.started_at = time.time()
+        self.duration: Optional[float] = None
+        self.rows = 0
+        self._lock = threading.Lock()
+        self.spans: Dict[str, List[float]] = defaultdict(list)
+        self.counters: Counter = Counter()
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            self.spans[name].append(value)
+
+    def inc(self, name: str, amount: float = 1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def summary(self) -> List[str]:
+        """Строки 'этап: всего, вызовов, медиана' и счетчики — для текста бота."""
+        lines = []
+        for name, values in sorted(self.spans.items()):
+            lines.append(
+                f"{name}: {sum(values):.2f} с всего, {len(values)} раз, p50 {median(values) * 1000:.0f} мс"
+            )
+        lines.extend(f"{name}: {value:g}" for name, value in sorted(self.counters.items()))
+        return lines
+
+
+REGISTRY = MetricsRegistry()
+
+# Выписка, обрабатываемая в текущей задаче (наследуется дочерними задачами asyncio)
+_current_run: contextvars.ContextVar[Optional[RunStats]] = contextvars.ContextVar('current_run', default=None)
+
+
+def bind_run(stats: Optional[RunStats]) -> contextvars.Token:
+    return _current_run.set(stats)
+
+
+def unbind_run(token: contextvars.Token):
+    _current_run.reset(token)
+
+
+def observe(name: str, value: float, **labels):
+    """Длительность этапа: в гистограмму процесса и в сводку текущей выписки."""
+    REGISTRY.observe(name, value, **labels)
+    run = _current_run.get()
+    if run is not None:
+        run.observe(name, value)
+
+
+def inc(name: str, amount: float = 1, **labels):
+    REGISTRY.inc(name, amount, **labels)
+    run = _current_run.get()
+    if run is not None:
+        suffix = "".join(f":{v}" for _, v in _label_key(labels))
+        run.inc(name + suffix, amount)
+
+
+@contextmanager
+def span(name: str, **labels):
+    """Замер длительности блока: `with span('parse'): ...`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
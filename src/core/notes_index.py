@@ -0,0 +1,22 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import List
+
+from src.core.dtypes import UserNote
+
+
+class NoteIndex:
+    """Заметки пользователя, отсортированные по времени. Поиск окна за O(log n) через bisect."""
+
+    def __init__(self, notes: List[UserNote]):
+        self._notes = sorted(notes, key=lambda n: n.timestamp)
+        self._timestamps = [n.timestamp for n in self._notes]
+
+    def __len__(self) -> int:
+        return len(self._notes)
+
+    def between(self, start: datetime, end: datetime) -> List[UserNote]:
+        """Заметки с timestamp в отрезке [start, end] включительно."""
+        lo = bisect_left(self._timestamps, start)
+        hi = bisect_right(self._timestamps, end)
+        return self._notes[lo:hi]
@@ -0,0 +1,213 @@
+import logging
+import math
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from src.infrastructure.database.cache import normalize_description
+
+logger = logging.getLogger(__name__)
+
+# Разделитель "шаблон -> категория" в тексте правил
+_ARROW = re.compile(r'\s*(?:->|→)\s*')
+# Флаги на все выражение: (?i), (?ms) — но не (?i:...) на его часть
+_GLOBAL_FLAGS = re.compile(r'\(\?[aiLmsux]+\)')
+# \1, (?P=name) — без учета экранированной обратной косой черты (\\1)
+_BACKREFERENCE = re.compile(r'(?<!\\)(?:\\\\)*(?:\\[1-9]|\(\?P=)')
+
+
+@dataclass
+class Rule:
+    pattern: str
+    category: str
+    is_regex: bool = False
+
+
+def validate_regex(regex: str):
+    """Бросает ValueError, если регулярку нельзя использовать в правиле."""
+    if _GLOBAL_FLAGS.search(regex):
+        raise ValueError("флаги вида (?i) не нужны: регистр и так не учитывается")
+    if _BACKREFERENCE.search(regex):
+        raise ValueError("обратные ссылки (\\1, (?P=имя)) не поддерживаются")
+    try:
+        re.compile(regex)
+    except re.error as e:
+        raise ValueError(f"неверное регулярное выражение ({e})") from e
+
+
+def parse_rules(text: str) -> List[Rule]:
+    """
+    Разбирает правила из текста, по одному на строку:
+        ВкусВилл, Пятерочка -> Продукты
+        /яндекс\\s*(go|такси)/ -> Транспорт
+    Слова через запятую — подстроки описания без учета регистра, /.../ — регулярное выражение.
+    Бросает ValueError с номером строки, если строка не разбирается.
+    """
+    rules = []
+    for line_no, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        parts = _ARROW.split(line, maxsplit=1)
+        if len(parts) != 2 or not parts[0] or not parts[1]:
+            raise ValueError(f"Строка {line_no}: нужен формат 'шаблон -> категория'")
+        pattern, category = parts[0].strip(), parts[1].strip()
+
+        if len(pattern) > 2 and pattern.startswith('/') and pattern.endswith('/'):
+            regex = pattern[1:-1]
+            try:
+                validate_regex(regex)
+            except ValueError as e:
+                raise ValueError(f"Строка {line_no}: {e}") from e
+            rules.append(Rule(pattern=regex, category=category, is_regex=True))
+        else:
+            rules.extend(
+                Rule(pattern=word.strip(), category=category)
+                for word in pattern.split(',') if word.strip()
+            )
+    return rules
+
+
+def format_rules(rules: List[Rule]) -> str:
+    """Обратное к parse_rules: соседние слова с одной категорией склеиваются в строку."""
+    lines: List[Tuple[str, List[str]]] = []
+    for rule in rules:
+        if rule.is_regex:
+            lines.append((rule.category, [f"/{rule.pattern}/"]))
+        elif lines and lines[-1][0] == rule.category and not lines[-1][1][0].startswith('/'):
+            lines[-1][1].append(rule.pattern)
+        else:
+            lines.append((rule.category, [rule.pattern]))
+    return "\n".join(f"{', '.join(patterns)} -> {category}" for category, patterns in lines)
+
+
+def _fold(text: str) -> str:
+    return text.lower().replace('ё', 'е')
+
+
+class RuleSet:
+    """
+    Правила пользователя, каждое скомпилировано отдельно и проверяется по порядку:
+    побеждает правило, указанное раньше, даже если его совпадение пересекается
+    с совпадением более позднего. Регулярка, которая не компилируется (сохранена
+    до проверки в parse_rules), пропускается, а не ломает обработку выписки.
+    """
+
+    def __init__(self, rules: List[Rule]):
+        self.rules = []
+        self._compiled: List[Tuple[Rule, re.Pattern]] = []
+        for rule in rules:
+            try:
+                regex = re.compile(rule.pattern if rule.is_regex else re.escape(_fold(rule.pattern)), re.IGNORECASE)
+            except re.error as e:
+                logger.warning("Skipping invalid rule /%s/: %s", rule.pattern, e)
+                continue
+            self.rules.append(rule)
+            self._compiled.append((rule, regex))
+
+    def __len__(self):
+        return len(self.rules)
+
+    def match(self, description: str) -> Optional[Rule]:
+        text = _fold(description)
+        return next((rule for rule, regex in self._compiled if regex.search(text)), None)
+
+
+class SimilarityIndex:
+    """
+    Ближайший сосед по символьным n-граммам (TF-IDF, косинусная близость)
+    среди уже категоризированных описаний. Ответ считается уверенным, если
+    лучший сосед достаточно близок и заметно ближе соседа из другой категории.
+    """
+
+    def __init__(self, examples: List[Tuple[str, str]], n: int = 3, threshold: float = 0.8, margin: float = 0.1):
+        self.n = n
+        self.threshold = threshold
+        self.margin = margin
+
+        # Одно нормализованное описание — одна категория (большинством голосов)
+        votes: Dict[str, Counter] = defaultdict(Counter)
+        for description, category in examples:
+            key = normalize_description(description)
+            if key:
+                votes[key][category] += 1
+        self._docs = [(key, counter.most_common(1)[0][0]) for key, counter in votes.items()]
+
+        grams_per_doc = [self._grams(key) for key, _ in self._docs]
+        df = Counter(g for grams in grams_per_doc for g in grams)
+        total = len(self._docs)
+        self._idf = {g: math.log((1 + total) / (1 + count)) + 1 for g, count in df.items()}
+
+        # Инвертированный индекс: n-грамма -> [(документ, вес)]
+        self._postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        for doc_id, grams in enumerate(grams_per_doc):
+            for g, weight in self._vector(grams).items():
+                self._postings[g].append((doc_id, weight))
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _grams(self, key: str) -> Counter:
+        padded = f" {key} "
+        return Counter(padded[i:i + self.n] for i in range(max(1, len(padded) - self.n + 1)))
+
+    def _vector(self, grams: Counter) -> Dict[str, float]:
+        vector = {g: tf * self._idf.get(g, 0.0) for g, tf in grams.items()}
+        norm = math.sqrt(sum(w * w for w in vector.values()))
+        return {g: w / norm for g, w in vector.items() if w} if norm else {}
+
+    def predict(self, description: str) -> Optional[Tuple[str, float, str]]:
+        """(категория, близость, описание соседа) или None, если уверенности нет."""
+        key = normalize_description(description)
+        if not key or not self._docs:
+            return None
+
+        scores: Dict[int, float] = defaultdict(float)
+        for g, weight in self._vector(self._grams(key)).items():
+            for doc_id, doc_weight in self._postings.get(g, ()):
+                scores[doc_id] += weight * doc_weight
+        if not scores:
+            return None
+
+        best_per_category: Dict[str, Tuple[float, int]] = {}
+        for doc_id, score in scores.items():
+            category = self._docs[doc_id][1]
+            if category not in best_per_category or score > best_per_category[category][0]:
+                best_per_category[category] = (score, doc_id)
+
+        ranked = sorted(best_per_category.items(), key=lambda item: item[1][0], reverse=True)
+        category, (score, doc_id) = ranked[0]
+        runner_up = ranked[1][1][0] if len(ranked) > 1 else 0.0
+        if score < self.threshold or score - runner_up < self.margin:
+            return None
+        return category, score, self._docs[doc_id][0]
+
+
+class PreClassifier:
+    """
+    Локальные уровни перед LLM: правила пользователя, затем похожие
+    уже категоризированные описания. Готовится на одну выписку.
+    """
+
+    RULES = 'rules'
+    SIMILARITY = 'similarity'
+
+    def __init__(self, rules: RuleSet, similarity: Optional[SimilarityIndex] = None):
+        self.rules = rules
+        self.similarity = similarity
+
+    def classify_by_rules(self, description: str) -> Optional[dict]:
+        rule = self.rules.match(description)
+        if rule is None:
+            return None
+        return {"category": rule.category, "comment": f"Правило: {rule.pattern}"}
+
+    def classify_by_similarity(self, description: str) -> Optional[dict]:
+        if self.similarity is None:
+            return None
+        predicted = self.similarity.predict(description)
+        if predicted is None:
+            return None
+        category, _, neighbour = predicted
+        return {"category": category, "comment": f"Похоже на «{neighbour}»"}
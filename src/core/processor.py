@@ -1,12 +1,122 @@
 import asyncio
-from datetime import timedelta
-from typing import List
-from sqlalchemy.ext.asyncio import AsyncSession
+import contextvars
+import functools
+import logging
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy import select
 
-from src.core.interfaces import BaseBankParser, BaseLLMProvider, BaseReportGenerator
-from src.core.dtypes import Transaction, UserNote, ExportFile
-from src.infrastructure.database.models import User, Note
+from src.core import metrics
+from src.core.concurrency import AdaptiveLimiter
+from src.core.exceptions import LLMProviderError
+from src.core.interfaces import (
+    BaseBankParser, BaseLLMProvider, BaseReportGenerator, BaseReportWriter, BaseStreamingBankParser,
+    BaseStreamingReportGenerator
+)
+from src.core.dtypes import Transaction, UserNote, ExportFile, StatementProgress
+from src.core.notes_index import NoteIndex
+from src.core.preclassifier import PreClassifier, RuleSet, SimilarityIndex
+from src.infrastructure.database.cache import CategorizationCache, normalize_description
+from src.infrastructure.database.models import User, Note, TransactionRecord
+from src.infrastructure.database.notes import NoteBuffer
+from src.infrastructure.database.rules import RuleStore
+from src.infrastructure.database.transactions import TransactionStore, fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Ответ, который подставляется, если провайдер так и не ответил
+LLM_FAILURE_RESULT = {"category": "Разное", "comment": "Ошибка соединения"}
+
+# Уровни категоризации в порядке применения (для статистики по выписке)
+TIERS = ('stored', PreClassifier.RULES, 'cache', PreClassifier.SIMILARITY, 'llm')
+
+# (описание, (сумма, дата) при заметках, заметки, категории, подсказки) — все, от чего зависит ответ LLM на строку
+FlightKey = Tuple[str, tuple, tuple, tuple, str]
+
+ProgressCallback = Callable[[StatementProgress], None]
+
+
+class _ReportSink:
+    """
+    Пишет строки в отчет в порядке выписки, как только готов очередной их префикс:
+    строка, ждущая ответа LLM, задерживает только строки после себя.
+    Запись (сериализация XLSX/Parquet) идет через to_thread, по очереди — writer
+    не потокобезопасен. Без writer только отслеживает готовый префикс (для промежуточных отчетов).
+    """
+
+    def __init__(self, writer: Optional[BaseReportWriter], to_thread: Callable[..., Awaitable]):
+        self.writer = writer
+        self.to_thread = to_thread
+        self._rows: Deque[Transaction] = deque()
+        self._done: Set[int] = set()
+        # Последняя запущенная запись; каждая следующая ждет предыдущую
+        self._writing: Optional[asyncio.Future] = None
+
+    def add(self, transactions: List[Transaction]):
+        self._rows.extend(transactions)
+
+    def done(self, transactions: List[Transaction]) -> List[Transaction]:
+        """Отмечает строки готовыми; возвращает строки, продолжившие готовый префикс."""
+        self._done.update(id(tx) for tx in transactions)
+        ready = []
+        while self._rows and id(self._rows[0]) in self._done:
+            tx = self._rows.popleft()
+            self._done.discard(id(tx))
+            ready.append(tx)
+        if ready and self.writer is not None:
+            self._writing = asyncio.ensure_future(self._write_after(self._writing, ready))
+        return ready
+
+    async def _write_after(self, previous: Optional[asyncio.Future], rows: List[Transaction]):
+        if previous is not None:
+            await previous
+        await self.to_thread(self.writer.write, rows)
+
+    async def flush(self):
+        """Ждет, пока все готовые строки дописаны в отчет."""
+        if self._writing is not None:
+            await self._writing
+
+
+@dataclass
+class _StatementRun:
+    """Состояние обработки одной выписки."""
+    user: User
+    db: AsyncSession
+    categories: List[str]
+    hints: str
+    transactions: List[Transaction] = field(default_factory=list)
+    tasks: List[asyncio.Task] = field(default_factory=list)
+    # id(tx) -> ключ кэша для транзакций, ушедших в LLM без заметок
+    cache_keys: Dict[int, str] = field(default_factory=dict)
+    llm_transactions: List[Transaction] = field(default_factory=list)
+    # Инкрементальная обработка: отпечатки строк и уже сохраненные записи
+    occurrences: Dict[tuple, int] = field(default_factory=dict)
+    fingerprints: Dict[int, str] = field(default_factory=dict)
+    stored: Dict[str, TransactionRecord] = field(default_factory=dict)
+    fresh_transactions: List[Transaction] = field(default_factory=list)
+    preclassifier: Optional[PreClassifier] = None
+    # Уровень -> сколько строк он категоризировал
+    tier_hits: Counter = field(default_factory=Counter)
+    # None — генератор отчета не потоковый, отчет строится целиком в конце
+    sink: Optional[_ReportSink] = None
+    # id(tx) -> ключ запроса, который эта строка ведет (см. Processor._coalesce)
+    flights: Dict[int, FlightKey] = field(default_factory=dict)
+    # Строки, дождавшиеся чужого запроса вместо своего
+    coalesced: int = 0
+    # Ход обработки для пользователя
+    on_progress: Optional[ProgressCallback] = None
+    started: float = field(default_factory=time.perf_counter)
+    done: int = 0
+    reading: bool = True
 
 
 class Processor:
@@ -16,29 +126,55 @@ class Processor:
             llm: BaseLLMProvider,
             report_gen: BaseReportGenerator,
             window_days: int = 2,
-            max_concurrency: int = 4  # Ограничение для локальной LLM
+            max_concurrency: int = 4,  # Стартовый лимит одновременных запросов к LLM
+            batch_size: int = 1,  # Сколько транзакций отправлять в LLM одним запросом
+            cache: Optional[CategorizationCache] = None,
+            stream_chunk_size: int = 500,  # Размер порции для потоковых парсеров
+            store: Optional[TransactionStore] = None,
+            max_concurrency_limit: Optional[int] = None,  # Потолок адаптивного лимита
+            llm_retries: int = 2,  # Повторы при перегрузке провайдера (429, 5xx, таймауты)
+            rules: Optional[RuleStore] = None,
+            similarity_threshold: Optional[float] = None,  # None — без уровня похожих описаний
+            similarity_examples: int = 5000,
+            report_formats: Optional[Dict[str, BaseReportGenerator]] = None,  # Формат пользователя -> генератор
+            session_maker: Optional[async_sessionmaker] = None,  # Короткие сессии для конкурентных задач
+            executor: Optional[Executor] = None,  # Пул для парсинга и отчета; None — пул потоков asyncio
+            note_buffer: Optional[NoteBuffer] = None  # Дописывается перед выпиской, чтобы заметки были видны
     ):
         self.parser = parser
         self.llm = llm
         self.report_gen = report_gen
         self.window_days = window_days
-        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.batch_size = max(1, batch_size)
+        self.cache = cache
+        self.stream_chunk_size = max(1, stream_chunk_size)
+        self.store = store
+        self.llm_retries = max(0, llm_retries)
+        self.rules = rules
+        self.similarity_threshold = similarity_threshold
+        self.similarity_examples = similarity_examples
+        self.report_formats = report_formats or {}
+        self.session_maker = session_maker
+        self.executor = executor
+        self.note_buffer = note_buffer
+        # Сводка последней выписки каждого пользователя (/stats)
+        self.last_runs: Dict[int, metrics.RunStats] = {}
+        # Запросы к LLM в полете: одинаковые строки (в том числе из разных выписок) ждут один ответ
+        self._inflight: Dict[FlightKey, asyncio.Future] = {}
+        # Лимит подстраивается под провайдера и сохраняется между выписками
+        self.limiter = AdaptiveLimiter(
+            initial=max_concurrency,
+            max_limit=max_concurrency_limit or max_concurrency
+        )
 
-    async def _process_single_transaction(
+    async def _load_notes(
             self,
-            tx: Transaction,
             user: User,
             db: AsyncSession,
-            categories: List[str],
-            hints: str
-    ):
-        """Обработка одной транзакции внутри семафора."""
-
-        # 1. Поиск заметок (быстрая операция с БД)
-        window = timedelta(days=self.window_days)
-        start_date = tx.date - window
-        end_date = tx.date + window
-
+            start_date: datetime,
+            end_date: datetime
+    ) -> List[UserNote]:
+        """Один запрос за все заметки пользователя в интервале (использует индекс notes(user_id, created_at))."""
         result = await db.execute(
             select(Note).where(
                 Note.user_id == user.id,
@@ -48,40 +184,611 @@ class Processor:
         )
         notes_db = result.scalars().all()
 
-        nearby_notes = [
+        return [
             UserNote(id=n.id, text=n.raw_text, timestamp=n.created_at)
             for n in notes_db
         ]
 
-        # 2. Обращение к LLM (медленная операция, требует семафор)
-        async with self.semaphore:
-            llm_result = await self.llm.categorize_transaction(
+    async def _build_note_index(self, transactions: List[Transaction], user: User, db: AsyncSession) -> NoteIndex:
+        """Загружает заметки за весь период выписки (с учетом окна) одним запросом."""
+        if not transactions:
+            return NoteIndex([])
+        window = timedelta(days=self.window_days)
+        start_date = min(tx.date for tx in transactions) - window
+        end_date = max(tx.date for tx in transactions) + window
+        return NoteIndex(await self._load_notes(user, db, start_date, end_date))
+
+    async def _find_nearby_notes(
+            self,
+            tx: Transaction,
+            user: User,
+            db: AsyncSession,
+            note_index: Optional[NoteIndex] = None
+    ) -> List[UserNote]:
+        """Заметки пользователя в окне ±window_days от даты транзакции."""
+        window = timedelta(days=self.window_days)
+        start_date = tx.date - window
+        end_date = tx.date + window
+
+        if note_index is not None:
+            return note_index.between(start_date, end_date)
+        return await self._load_notes(user, db, start_date, end_date)
+
+    @asynccontextmanager
+    async def _task_session(self, db: AsyncSession) -> AsyncIterator[AsyncSession]:
+        """
+        Сессия для задачи, идущей параллельно с другими: AsyncSession нельзя
+        использовать из нескольких задач сразу, поэтому при session_maker у каждой своя.
+        """
+        if self.session_maker is None:
+            yield db
+            return
+        async with self.session_maker() as session:
+            yield session
+
+    @staticmethod
+    async def _end_reads(db: AsyncSession):
+        """
+        Закрывает транзакцию чтения, чтобы она не висела, пока идут запросы к LLM:
+        в SQLite открытый снимок мешает checkpoint WAL, в Postgres соединение
+        простаивает idle in transaction. Объекты сессии остаются доступны (expire_on_commit=False).
+        """
+        await db.commit()
+
+    @property
+    def _process_pool(self) -> bool:
+        return isinstance(self.executor, ProcessPoolExecutor)
+
+    async def _to_thread(self, fn: Callable, *args):
+        """Блокирующий вызов вне event loop. Контекст копируется, чтобы метрики попали в сводку выписки."""
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        # Замыкания и открытые файлы в другой процесс не передать — для них всегда потоки
+        executor = None if self._process_pool else self.executor
+        return await loop.run_in_executor(executor, ctx.run, fn, *args)
+
+    async def _parse_whole(self, file_path: str) -> List[Transaction]:
+        if self._process_pool:
+            # Отдельный процесс не делит GIL с ботом; счетчики парсера из него в метрики не попадают
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self.parser.parse, file_path)
+        return await self._to_thread(self.parser.parse, file_path)
+
+    @staticmethod
+    def _apply_result(tx: Transaction, llm_result: dict):
+        tx.category = llm_result.get('category', 'Разное')
+        tx.comment = llm_result.get('comment', '')
+
+    async def _call_llm(self, call: Callable[[], Awaitable], kind: str):
+        """Запрос к LLM внутри адаптивного лимита; при перегрузке повторяет после отступления лимита."""
+        provider = type(self.llm).__name__
+        for attempt in range(self.llm_retries + 1):
+            try:
+                async with self.limiter.slot():
+                    with metrics.span('llm', kind=kind, provider=provider):
+                        return await call()
+            except LLMProviderError as e:
+                metrics.inc('llm_errors', error=type(e).__name__)
+                if not e.overload or attempt == self.llm_retries:
+                    raise
+                logger.info("LLM request retry %d after error: %s", attempt + 1, e)
+
+    async def _process_single_transaction(
+            self,
+            tx: Transaction,
+            user: User,
+            db: AsyncSession,
+            categories: List[str],
+            hints: str,
+            nearby_notes: Optional[List[UserNote]] = None
+    ) -> List[Transaction]:
+        """Обработка одной транзакции. Возвращает транзакции, для которых LLM не ответила."""
+
+        # 1. Поиск заметок (быстрая операция с БД)
+        if nearby_notes is None:
+            async with self._task_session(db) as session:
+                nearby_notes = await self._find_nearby_notes(tx, user, session)
+
+        # 2. Обращение к LLM (медленная операция, под адаптивным лимитом)
+        try:
+            llm_result = await self._call_llm(lambda: self.llm.categorize_transaction(
                 transaction=tx,
                 nearby_notes=nearby_notes,
                 categories=categories,
                 user_hints=hints
+            ), kind='single')
+        except LLMProviderError as e:
+            logger.warning("LLM request failed: %s", e)
+            metrics.inc('fallback', reason='llm_error')
+            self._apply_result(tx, LLM_FAILURE_RESULT)
+            return [tx]
+
+        self._apply_result(tx, llm_result)
+        return []
+
+    async def _process_batch(
+            self,
+            items: List[Tuple[Transaction, List[UserNote]]],
+            categories: List[str],
+            hints: str
+    ) -> List[Transaction]:
+        """Обработка пачки (транзакция, заметки) одним запросом к LLM."""
+        try:
+            llm_results = await self._call_llm(lambda: self.llm.categorize_batch(
+                items=items,
+                categories=categories,
+                user_hints=hints
+            ), kind='batch')
+        except LLMProviderError as e:
+            logger.warning("LLM batch request failed: %s", e)
+            metrics.inc('fallback', len(items), reason='llm_error')
+            for tx, _ in items:
+                self._apply_result(tx, LLM_FAILURE_RESULT)
+            return [tx for tx, _ in items]
+
+        for (tx, _), llm_result in zip(items, llm_results):
+            self._apply_result(tx, llm_result)
+        return []
+
+    async def _read_transactions(self, file_path: str) -> AsyncIterator[List[Transaction]]:
+        """
+        Отдает транзакции порциями. Парсинг идет вне event loop, чтобы бот отвечал
+        другим пользователям. Потоковый парсер читается в пуле потоков порциями,
+        поэтому первые порции уходят в LLM, пока остаток файла еще читается;
+        с пулом процессов файл разбирается целиком в дочернем процессе.
+        """
+        if self._process_pool or not isinstance(self.parser, BaseStreamingBankParser):
+            with metrics.span('parse'):
+                transactions = await self._parse_whole(file_path)
+            yield transactions
+            return
+
+        iterator = self.parser.iter_parse(file_path)
+        try:
+            while True:
+                with metrics.span('parse'):
+                    chunk = await self._to_thread(lambda: list(islice(iterator, self.stream_chunk_size)))
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            # Закрываем генератор (и книгу openpyxl), даже если обработку прервали
+            close = getattr(iterator, 'close', None)
+            if close:
+                close()
+
+    async def note_added(self, db: AsyncSession, user_id: int, created_at: datetime):
+        """Новая заметка: строки в ее окне нужно перекатегоризировать при следующей выписке."""
+        await self.notes_added(db, [(user_id, created_at)])
+
+    async def notes_added(self, db: AsyncSession, notes: List[Tuple[int, datetime]]):
+        """То же для пачки заметок (NoteBuffer): пересекающиеся окна одного пользователя — одним запросом."""
+        if not self.store:
+            return
+        window = timedelta(days=self.window_days)
+        for user_id, start, end in self._merge_windows(notes, window):
+            await self.store.mark_dirty(db, user_id, start, end)
+
+    @staticmethod
+    def _merge_windows(
+            notes: List[Tuple[int, datetime]], window: timedelta
+    ) -> List[Tuple[int, datetime, datetime]]:
+        merged: List[Tuple[int, datetime, datetime]] = []
+        for user_id, created_at in sorted(notes):
+            start, end = created_at - window, created_at + window
+            if merged and merged[-1][0] == user_id and start <= merged[-1][2]:
+                merged[-1] = (user_id, merged[-1][1], max(end, merged[-1][2]))
+            else:
+                merged.append((user_id, start, end))
+        return merged
+
+    async def settings_changed(self, db: AsyncSession, user_id: int):
+        """Сменились категории или подсказки: сбрасываем кэш и сохраненные результаты пользователя."""
+        if self.cache:
+            await self.cache.invalidate(db, user_id)
+        if self.store:
+            await self.store.mark_all_dirty(db, user_id)
+
+    async def rules_changed(self, db: AsyncSession, user_id: int):
+        """Сменились правила: сохраненные результаты пересчитываются, кэш LLM остается верным."""
+        if self.store:
+            await self.store.mark_all_dirty(db, user_id)
+
+    async def _reuse_stored(self, run: _StatementRun, chunk: List[Transaction]) -> List[Transaction]:
+        """Подставляет сохраненные результаты для уже виденных строк. Возвращает строки, требующие обработки."""
+        fps = []
+        for tx in chunk:
+            # Порядковый номер среди полностью одинаковых строк выписки
+            key = (tx.date, round(tx.amount, 2), tx.description.strip())
+            occurrence = run.occurrences.get(key, 0)
+            run.occurrences[key] = occurrence + 1
+            fp = fingerprint(tx, occurrence)
+            run.fingerprints[id(tx)] = fp
+            fps.append(fp)
+
+        with metrics.span('stored_lookup'):
+            stored = await self.store.load(run.db, run.user.id, fps)
+        run.stored.update(stored)
+
+        remaining = []
+        for tx, fp in zip(chunk, fps):
+            record = stored.get(fp)
+            if record is not None and not record.dirty and record.category in run.categories:
+                tx.category = record.category
+                tx.comment = record.comment or ''
+                run.tier_hits['stored'] += 1
+            else:
+                remaining.append(tx)
+        run.fresh_transactions.extend(remaining)
+        return remaining
+
+    async def _build_preclassifier(self, run: _StatementRun) -> Optional[PreClassifier]:
+        """Правила и примеры пользователя для локальных уровней. Категории не из списка отбрасываются."""
+        if self.rules is None and (self.similarity_threshold is None or self.store is None):
+            return None
+
+        rules = []
+        if self.rules is not None:
+            rules = [r for r in await self.rules.load(run.db, run.user.id) if r.category in run.categories]
+
+        similarity = None
+        if self.similarity_threshold is not None and self.store is not None:
+            examples = await self.store.load_labeled(run.db, run.user.id, self.similarity_examples)
+            examples = [(d, c) for d, c in examples if c in run.categories]
+            if examples:
+                # TF-IDF по тысячам примеров — заметная CPU-работа, не держим ей event loop
+                similarity = await self._to_thread(
+                    functools.partial(SimilarityIndex, examples, threshold=self.similarity_threshold)
+                )
+
+        return PreClassifier(RuleSet(rules), similarity)
+
+    def _apply_local_tier(
+            self,
+            run: _StatementRun,
+            pending: List[Tuple[Transaction, List[UserNote]]],
+            tier: str,
+            classify,
+            skip_with_notes: bool
+    ) -> List[Tuple[Transaction, List[UserNote]]]:
+        """Применяет локальный уровень; возвращает строки, оставшиеся без уверенного ответа."""
+        remaining = []
+        for tx, notes in pending:
+            result = None if (skip_with_notes and notes) else classify(tx.description)
+            if result:
+                self._apply_result(tx, result)
+                run.tier_hits[tier] += 1
+            else:
+                remaining.append((tx, notes))
+        return remaining
+
+    @staticmethod
+    def _log_tier_stats(run: _StatementRun):
+        total = len(run.transactions)
+        for tier in TIERS:
+            if run.tier_hits[tier]:
+                metrics.inc('tier_hits', run.tier_hits[tier], tier=tier)
+        if not total:
+            return
+        parts = [f"{tier} {run.tier_hits[tier]} ({run.tier_hits[tier] / total:.0%})" for tier in TIERS]
+        logger.info("Statement tiers, %d rows: %s", total, ", ".join(parts))
+        if run.tier_hits['llm']:
+            logger.info(
+                "LLM coalescing: %d of %d rows waited for an identical request (%.0f%%)",
+                run.coalesced, run.tier_hits['llm'], 100 * run.coalesced / run.tier_hits['llm']
             )
 
-        tx.category = llm_result.get('category', 'Разное')
-        tx.comment = llm_result.get('comment', '')
+    @staticmethod
+    def _flight_key(tx: Transaction, notes: List[UserNote], run: _StatementRun) -> FlightKey:
+        # Описание как есть: нормализация убирает цифры, а по ним строки бывают разными покупками.
+        # Комментарий по заметкам пишется про конкретную покупку — с заметками склеиваются только полные дубли
+        return (
+            tx.description.strip(),
+            (tx.amount, tx.date) if notes else (),
+            tuple((n.text, n.timestamp) for n in notes),
+            tuple(run.categories),
+            run.hints
+        )
 
-    async def process_statement(self, user: User, file_path: str, db: AsyncSession) -> ExportFile:
-        # 1. Парсинг
-        if not self.parser.validate_format(file_path):
-            raise ValueError("Формат файла не поддерживается.")
+    def _coalesce(
+            self, run: _StatementRun, pending: List[Tuple[Transaction, List[UserNote]]]
+    ) -> Tuple[List[Tuple[Transaction, List[UserNote]]], List[Tuple[Transaction, List[UserNote], asyncio.Future]]]:
+        """
+        Делит строки на ведущие (идут в LLM) и ведомые: у ведомой тот же ключ, что
+        у запроса в полете, и она ждет его ответа. Без заметок сумма и дата в ключ
+        не входят: категорию определяет описание; с заметками — входят.
+        """
+        leaders, followers = [], []
+        loop = asyncio.get_running_loop()
+        for tx, notes in pending:
+            key = self._flight_key(tx, notes, run)
+            future = self._inflight.get(key)
+            if future is None:
+                self._inflight[key] = loop.create_future()
+                run.flights[id(tx)] = key
+                leaders.append((tx, notes))
+            else:
+                followers.append((tx, notes, future))
+        if followers:
+            run.coalesced += len(followers)
+            metrics.inc('llm_coalesced', len(followers))
+        return leaders, followers
 
-        transactions = self.parser.parse(file_path)
-        categories = user.get_categories()
-        hints = user.custom_prompts or ""
+    def _land_flights(self, run: _StatementRun, transactions: List[Transaction], failed: Optional[List[Transaction]]):
+        """Отдает ответ ведущих строк ждущим; failed=None — запрос прерван, ведомые спросят сами."""
+        failed_ids = {id(tx) for tx in failed or ()}
+        for tx in transactions:
+            key = run.flights.pop(id(tx), None)
+            if key is None:
+                continue
+            future = self._inflight.pop(key)
+            if future.done():
+                continue
+            if failed is None:
+                future.cancel()
+            else:
+                future.set_result(({'category': tx.category, 'comment': tx.comment}, id(tx) in failed_ids))
 
-        # 2. Асинхронный запуск задач с ограничением конкурентности
-        tasks = [
-            self._process_single_transaction(tx, user, db, categories, hints)
-            for tx in transactions
-        ]
+    async def _follow(
+            self, run: _StatementRun, tx: Transaction, notes: List[UserNote], future: asyncio.Future
+    ) -> List[Transaction]:
+        try:
+            result, failed = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                raise
+            # Выписку ведущей строки прервали — запрашиваем сами
+            return await self._process_single_transaction(
+                tx, run.user, run.db, run.categories, run.hints, nearby_notes=notes
+            )
+        self._apply_result(tx, result)
+        return [tx] if failed else []
+
+    def report_generator(self, user: User) -> BaseReportGenerator:
+        """Генератор отчета в формате, выбранном пользователем."""
+        return self.report_formats.get(user.report_format, self.report_gen)
+
+    @staticmethod
+    def _emit(run: _StatementRun, transactions: List[Transaction]):
+        ready = run.sink.done(transactions) if run.sink is not None else []
+        run.done += len(transactions)
+        if run.on_progress is not None and (transactions or not run.reading):
+            try:
+                run.on_progress(StatementProgress(
+                    done=run.done,
+                    total=len(run.transactions),
+                    reading=run.reading,
+                    elapsed=time.perf_counter() - run.started,
+                    ready=ready
+                ))
+            except Exception:
+                # Отображение прогресса не должно ронять обработку выписки
+                logger.exception("Progress callback failed")
+
+    async def _emit_when_done(
+            self, run: _StatementRun, coro: Awaitable[List[Transaction]], transactions: List[Transaction]
+    ) -> List[Transaction]:
+        try:
+            failed = await coro
+        except BaseException:
+            self._land_flights(run, transactions, None)
+            raise
+        self._land_flights(run, transactions, failed)
+        self._emit(run, transactions)
+        return failed
+
+    async def _schedule_chunk(self, run: _StatementRun, chunk: List[Transaction]):
+        """Заметки и кэш для порции, затем запуск задач LLM без ожидания их завершения."""
+        rows = chunk
+        if run.sink is not None:
+            run.sink.add(rows)
+
+        if self.store:
+            chunk = await self._reuse_stored(run, chunk)
+            if not chunk:
+                await self._end_reads(run.db)
+                self._emit(run, rows)
+                return
+
+        with metrics.span('notes'):
+            note_index = await self._build_note_index(chunk, run.user, run.db)
+            pending = [
+                (tx, await self._find_nearby_notes(tx, run.user, run.db, note_index))
+                for tx in chunk
+            ]
+
+        # Правила пользователя явные — применяются и при заметках рядом
+        if run.preclassifier:
+            pending = self._apply_local_tier(
+                run, pending, PreClassifier.RULES, run.preclassifier.classify_by_rules, skip_with_notes=False
+            )
+
+        # Кэш: только для транзакций без заметок рядом, иначе ответ зависит от контекста
+        if self.cache:
+            chunk_keys = {}
+            for tx, notes in pending:
+                key = normalize_description(tx.description)
+                if key and not notes:
+                    chunk_keys[id(tx)] = key
+            with metrics.span('cache_lookup'):
+                cached = await self.cache.get_many(run.db, run.user.id, list(chunk_keys.values()), run.categories)
+            still_pending = []
+            for tx, notes in pending:
+                hit = cached.get(chunk_keys.get(id(tx)))
+                if hit:
+                    self._apply_result(tx, hit)
+                    run.tier_hits['cache'] += 1
+                else:
+                    still_pending.append((tx, notes))
+            pending = still_pending
+            run.cache_keys.update(chunk_keys)
+
+        # Чтения порции закончены — до запуска запросов к LLM
+        await self._end_reads(run.db)
+
+        # Похожие описания — как и кэш, только без заметок рядом
+        if run.preclassifier:
+            pending = self._apply_local_tier(
+                run, pending, PreClassifier.SIMILARITY, run.preclassifier.classify_by_similarity,
+                skip_with_notes=True
+            )
+
+        run.llm_transactions.extend(tx for tx, _ in pending)
+        run.tier_hits['llm'] += len(pending)
+
+        # Строки, категоризированные локально, можно сразу писать в отчет
+        llm_ids = {id(tx) for tx, _ in pending}
+        self._emit(run, [tx for tx in rows if id(tx) not in llm_ids])
+
+        # Одинаковые строки ждут один запрос, а не отправляют свои
+        pending, followers = self._coalesce(run, pending)
+        run.tasks.extend(
+            asyncio.ensure_future(self._emit_when_done(run, self._follow(run, tx, notes, future), [tx]))
+            for tx, notes, future in followers
+        )
+
+        # Асинхронный запуск задач с ограничением конкурентности
+        if self.batch_size > 1:
+            groups = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+            coros = [self._process_batch(group, run.categories, run.hints) for group in groups]
+        else:
+            groups = [[item] for item in pending]
+            coros = [
+                self._process_single_transaction(
+                    tx, run.user, run.db, run.categories, run.hints, nearby_notes=notes
+                )
+                for tx, notes in pending
+            ]
+        run.tasks.extend(
+            asyncio.ensure_future(self._emit_when_done(run, coro, [tx for tx, _ in group]))
+            for coro, group in zip(coros, groups)
+        )
+
+    async def process_statement(
+            self,
+            user: User,
+            file_path: str,
+            db: AsyncSession,
+            on_progress: Optional[ProgressCallback] = None
+    ) -> ExportFile:
+        """
+        Обрабатывает выписку; длительности этапов и счетчики собираются в self.last_runs[user.id].
+        on_progress вызывается из event loop по мере готовности строк (см. StatementProgress).
+        """
+        stats = metrics.RunStats(os.path.basename(file_path))
+        self.last_runs[user.id] = stats
+        token = metrics.bind_run(stats)
+        started = time.perf_counter()
+        try:
+            return await self._process_statement(user, file_path, db, stats, on_progress)
+        finally:
+            stats.duration = time.perf_counter() - started
+            metrics.unbind_run(token)
+            metrics.observe('statement', stats.duration)
+
+    async def _process_statement(
+            self,
+            user: User,
+            file_path: str,
+            db: AsyncSession,
+            stats: metrics.RunStats,
+            on_progress: Optional[ProgressCallback] = None
+    ) -> ExportFile:
+        # Заметки, еще ждущие записи, должны попасть в выборку и пометить строки грязными
+        if self.note_buffer is not None:
+            await self.note_buffer.flush()
+
+        # 1. Парсинг. Формат проверен при приеме файла, а чужой файл парсер отклонит
+        # при чтении — отдельная проверка здесь прочитала бы начало файла еще раз
+
+        run = _StatementRun(
+            user=user,
+            db=db,
+            categories=user.get_categories(),
+            hints=user.custom_prompts or "",
+            on_progress=on_progress
+        )
+
+        # Потоковый отчет пишется во временный файл по мере готовности строк
+        report_gen = self.report_generator(user)
+        writer = report_gen.open() if isinstance(report_gen, BaseStreamingReportGenerator) else None
+        if writer is not None or on_progress is not None:
+            run.sink = _ReportSink(writer, self._to_thread)
+        try:
+            return await self._categorize(run, file_path, stats, report_gen, writer)
+        except BaseException:
+            if writer is not None:
+                # Запись в потоке еще может идти — закрываем файл после нее
+                await asyncio.gather(run.sink.flush(), return_exceptions=True)
+                writer.close()
+            raise
+
+    async def _categorize(
+            self,
+            run: _StatementRun,
+            file_path: str,
+            stats: metrics.RunStats,
+            report_gen: BaseReportGenerator,
+            writer: Optional[BaseReportWriter]
+    ) -> ExportFile:
+        user, db = run.user, run.db
+
+        # 2. Заметки, локальные уровни, кэш и запуск LLM — порциями по мере чтения файла
+        try:
+            run.preclassifier = await self._build_preclassifier(run)
+            await self._end_reads(db)
+
+            async for chunk in self._read_transactions(file_path):
+                run.transactions.extend(chunk)
+                await self._schedule_chunk(run, chunk)
+
+            stats.rows = len(run.transactions)
+            # Файл дочитан: общее число строк известно
+            run.reading = False
+            self._emit(run, [])
+
+            # Ждем выполнения всех задач
+            results = await asyncio.gather(*run.tasks)
+        except BaseException:
+            for task in run.tasks:
+                task.cancel()
+            raise
+
+        # Строки, оставшиеся без ответа LLM, не кэшируем и не сохраняем
+        failed = {id(tx) for chunk_failed in results for tx in chunk_failed}
+        if failed:
+            logger.warning("LLM failed for %d transactions, limit now %d", len(failed), self.limiter.limit)
+
+        if self.cache:
+            fresh = {}
+            for tx in run.llm_transactions:
+                if id(tx) in failed:
+                    continue
+                key = run.cache_keys.get(id(tx))
+                if key and key not in fresh:
+                    fresh[key] = {'category': tx.category, 'comment': tx.comment}
+            async with self._task_session(db) as session:
+                await self.cache.put_many(session, user.id, fresh, run.categories)
+            logger.info("Categorization cache: %s", self.cache.stats())
+
+        if self.store:
+            # Фолбэки (категория не из списка) не сохраняем — пусть пересчитаются в следующий раз
+            rows = [
+                (run.fingerprints[id(tx)], tx)
+                for tx in run.fresh_transactions
+                if tx.category in run.categories and id(tx) not in failed
+            ]
+            async with self._task_session(db) as session:
+                await self.store.save(session, user.id, rows, run.stored)
+            logger.info(
+                "Incremental processing: %d reused, %d recomputed",
+                run.tier_hits['stored'], len(run.fresh_transactions)
+            )
 
-        # Ждем выполнения всех задач
-        await asyncio.gather(*tasks)
+        self._log_tier_stats(run)
 
-        # 3. Генерация отчета
-        return self.report_gen.generate(transactions)
\ No newline at end of file
+        # 3. Генерация отчета (потоковому осталось дописать конец файла)
+        with metrics.span('report'):
+            if writer is not None:
+                await run.sink.flush()
+                return await self._to_thread(writer.finish)
+            return await self._to_thread(report_gen.generate, run.transactions)
@@ -0,0 +1,47 @@
+import asyncio
+import importlib
+import logging
+import time
+from typing import List, Optional
+
+from src.core import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """
+    Фоновая загрузка модулей, которые при старте не импортируются (pandas, openpyxl):
+    бот отвечает сразу, а первая выписка не ждет их импорта. Импорт идет в потоке
+    после задержки, чтобы не мешать первым апдейтам; недоступный модуль пропускается.
+    """
+
+    def __init__(self, modules: List[str], delay: float = 1.0):
+        self.modules = modules
+        self.delay = delay
+        self._task: Optional[asyncio.Task] = None
+
+    async def run(self):
+        await asyncio.sleep(self.delay)
+        started = time.perf_counter()
+        loaded = []
+        for name in self.modules:
+            module_started = time.perf_counter()
+            try:
+                await asyncio.to_thread(importlib.import_module, name)
+            except ImportError as e:
+                logger.warning("Warm-up: %s is not available (%s)", name, e)
+                continue
+            metrics.observe('warmup_import', time.perf_counter() - module_started, module=name)
+            loaded.append(name)
+        logger.info("Warm-up: loaded %s in %.1f s", ", ".join(loaded) or "nothing", time.perf_counter() - started)
+
+    async def start(self):
+        # Не ждем: dp.startup должен вернуться, чтобы начался polling
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            # Импорт, уже начатый в потоке, доработает сам
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import re
+from typing import Dict, List
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.infrastructure.database.engine import insert_on_conflict
+from src.infrastructure.database.models import CategoryCacheEntry
+
+
+def normalize_description(description: str) -> str:
+    """
+    Приводит описание к ключу кэша: нижний регистр, без цифр (номера терминалов,
+    чеков, карт) и пунктуации. 'PYATEROCHKA 1234 Moscow' и 'Pyaterochka 5678 MOSCOW'
+    дают один ключ.
+    """
+    text = description.lower().replace('ё', 'е')
+    text = re.sub(r'[\d_]+', ' ', text)
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def categories_hash(categories: List[str]) -> str:
+    """Хэш набора категорий (порядок не важен)."""
+    payload = json.dumps(sorted(categories), ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class CategorizationCache:
+    """
+    Постоянный кэш категоризации в БД.
+    Ключ: пользователь + нормализованное описание + хэш набора категорий.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    async def get_many(
+            self,
+            db: AsyncSession,
+            user_id: int,
+            keys: List[str],
+            categories: List[str]
+    ) -> Dict[str, dict]:
+        """Одним запросом достает записи для всех ключей. Каждый ключ из списка считается попаданием или промахом."""
+        if not keys:
+            return {}
+
+        result = await db.execute(
+            select(CategoryCacheEntry).where(
+                CategoryCacheEntry.user_id == user_id,
+                CategoryCacheEntry.categories_hash == categories_hash(categories),
+                CategoryCacheEntry.description_key.in_(set(keys))
+            )
+        )
+        found = {
+            entry.description_key: {'category': entry.category, 'comment': entry.comment or ''}
+            for entry in result.scalars().all()
+            if entry.category in categories
+        }
+
+        for key in keys:
+            if key in found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return found
+
+    async def put_many(
+            self,
+            db: AsyncSession,
+            user_id: int,
+            results: Dict[str, dict],
+            categories: List[str]
+    ):
+        """Сохраняет ответы LLM. Фолбэки (категория не из списка) не кэшируются."""
+        cat_hash = categories_hash(categories)
+        entries = [
+            {
+                'user_id': user_id,
+                'description_key': key,
+                'categories_hash': cat_hash,
+                'category': result['category'],
+                'comment': result.get('comment', ''),
+            }
+            for key, result in results.items()
+            if key and result.get('category') in categories
+        ]
+        if not entries:
+            return
+
+        # Параллельная выписка того же пользователя уже могла записать ключ — не критично
+        await db.execute(
+            insert_on_conflict(db, CategoryCacheEntry).on_conflict_do_nothing(
+                index_elements=['user_id', 'description_key', 'categories_hash']
+            ),
+            entries
+        )
+        await db.commit()
+
+    async def invalidate(self, db: AsyncSession, user_id: int):
+        """Сбрасывает кэш пользователя (после /set_cats или /set_hints)."""
+        await db.execute(delete(CategoryCacheEntry).where(CategoryCacheEntry.user_id == user_id))
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
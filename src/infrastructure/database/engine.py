@@ -0,0 +1,115 @@
+import logging
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+
+logger = logging.getLogger(__name__)
+
+SQLITE_DEFAULTS = {
+    # WAL: читатели не ждут писателя, а писатель — читателей
+    'journal_mode': 'WAL',
+    # В режиме WAL NORMAL не теряет целостность, но не делает fsync на каждый коммит
+    'synchronous': 'NORMAL',
+    'mmap_size_mb': 256,
+    # Сколько ждать чужую запись, прежде чем вернуть "database is locked"
+    'busy_timeout_ms': 5000,
+    'cache_size_mb': 32,
+}
+
+POSTGRES_DEFAULTS = {
+    'pool_size': 10,
+    'max_overflow': 10,
+    'pool_timeout_seconds': 30,
+    # Соединения, которые сервер или pgbouncer закрыл по простою, проверяются перед выдачей
+    'pool_pre_ping': True,
+    'pool_recycle_seconds': 1800,
+    # Кэш подготовленных запросов asyncpg на соединение; 0 — выключен (нужно за pgbouncer в transaction-режиме)
+    'statement_cache_size': 500,
+}
+
+
+def _sqlite_pragmas(settings: dict, in_memory: bool) -> list:
+    pragmas = [
+        f"PRAGMA synchronous={settings['synchronous']}",
+        f"PRAGMA busy_timeout={int(settings['busy_timeout_ms'])}",
+        f"PRAGMA mmap_size={int(settings['mmap_size_mb'] * 1024 * 1024)}",
+        # Отрицательное значение — размер в килобайтах, а не в страницах
+        f"PRAGMA cache_size={-int(settings['cache_size_mb'] * 1024)}",
+    ]
+    if not in_memory:
+        # У базы в памяти журнал всегда в памяти
+        pragmas.insert(0, f"PRAGMA journal_mode={settings['journal_mode']}")
+    return pragmas
+
+
+def build_engine(url: str, config: Optional[dict] = None, echo: bool = False) -> AsyncEngine:
+    """
+    Движок с настройками из раздела database конфига:
+    database.sqlite — PRAGMA на каждое новое соединение, database.postgres — пул и кэш запросов.
+    """
+    config = config or {}
+    backend = make_url(url).get_backend_name()
+
+    if backend == 'sqlite':
+        settings = {**SQLITE_DEFAULTS, **config.get('sqlite', {})}
+        database = make_url(url).database
+        pragmas = _sqlite_pragmas(settings, in_memory=not database or database == ':memory:')
+        engine = create_async_engine(
+            url,
+            echo=echo,
+            # Таймаут драйвера на блокировку — тот же, что у busy_timeout
+            connect_args={'timeout': settings['busy_timeout_ms'] / 1000}
+        )
+
+        @event.listens_for(engine.sync_engine, 'connect')
+        def _apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+            finally:
+                cursor.close()
+
+        logger.info("SQLite engine: %s", ", ".join(p.replace('PRAGMA ', '') for p in pragmas))
+        return engine
+
+    if backend == 'postgresql':
+        settings = {**POSTGRES_DEFAULTS, **config.get('postgres', {})}
+        logger.info(
+            "Postgres engine: pool %d+%d, statement cache %d",
+            settings['pool_size'], settings['max_overflow'], settings['statement_cache_size']
+        )
+        return create_async_engine(
+            url,
+            echo=echo,
+            pool_size=settings['pool_size'],
+            max_overflow=settings['max_overflow'],
+            pool_timeout=settings['pool_timeout_seconds'],
+            pool_pre_ping=settings['pool_pre_ping'],
+            pool_recycle=settings['pool_recycle_seconds'],
+            connect_args={
+                # Кэш подготовленных запросов на стороне SQLAlchemy-адаптера и самого asyncpg
+                'prepared_statement_cache_size': settings['statement_cache_size'],
+                'statement_cache_size': settings['statement_cache_size'],
+            }
+        )
+
+    return create_async_engine(url, echo=echo)
+
+
+def insert_on_conflict(db: AsyncSession, table):
+    """
+    INSERT диалекта сессии с on_conflict_do_nothing/on_conflict_do_update.
+    Конфликт пропускается в самом запросе: rollback общей сессии задачи
+    откатил бы и ее остальные несохраненные изменения.
+    """
+    backend = db.get_bind().dialect.name
+    if backend == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif backend == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"INSERT ... ON CONFLICT is not supported for {backend}")
+    return insert(table)
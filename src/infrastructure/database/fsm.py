@@ -0,0 +1,154 @@
+import asyncio
+import json
+import logging
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, AsyncGenerator, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseEventIsolation, BaseStorage, StateType, StorageKey
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src.core import metrics
+from src.infrastructure.database.models import EventLock, FSMRecord
+
+logger = logging.getLogger(__name__)
+
+
+def storage_key(key: StorageKey) -> str:
+    return ":".join(str(part) if part is not None else "" for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+    ))
+
+
+class SQLStorage(BaseStorage):
+    """
+    Хранилище FSM aiogram в таблице fsm_states. Состояние диалога видно всем
+    процессам бота, поэтому следующий шаг диалога может обработать другой воркер.
+    Пустая запись (нет состояния и данных) удаляется.
+    """
+
+    def __init__(self, session_maker: async_sessionmaker):
+        self.session_maker = session_maker
+
+    async def _write(self, key: StorageKey, **values):
+        k = storage_key(key)
+        async with self.session_maker() as db:
+            result = await db.execute(
+                update(FSMRecord).where(FSMRecord.key == k).values(**values, updated_at=datetime.utcnow())
+            )
+            if result.rowcount == 0:
+                db.add(FSMRecord(key=k, **values))
+                try:
+                    await db.commit()
+                    return
+                except IntegrityError:
+                    # Запись успел создать другой процесс
+                    await db.rollback()
+                    await db.execute(update(FSMRecord).where(FSMRecord.key == k).values(**values))
+            await db.execute(
+                delete(FSMRecord).where(FSMRecord.key == k, FSMRecord.state.is_(None), FSMRecord.data == "{}")
+            )
+            await db.commit()
+
+    async def _read(self, key: StorageKey, column) -> Optional[Any]:
+        async with self.session_maker() as db:
+            return await db.scalar(select(column).where(FSMRecord.key == storage_key(key)))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._write(key, state=state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._read(key, FSMRecord.state)
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self._write(key, data=json.dumps(dict(data), ensure_ascii=False))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        raw = await self._read(key, FSMRecord.data)
+        return json.loads(raw) if raw else {}
+
+    async def close(self) -> None:
+        pass
+
+
+class SQLEventIsolation(BaseEventIsolation):
+    """
+    События одного чата обрабатываются по очереди во всех процессах бота:
+    блокировка — строка в event_locks с ключом чата. Занята — ждем, опрашивая
+    с растущим интервалом; блокировку упавшего процесса забираем после ttl.
+    Пока обработчик работает, владелец продлевает expires_at каждые ttl/3, так что
+    долгий обработчик блокировку не теряет, а ttl ограничивает только время
+    ожидания после падения процесса.
+    """
+
+    def __init__(
+            self,
+            session_maker: async_sessionmaker,
+            ttl: float = 60.0,
+            poll_interval: float = 0.02,
+            max_poll_interval: float = 0.5
+    ):
+        self.session_maker = session_maker
+        self.ttl = timedelta(seconds=ttl)
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+
+    async def _acquire(self, key: str, owner: str) -> bool:
+        now = datetime.utcnow()
+        async with self.session_maker() as db:
+            await db.execute(delete(EventLock).where(EventLock.key == key, EventLock.expires_at < now))
+            db.add(EventLock(key=key, owner=owner, expires_at=now + self.ttl))
+            try:
+                await db.commit()
+                return True
+            except IntegrityError:
+                await db.rollback()
+                return False
+
+    async def _renew(self, key: str, owner: str):
+        interval = self.ttl.total_seconds() / 3
+        while True:
+            await asyncio.sleep(interval)
+            async with self.session_maker() as db:
+                result = await db.execute(
+                    update(EventLock)
+                    .where(EventLock.key == key, EventLock.owner == owner)
+                    .values(expires_at=datetime.utcnow() + self.ttl)
+                )
+                await db.commit()
+            if result.rowcount == 0:
+                # Продление опоздало больше чем на ttl — блокировку уже забрал другой процесс
+                logger.warning("Event lock %s expired while the handler was running", key)
+                metrics.inc('event_lock_lost')
+                return
+
+    async def _release(self, key: str, owner: str):
+        async with self.session_maker() as db:
+            await db.execute(delete(EventLock).where(EventLock.key == key, EventLock.owner == owner))
+            await db.commit()
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        k, owner = storage_key(key), uuid.uuid4().hex
+        delay = self.poll_interval
+        waited = False
+        while not await self._acquire(k, owner):
+            waited = True
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_poll_interval)
+        if waited:
+            metrics.inc('event_lock_waits')
+        renewal = asyncio.create_task(self._renew(k, owner))
+        try:
+            yield
+        finally:
+            renewal.cancel()
+            # Снимаем даже при отмене обработчика, иначе чат ждал бы до истечения ttl
+            await asyncio.shield(self._release(k, owner))
+
+    async def close(self) -> None:
+        pass
@@ -1,6 +1,8 @@
 import json
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, BigInteger
+from sqlalchemy import (
+    Column, Integer, String, DateTime, ForeignKey, Text, BigInteger, UniqueConstraint, Index, Float, Boolean
+)
 from sqlalchemy.orm import relationship, declarative_base
 
 Base = declarative_base()
@@ -19,13 +21,21 @@ class User(Base):
     # Пользовательские подсказки для LLM
     custom_prompts = Column(Text, default="")
 
+    # Формат отчета: csv, xlsx, parquet
+    report_format = Column(String, nullable=False, default="csv", server_default="csv")
+
     created_at = Column(DateTime, default=datetime.utcnow)
     notes = relationship("Note", back_populates="user")
 
     def get_categories(self) -> list[str]:
         if not self._categories_json:
             return []
-        return json.loads(self._categories_json)
+        # Разобранный список запоминается до смены строки: профиль живет в кэше, категории читаются часто
+        cached = self.__dict__.get('_categories_decoded')
+        if cached is None or cached[0] is not self._categories_json:
+            cached = (self._categories_json, json.loads(self._categories_json))
+            self.__dict__['_categories_decoded'] = cached
+        return list(cached[1])
 
     def set_categories(self, categories: list[str]):
         self._categories_json = json.dumps(categories, ensure_ascii=False)
@@ -33,10 +43,121 @@ class User(Base):
 
 class Note(Base):
     __tablename__ = 'notes'
+    __table_args__ = (
+        # Выборка заметок пользователя за период выписки
+        Index('ix_notes_user_created', 'user_id', 'created_at'),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
     raw_text = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
-    user = relationship("User", back_populates="notes")
\ No newline at end of file
+    user = relationship("User", back_populates="notes")
+
+
+class CategoryCacheEntry(Base):
+    """Кэш ответов LLM по нормализованному описанию транзакции."""
+    __tablename__ = 'category_cache'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'description_key', 'categories_hash', name='uq_category_cache_key'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    description_key = Column(String, nullable=False)
+    # Хэш набора категорий: при смене списка старые записи не подходят
+    categories_hash = Column(String(40), nullable=False)
+    category = Column(String, nullable=False)
+    comment = Column(Text, default="")
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class JobStatus:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    ACTIVE = (QUEUED, RUNNING)
+
+
+class Job(Base):
+    """Задача на обработку выписки. Хранится в БД, чтобы пережить перезапуск бота."""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        Index('ix_jobs_status', 'status'),
+        # Проверка лимита пользователя при захвате задачи
+        Index('ix_jobs_user_status', 'user_id', 'status'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    chat_id = Column(BigInteger, nullable=False)
+    file_path = Column(String, nullable=False)
+    file_name = Column(String, nullable=False)
+    status = Column(String, nullable=False, default=JobStatus.QUEUED)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class TransactionRecord(Base):
+    """Уже категоризированная транзакция. Повторная выписка переиспользует ее категорию по отпечатку."""
+    __tablename__ = 'transactions'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'fingerprint', name='uq_transactions_fingerprint'),
+        # Пометка "грязными" строк в окне новой заметки
+        Index('ix_transactions_user_date', 'user_id', 'date'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    fingerprint = Column(String(40), nullable=False)
+    date = Column(DateTime, nullable=False)
+    amount = Column(Float, nullable=False)
+    description = Column(Text, nullable=False)
+    category = Column(String, nullable=False)
+    comment = Column(Text, default="")
+    # True — рядом появилась новая заметка или сменились настройки, нужна повторная категоризация
+    dirty = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class CategoryRule(Base):
+    """Правило пользователя 'шаблон -> категория', применяется до обращения к LLM."""
+    __tablename__ = 'category_rules'
+    __table_args__ = (
+        Index('ix_category_rules_user', 'user_id', 'position'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    # Порядок правил: при нескольких совпадениях побеждает меньший
+    position = Column(Integer, nullable=False, default=0)
+    pattern = Column(Text, nullable=False)
+    is_regex = Column(Boolean, nullable=False, default=False)
+    category = Column(String, nullable=False)
+
+
+class FSMRecord(Base):
+    """Состояние диалога aiogram (FSM). В БД — чтобы его видели все процессы бота в режиме webhook."""
+    __tablename__ = 'fsm_states'
+
+    # bot:chat:user:thread:business:destiny
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(Text, nullable=False, default="{}")
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class EventLock(Base):
+    """Блокировка обработки событий одного чата: строка есть — событие обрабатывает какой-то процесс."""
+    __tablename__ = 'event_locks'
+
+    key = Column(String, primary_key=True)
+    owner = Column(String(32), nullable=False)
+    # Процесс мог упасть, не сняв блокировку: после этого времени ее забирает следующий
+    expires_at = Column(DateTime, nullable=False)
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core import metrics
+from src.infrastructure.database.models import Note
+
+logger = logging.getLogger(__name__)
+
+# (db, [(user_id, created_at)]) — вызывается в транзакции вставки, до коммита
+FlushCallback = Callable[[AsyncSession, List[Tuple[int, datetime]]], Awaitable[None]]
+
+
+@dataclass
+class _PendingNote:
+    user_id: int
+    raw_text: str
+    created_at: datetime
+    future: asyncio.Future
+
+
+class NoteBuffer:
+    """
+    Отложенная запись заметок: сообщения копятся до max_batch штук или max_delay
+    секунд и пишутся одной вставкой в одной транзакции. add() возвращается только
+    после коммита, поэтому пользователь получает подтверждение, лишь когда заметка в БД.
+    """
+
+    def __init__(
+            self,
+            session_maker,
+            max_batch: int = 100,
+            max_delay: float = 0.3,
+            on_flush: Optional[FlushCallback] = None
+    ):
+        self.session_maker = session_maker
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+        self.on_flush = on_flush
+        self._pending: List[_PendingNote] = []
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+        self._closed = False
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def add(self, user_id: int, raw_text: str, created_at: datetime):
+        """Ставит заметку в очередь и ждет ее записи. Ошибка записи пробрасывается вызывающему."""
+        if self._closed:
+            raise RuntimeError("Note buffer is stopped")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(_PendingNote(user_id, raw_text, created_at, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._spawn_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._spawn_flush)
+        # Отмена хендлера не должна отменять запись, уже стоящую в очереди
+        await asyncio.shield(future)
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _spawn_flush(self):
+        self._cancel_timer()
+        task = asyncio.ensure_future(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self):
+        """Пишет все накопленное. Вызывается и перед обработкой выписки, чтобы она видела свежие заметки."""
+        async with self._lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+            # Заметки, пришедшие во время записи, заведут новый таймер
+            self._cancel_timer()
+
+            started = time.perf_counter()
+            try:
+                async with self.session_maker() as db:
+                    await db.execute(insert(Note), [
+                        {'user_id': n.user_id, 'raw_text': n.raw_text, 'created_at': n.created_at}
+                        for n in batch
+                    ])
+                    if self.on_flush is not None:
+                        await self.on_flush(db, [(n.user_id, n.created_at) for n in batch])
+                    await db.commit()
+            except Exception as e:
+                logger.exception("Failed to write %d notes", len(batch))
+                metrics.inc('notes_flush', status='failed')
+                for n in batch:
+                    if not n.future.done():
+                        n.future.set_exception(e)
+                return
+
+            metrics.observe('notes_flush', time.perf_counter() - started)
+            metrics.inc('notes_written', len(batch))
+            for n in batch:
+                if not n.future.done():
+                    n.future.set_result(None)
+
+    async def stop(self):
+        """Новые заметки больше не принимаются, накопленные дописываются."""
+        self._closed = True
+        self._cancel_timer()
+        # Уже начатые записи не отменяем — дожидаемся
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.flush()
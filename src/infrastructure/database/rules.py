@@ -0,0 +1,34 @@
+from typing import List
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.preclassifier import Rule
+from src.infrastructure.database.models import CategoryRule
+
+
+class RuleStore:
+    """Правила категоризации пользователя (/set_rules)."""
+
+    async def load(self, db: AsyncSession, user_id: int) -> List[Rule]:
+        result = await db.execute(
+            select(CategoryRule).where(CategoryRule.user_id == user_id).order_by(CategoryRule.position)
+        )
+        return [
+            Rule(pattern=r.pattern, category=r.category, is_regex=r.is_regex)
+            for r in result.scalars().all()
+        ]
+
+    async def replace(self, db: AsyncSession, user_id: int, rules: List[Rule]):
+        """Заменяет все правила пользователя. Коммит — на вызывающей стороне."""
+        await db.execute(delete(CategoryRule).where(CategoryRule.user_id == user_id))
+        db.add_all(
+            CategoryRule(
+                user_id=user_id,
+                position=position,
+                pattern=rule.pattern,
+                is_regex=rule.is_regex,
+                category=rule.category
+            )
+            for position, rule in enumerate(rules)
+        )
@@ -0,0 +1,107 @@
+import hashlib
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.dtypes import Transaction
+from src.infrastructure.database.engine import insert_on_conflict
+from src.infrastructure.database.models import TransactionRecord
+
+# Ограничение на размер IN (...) в одном запросе
+_IN_CHUNK = 500
+
+
+def fingerprint(tx: Transaction, occurrence: int = 0) -> str:
+    """
+    Стабильный отпечаток строки выписки: дата, сумма, описание.
+    occurrence различает полностью одинаковые строки внутри одной выписки
+    (две одинаковые покупки кофе в одну минуту) и не меняется между выгрузками.
+    """
+    payload = f"{tx.date.isoformat()}|{tx.amount:.2f}|{tx.description.strip()}|{occurrence}"
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class TransactionStore:
+    """Хранилище категоризированных транзакций для инкрементальной обработки выписок."""
+
+    async def load(self, db: AsyncSession, user_id: int, fingerprints: List[str]) -> Dict[str, TransactionRecord]:
+        # populate_existing: save и mark_dirty меняют записи UPDATE-запросами, загруженные объекты могли устареть
+        records = {}
+        for i in range(0, len(fingerprints), _IN_CHUNK):
+            result = await db.execute(
+                select(TransactionRecord).where(
+                    TransactionRecord.user_id == user_id,
+                    TransactionRecord.fingerprint.in_(fingerprints[i:i + _IN_CHUNK])
+                ).execution_options(populate_existing=True)
+            )
+            records.update((r.fingerprint, r) for r in result.scalars().all())
+        return records
+
+    async def load_labeled(self, db: AsyncSession, user_id: int, limit: int = 5000) -> List[Tuple[str, str]]:
+        """Пары (описание, категория) последних актуальных записей — примеры для локального классификатора."""
+        result = await db.execute(
+            select(TransactionRecord.description, TransactionRecord.category).where(
+                TransactionRecord.user_id == user_id,
+                TransactionRecord.dirty.is_(False)
+            ).order_by(TransactionRecord.updated_at.desc()).limit(limit)
+        )
+        return [(description, category) for description, category in result.all()]
+
+    async def save(
+            self,
+            db: AsyncSession,
+            user_id: int,
+            rows: List[Tuple[str, Transaction]],
+            existing: Dict[str, TransactionRecord]
+    ):
+        """
+        Сохраняет свежие результаты: обновляет известные отпечатки, добавляет новые.
+        Известные записи обновляются по первичному ключу, поэтому db может быть
+        не той сессией, в которой они загружены.
+        """
+        new_rows, changed = [], []
+        for fp, tx in rows:
+            values = {
+                'date': tx.date,
+                'amount': tx.amount,
+                'description': tx.description,
+                'category': tx.category,
+                'comment': tx.comment or "",
+                'dirty': False,
+            }
+            record = existing.get(fp)
+            if record is None:
+                new_rows.append({'user_id': user_id, 'fingerprint': fp, **values})
+                continue
+            changed.append({'id': record.id, **values})
+        if changed:
+            await db.execute(update(TransactionRecord), changed)
+        if new_rows:
+            # Ту же выписку параллельно сохранила другая задача — результат уже в БД
+            await db.execute(
+                insert_on_conflict(db, TransactionRecord).on_conflict_do_nothing(
+                    index_elements=['user_id', 'fingerprint']
+                ),
+                new_rows
+            )
+        await db.commit()
+
+    async def mark_dirty(self, db: AsyncSession, user_id: int, start: datetime, end: datetime) -> int:
+        """Помечает строки в интервале дат для повторной категоризации (новая заметка рядом)."""
+        result = await db.execute(
+            update(TransactionRecord).where(
+                TransactionRecord.user_id == user_id,
+                TransactionRecord.date >= start,
+                TransactionRecord.date <= end
+            ).values(dirty=True)
+        )
+        return result.rowcount
+
+    async def mark_all_dirty(self, db: AsyncSession, user_id: int) -> int:
+        """Помечает все строки пользователя (сменились категории или подсказки)."""
+        result = await db.execute(
+            update(TransactionRecord).where(TransactionRecord.user_id == user_id).values(dirty=True)
+        )
+        return result.rowcount
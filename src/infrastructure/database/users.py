@@ -0,0 +1,82 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core import metrics
+from src.infrastructure.database.models import User
+
+
+class UserCache:
+    """
+    Профили пользователей в памяти процесса по telegram_id: LRU на max_size записей с TTL.
+    Объекты User отсоединены от сессии: настройки пишутся update_settings(),
+    а после коммита запись сбрасывается invalidate(). TTL ограничивает устаревание,
+    если профиль изменили в обход (другой процесс, ручная правка БД).
+    """
+
+    def __init__(self, ttl: float = 300.0, max_size: int = 1024, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_size = max(1, max_size)
+        self._clock = clock
+        self._entries: "OrderedDict[int, Tuple[float, User]]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, telegram_id: int) -> Optional[User]:
+        entry = self._entries.get(telegram_id)
+        if entry is not None and entry[0] > self._clock():
+            self._entries.move_to_end(telegram_id)
+            return entry[1]
+        if entry is not None:
+            del self._entries[telegram_id]
+        return None
+
+    def put(self, user: User):
+        self._entries[user.telegram_id] = (self._clock() + self.ttl, user)
+        self._entries.move_to_end(user.telegram_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, telegram_id: int):
+        self._entries.pop(telegram_id, None)
+
+    async def load(self, db: AsyncSession, telegram_id: int) -> Optional[User]:
+        """Профиль из кэша, иначе из БД (и в кэш). None — пользователя еще нет."""
+        user = self.get(telegram_id)
+        if user is not None:
+            metrics.inc('user_cache', result='hit')
+            return user
+        metrics.inc('user_cache', result='miss')
+        user = await db.scalar(select(User).where(User.telegram_id == telegram_id))
+        if user is not None:
+            self.put(user)
+        return user
+
+
+async def update_settings(
+        db: AsyncSession,
+        user: User,
+        categories: Optional[List[str]] = None,
+        custom_prompts: Optional[str] = None,
+        report_format: Optional[str] = None
+):
+    """
+    Пишет настройки update-запросом (объект из кэша не привязан к сессии) и
+    применяет их к самому объекту. Коммит и UserCache.invalidate — на вызывающей стороне.
+    """
+    values: Dict = {}
+    if categories is not None:
+        user.set_categories(categories)
+        values[User._categories_json] = user._categories_json
+    if custom_prompts is not None:
+        user.custom_prompts = custom_prompts
+        values[User.custom_prompts] = custom_prompts
+    if report_format is not None:
+        user.report_format = report_format
+        values[User.report_format] = report_format
+    if values:
+        await db.execute(update(User).where(User.id == user.id).values(values))
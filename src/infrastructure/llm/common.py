@@ -0,0 +1,285 @@
+import asyncio
+import json
+import re
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+import aiohttp
+
+from src.core import metrics
+from src.core.dtypes import Transaction, UserNote
+from src.core.exceptions import (
+    LLMConnectionError, LLMRateLimitError, LLMResponseError, LLMServerError, LLMTimeoutError
+)
+from src.core.interfaces import BaseLLMProvider
+
+BatchItem = Tuple[Transaction, List[UserNote]]
+
+
+class PooledHTTPProvider(BaseLLMProvider):
+    """
+    База для HTTP-провайдеров: одна долгоживущая aiohttp-сессия на провайдер.
+    Соединения переиспользуются (keep-alive), лимит на хост совпадает
+    с конкурентностью Processor, чтобы запросы не ждали в очереди коннектора.
+    """
+
+    def __init__(
+            self,
+            max_connections: int = 4,
+            timeout: float = 120.0,
+            connect_timeout: float = 10.0,
+            keepalive_timeout: float = 60.0
+    ):
+        self.max_connections = max_connections
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout, sock_read=timeout)
+        self.keepalive_timeout = keepalive_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_connections,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=300
+        )
+        self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Сессия создается лениво, если start() не был вызван явно."""
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    async def _post_json(self, url: str, payload: dict, headers: Optional[dict] = None, name: str = "LLM") -> dict:
+        """POST с разбором ответа; сетевые ошибки и HTTP-статусы превращаются в типизированные исключения."""
+        session = await self._get_session()
+        try:
+            async with session.post(url, json=payload, headers=headers) as resp:
+                if resp.status == 429:
+                    raise LLMRateLimitError(f"{name} Error 429")
+                if resp.status >= 500:
+                    raise LLMServerError(f"{name} Error {resp.status}", resp.status)
+                if resp.status != 200:
+                    raise LLMResponseError(f"{name} Error {resp.status}")
+                return await resp.json()
+        except (LLMRateLimitError, LLMServerError, LLMResponseError):
+            raise
+        except asyncio.TimeoutError as e:
+            raise LLMTimeoutError(f"{name} Timeout") from e
+        except Exception as e:
+            raise LLMConnectionError(f"Connection Error: {e}") from e
+
+    async def _post_ndjson(
+            self, url: str, payload: dict, headers: Optional[dict] = None, name: str = "LLM"
+    ) -> AsyncIterator[dict]:
+        """
+        POST с потоковым ответом: отдает объекты NDJSON по мере прихода строк.
+        Если потребитель прекращает чтение (aclose), запрос закрывается, генерация на сервере обрывается.
+        """
+        session = await self._get_session()
+        try:
+            async with session.post(url, json=payload, headers=headers) as resp:
+                if resp.status == 429:
+                    raise LLMRateLimitError(f"{name} Error 429")
+                if resp.status >= 500:
+                    raise LLMServerError(f"{name} Error {resp.status}", resp.status)
+                if resp.status != 200:
+                    raise LLMResponseError(f"{name} Error {resp.status}")
+                async for line in resp.content:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError as e:
+                        raise LLMResponseError(f"{name}: неверная строка потока") from e
+        except (LLMRateLimitError, LLMServerError, LLMResponseError):
+            raise
+        except asyncio.TimeoutError as e:
+            raise LLMTimeoutError(f"{name} Timeout") from e
+        except Exception as e:
+            raise LLMConnectionError(f"Connection Error: {e}") from e
+
+
+class JsonObjectScanner:
+    """
+    Находит первый завершенный JSON-объект верхнего уровня в тексте,
+    приходящем кусками. Учитывает строки и экранирование, поэтому
+    скобки внутри комментария модели не сбивают подсчет.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._start = None
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """Добавляет кусок текста. Возвращает текст объекта, если он только что закрылся."""
+        self.text += chunk
+        text = self.text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = self._depth > 0
+            elif c == '{':
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif c == '}' and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._pos = i + 1
+                    return text[self._start:i + 1]
+        self._pos = len(text)
+        return None
+
+
+def clean_json_response(response_text: str) -> str:
+    """Очищает ответ LLM от Markdown и лишнего текста, оставляя только JSON."""
+    clean_text = re.sub(r'```json\s*', '', response_text, flags=re.IGNORECASE)
+    clean_text = re.sub(r'```', '', clean_text)
+    start_idx = clean_text.find('{')
+    end_idx = clean_text.rfind('}')
+    if start_idx != -1 and end_idx != -1:
+        clean_text = clean_text[start_idx:end_idx + 1]
+    return clean_text.strip()
+
+
+def build_batch_system_prompt(categories: List[str], user_hints: str) -> str:
+    """Неизменная часть промпта для пачки: инструкция, категории, подсказки, пример."""
+    return f"""ЗАДАЧА: Для КАЖДОЙ транзакции из списка определи категорию и напиши короткий комментарий.
+
+СПИСОК КАТЕГОРИЙ (ВЫБИРАЙ СТРОГО ИЗ СПИСКА):
+{json.dumps(categories, ensure_ascii=False)}
+
+Глобальные подсказки: {user_hints}
+
+ИНСТРУКЦИЯ:
+1. Если в заметках есть совпадение по сумме или смыслу — используй информацию оттуда.
+2. Если заметок нет — угадай категорию по описанию транзакции.
+3. Верни ТОЛЬКО валидный JSON: объект с ключом "results", по одному элементу на каждую транзакцию.
+
+ПРИМЕР ОТВЕТА ДЛЯ ДВУХ ТРАНЗАКЦИЙ:
+{{
+  "results": [
+    {{"id": 0, "category": "Еда", "comment": "Покупка в магазине"}},
+    {{"id": 1, "category": "Транспорт", "comment": "Такси (из заметки)"}}
+  ]
+}}
+"""
+
+
+def build_batch_user_prompt(items: List[BatchItem]) -> str:
+    """Переменная часть промпта для пачки: только сами транзакции."""
+    lines = []
+    for idx, (tx, notes) in enumerate(items):
+        notes_context = "; ".join(
+            f"{n.text} ({n.timestamp.strftime('%d.%m')})" for n in notes
+        ) if notes else "нет"
+        lines.append(
+            f'{idx}. Транзакция: "{tx.description}", Сумма: {tx.amount}, '
+            f'Дата: {tx.date.strftime("%Y-%m-%d")}, Заметки: {notes_context}'
+        )
+    return "ТРАНЗАКЦИИ (номер. данные):\n" + "\n".join(lines)
+
+
+def parse_batch_response(raw_text: str, count: int, categories: List[str]) -> List[Optional[dict]]:
+    """
+    Разбирает ответ на пачку. Для каждой позиции возвращает dict или None,
+    если элемент отсутствует или не прошел проверку по списку категорий.
+    """
+    results: List[Optional[dict]] = [None] * count
+    try:
+        data = json.loads(clean_json_response(raw_text))
+    except json.JSONDecodeError:
+        return results
+
+    items = data.get('results') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return results
+
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            idx = int(item.get('id'))
+        except (TypeError, ValueError):
+            continue
+        if not 0 <= idx < count or results[idx] is not None:
+            continue
+        if item.get('category') not in categories:
+            continue
+        results[idx] = {
+            'category': item['category'],
+            'comment': str(item.get('comment') or '')
+        }
+    return results
+
+
+async def categorize_with_resplit(
+        items: List[BatchItem],
+        categories: List[str],
+        user_hints: str,
+        complete: Callable[..., Awaitable[str]],
+        categorize_single: Callable[[Transaction, List[UserNote], List[str], str], Awaitable[dict]]
+) -> List[dict]:
+    """
+    Отправляет пачку одним запросом. Повторно отправляются только элементы,
+    не прошедшие проверку; если не прошел ни один — пачка делится пополам.
+    Одиночные элементы уходят в обычный categorize_transaction.
+    complete(prompt, system=...) получает неизменную часть отдельно от транзакций.
+    Ошибки провайдера (LLMProviderError) не перехватываются.
+    """
+    results: List[Optional[dict]] = [None] * len(items)
+
+    async def resolve(indices: List[int]):
+        if len(indices) == 1:
+            tx, notes = items[indices[0]]
+            results[indices[0]] = await categorize_single(tx, notes, categories, user_hints)
+            return
+
+        subset = [items[i] for i in indices]
+        # Ошибки провайдера (сеть, 429, 5xx) пробрасываются: дробить пачку при перегрузке бессмысленно
+        raw_text = await complete(
+            build_batch_user_prompt(subset),
+            system=build_batch_system_prompt(categories, user_hints)
+        )
+        parsed = parse_batch_response(raw_text, len(subset), categories)
+
+        failed = []
+        for i, result in zip(indices, parsed):
+            if result is None:
+                failed.append(i)
+            else:
+                results[i] = result
+
+        if not failed:
+            return
+        metrics.inc('llm_batch_resplit')
+        metrics.inc('llm_batch_invalid_items', len(failed))
+        if len(failed) < len(indices):
+            await resolve(failed)
+        else:
+            middle = len(failed) // 2
+            await resolve(failed[:middle])
+            await resolve(failed[middle:])
+
+    if items:
+        await resolve(list(range(len(items))))
+    return results
@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from src.core import metrics
+from src.core.dtypes import Transaction, UserNote
+from src.core.exceptions import LLMProviderError
+from src.core.interfaces import BaseLLMProvider
+from src.infrastructure.llm.common import BatchItem
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class _Backend:
+    """Провайдер с историей задержек (по видам запросов), счетчиком ошибок подряд и запросов в полете."""
+
+    def __init__(self, name: str, provider: BaseLLMProvider, window: int):
+        self.name = name
+        self.provider = provider
+        self.window = window
+        self.latencies: Dict[str, deque] = {}
+        self.failures = 0
+        self.down_until = 0.0
+        self.inflight = 0
+        # Размер пула соединений HTTP-провайдера; None — не ограничен
+        self.capacity: Optional[int] = getattr(provider, 'max_connections', None)
+
+    def has_capacity(self) -> bool:
+        return self.capacity is None or self.inflight < self.capacity
+
+    def quantile(self, kind: str, q: float, min_samples: int) -> Optional[float]:
+        samples = self.latencies.get(kind)
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+
+class HedgedProvider(BaseLLMProvider):
+    """
+    Несколько провайдеров за одним интерфейсом.
+
+    Запрос уходит первому исправному провайдеру. Если он не ответил за p95
+    своих обычных задержек, тот же запрос дублируется следующему (или тому же,
+    если провайдер один); берется первый успешный ответ, второй запрос отменяется.
+    Ошибка сразу передает запрос следующему провайдеру, а после failure_threshold
+    ошибок подряд провайдер уходит в конец очереди на cooldown секунд.
+    Ответ с категорией не из списка (фолбэк провайдера) не принимается, пока есть
+    второй запрос или следующий провайдер; возвращается, только если лучше нет.
+    Дублей — не больше max_hedge_ratio от последних запросов, чтобы при общей
+    перегрузке хеджирование не удваивало нагрузку, и только при свободном соединении
+    в пуле провайдера: иначе дубль встал бы в очередь коннектора за основными запросами.
+    """
+
+    def __init__(
+            self,
+            providers: List[BaseLLMProvider],
+            names: Optional[List[str]] = None,
+            quantile: float = 0.95,
+            initial_delay: float = 5.0,
+            min_delay: float = 0.2,
+            min_samples: int = 20,
+            window: int = 200,
+            max_hedge_ratio: float = 0.1,
+            failure_threshold: int = 3,
+            cooldown: float = 30.0,
+            clock: Callable[[], float] = time.monotonic
+    ):
+        if not providers:
+            raise ValueError("HedgedProvider needs at least one provider")
+        names = names or [type(p).__name__ for p in providers]
+        self.backends = [_Backend(name, p, window) for name, p in zip(names, providers)]
+        self.quantile = quantile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.max_hedge_ratio = max_hedge_ratio
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.clock = clock
+        self._recent_hedges: deque = deque(maxlen=100)
+
+    async def start(self):
+        for backend in self.backends:
+            await backend.provider.start()
+
+    async def close(self):
+        for backend in self.backends:
+            await backend.provider.close()
+
+    def hedge_delay(self, backend: _Backend, kind: str) -> float:
+        observed = backend.quantile(kind, self.quantile, self.min_samples)
+        return max(self.min_delay, observed if observed is not None else self.initial_delay)
+
+    def _order(self) -> List[_Backend]:
+        """Исправные — в порядке конфигурации, выключенные по ошибкам — в конце (на случай, если лежат все)."""
+        now = self.clock()
+        return sorted(self.backends, key=lambda b: b.down_until > now)
+
+    def _may_hedge(self) -> bool:
+        return sum(self._recent_hedges) < self.max_hedge_ratio * self._recent_hedges.maxlen
+
+    async def _timed(self, backend: _Backend, kind: str, call: Callable[[BaseLLMProvider], Awaitable[T]]) -> T:
+        started = time.perf_counter()
+        try:
+            result = await call(backend.provider)
+        except LLMProviderError:
+            backend.failures += 1
+            metrics.inc('llm_backend_errors', provider=backend.name)
+            if backend.failures >= self.failure_threshold:
+                if backend.down_until <= self.clock():
+                    logger.warning(
+                        "LLM provider %s failed %d times in a row, failing over for %.0f s",
+                        backend.name, backend.failures, self.cooldown
+                    )
+                    metrics.inc('llm_failover', provider=backend.name)
+                backend.down_until = self.clock() + self.cooldown
+            raise
+        elapsed = time.perf_counter() - started
+        backend.failures = 0
+        backend.down_until = 0.0
+        backend.latencies.setdefault(kind, deque(maxlen=backend.window)).append(elapsed)
+        return result
+
+    async def _call(
+            self,
+            kind: str,
+            call: Callable[[BaseLLMProvider], Awaitable[T]],
+            valid: Callable[[Any], bool]
+    ) -> T:
+        order = self._order()
+        started = time.perf_counter()
+        delay = self.hedge_delay(order[0], kind)
+        pending: Dict[asyncio.Future, _Backend] = {}
+        # Следующий провайдер для дубля или переключения
+        next_idx = 1
+        # Дубль уже отправлен (или от него отказались) — больше по таймеру не ждем
+        hedge_decided = False
+        hedge_sent = False
+        last_error: Optional[LLMProviderError] = None
+        # Ответ не из списка категорий — на случай, если лучшего не будет
+        fallback: Optional[T] = None
+        has_fallback = False
+
+        def launch(backend: _Backend) -> asyncio.Future:
+            task = asyncio.ensure_future(self._timed(backend, kind, call))
+            pending[task] = backend
+            # Считаем сразу, а не при старте задачи: следующий дубль видит занятое соединение
+            backend.inflight += 1
+
+            def release(_):
+                backend.inflight -= 1
+
+            task.add_done_callback(release)
+            return task
+
+        first = launch(order[0])
+        try:
+            while pending:
+                timeout = None if hedge_decided else max(0.0, delay - (time.perf_counter() - started))
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    hedge_decided = True
+                    if not self._may_hedge():
+                        metrics.inc('llm_hedge', result='over_budget')
+                        continue
+                    # Один провайдер — дубль уходит ему же (залип запрос, а не сервер)
+                    target = order[next_idx] if next_idx < len(order) else order[0]
+                    if not target.has_capacity():
+                        metrics.inc('llm_hedge', result='no_capacity')
+                        continue
+                    next_idx += 1
+                    hedge_sent = True
+                    metrics.inc('llm_hedge', result='sent')
+                    launch(target)
+                    continue
+
+                for task in done:
+                    backend = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except LLMProviderError as e:
+                        last_error = e
+                        continue
+                    if not valid(result):
+                        metrics.inc('llm_backend_invalid', provider=backend.name)
+                        if not has_fallback:
+                            fallback, has_fallback = result, True
+                        continue
+                    if hedge_sent:
+                        metrics.inc('llm_hedge', result='primary_won' if task is first else 'hedge_won')
+                    return result
+
+                if not pending and next_idx < len(order):
+                    logger.info(
+                        "LLM request failed (%s), retrying on %s",
+                        last_error or "category not in list", order[next_idx].name
+                    )
+                    metrics.inc('llm_failover_request', provider=order[next_idx].name)
+                    hedge_decided = True
+                    launch(order[next_idx])
+                    next_idx += 1
+            if has_fallback:
+                return fallback
+            raise last_error
+        finally:
+            self._recent_hedges.append(hedge_sent)
+            for task in pending:
+                # Отмена закрывает HTTP-запрос проигравшего
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def categorize_transaction(
+            self,
+            transaction: Transaction,
+            nearby_notes: List[UserNote],
+            categories: List[str],
+            user_hints: str
+    ) -> dict:
+        return await self._call(
+            'single',
+            lambda p: p.categorize_transaction(transaction, nearby_notes, categories, user_hints),
+            lambda result: result.get('category') in categories
+        )
+
+    async def categorize_batch(
+            self,
+            items: List[BatchItem],
+            categories: List[str],
+            user_hints: str
+    ) -> List[dict]:
+        return await self._call(
+            'batch',
+            lambda p: p.categorize_batch(items, categories, user_hints),
+            lambda results: len(results) == len(items) and all(r.get('category') in categories for r in results)
+        )
@@ -1,30 +1,174 @@
 import json
-import re
-from typing import List
-import aiohttp
+import logging
+import time
+from collections import Counter, deque
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import Callable, Deque, List, Optional
+from src.core import metrics
 from src.core.dtypes import Transaction, UserNote
-from src.core.interfaces import BaseLLMProvider
+from src.infrastructure.llm.common import (
+    BatchItem, JsonObjectScanner, PooledHTTPProvider, categorize_with_resplit, clean_json_response
+)
 
+logger = logging.getLogger(__name__)
 
-class OllamaProvider(BaseLLMProvider):
-    def __init__(self, base_url: str, model: str):
+
+@dataclass
+class CallTiming:
+    """Замеры одного потокового запроса, секунды от отправки."""
+    first_token: Optional[float]
+    result: float  # Когда ответ стал пригоден (готовый JSON или конец генерации)
+    early_stop: bool  # Запрос закрыт до конца генерации
+
+
+class OllamaProvider(PooledHTTPProvider):
+    def __init__(
+            self,
+            base_url: str,
+            model: str,
+            max_connections: int = 4,
+            timeout: float = 120.0,
+            streaming: bool = False,  # Читать ответ потоком и обрывать его после готового JSON
+            keep_alive: str = "10m"
+    ):
+        super().__init__(max_connections=max_connections, timeout=timeout)
         self.base_url = base_url
         self.model = model
+        self.streaming = streaming
+        self.keep_alive = keep_alive
+        # Последние замеры time-to-result для потокового режима
+        self.timings: Deque[CallTiming] = deque(maxlen=1000)
+        # Накопленные счетчики Ollama: сколько токенов промпта реально вычислено и за сколько
+        self.usage: Counter = Counter()
 
     def _clean_json_response(self, response_text: str) -> str:
         """Очищает ответ LLM от Markdown и лишнего текста, оставляя только JSON."""
-        # Убираем блоки кода ```json ... ```
-        clean_text = re.sub(r'```json\s*', '', response_text, flags=re.IGNORECASE)
-        clean_text = re.sub(r'```', '', clean_text)
+        return clean_json_response(response_text)
+
+    async def _complete(
+            self,
+            prompt: str,
+            system: Optional[str] = None,
+            accept: Optional[Callable[[dict], bool]] = None
+    ) -> str:
+        """
+        Один запрос к /api/chat. Возвращает сырой текст ответа модели.
+        system — неизменная для пользователя часть (инструкция, категории, подсказки):
+        она идет первой, и Ollama берет ее из кэша промпта, вычисляя только короткий prompt.
+        accept — проверка готового JSON-объекта: в потоковом режиме, если она прошла,
+        остаток генерации не дочитывается.
+        """
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.append({"role": "user", "content": prompt})
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": self.streaming,
+            "format": "json",  # Ollama поддерживает enforced JSON mode
+            "keep_alive": self.keep_alive,  # Модель и кэш префикса живут между выписками
+            "options": {
+                "temperature": 0.1,  # Снижаем креативность для стабильности
+                "num_ctx": 4096
+            }
+        }
+
+        if self.streaming:
+            return await self._complete_streaming(payload, accept)
+
+        data = await self._post_json(f"{self.base_url}/api/chat", payload, name="Ollama")
+        self._record_usage(data)
+        return self._message_text(data) or '{}'
+
+    @staticmethod
+    def _message_text(data: dict) -> str:
+        """Текст ответа: message.content у /api/chat, response у /api/generate."""
+        message = data.get('message')
+        if isinstance(message, dict) and message.get('content') is not None:
+            return message['content']
+        return data.get('response', '')
+
+    async def _complete_streaming(self, payload: dict, accept: Optional[Callable[[dict], bool]]) -> str:
+        started = time.monotonic()
+        first_token = None
+        scanner = JsonObjectScanner()
+        stream = self._post_ndjson(f"{self.base_url}/api/chat", payload, name="Ollama")
+        # aclosing: при раннем выходе соединение закрывается, Ollama прекращает генерацию
+        async with aclosing(stream):
+            async for chunk in stream:
+                token = self._message_text(chunk)
+                if token and first_token is None:
+                    first_token = time.monotonic() - started
+                candidate = scanner.feed(token)
+                if chunk.get('done'):
+                    # Счетчики токенов приходят только в последней строке потока
+                    self._record_usage(chunk)
+                if candidate is not None and self._accepts(candidate, accept):
+                    self._record_timing(first_token, time.monotonic() - started, early_stop=not chunk.get('done'))
+                    return candidate
+                if chunk.get('done'):
+                    break
+
+        self._record_timing(first_token, time.monotonic() - started, early_stop=False)
+        return scanner.text or '{}'
+
+    @staticmethod
+    def _accepts(candidate: str, accept: Optional[Callable[[dict], bool]]) -> bool:
+        try:
+            obj = json.loads(candidate)
+        except json.JSONDecodeError:
+            return False
+        return isinstance(obj, dict) and (accept is None or accept(obj))
+
+    def _record_usage(self, data: dict):
+        """prompt_eval_count мал, если префикс взят из кэша; длительности Ollama отдает в наносекундах."""
+        if 'prompt_eval_count' not in data and 'eval_count' not in data:
+            return
+        prompt_tokens = data.get('prompt_eval_count', 0)
+        prompt_ms = data.get('prompt_eval_duration', 0) / 1e6
+        eval_tokens = data.get('eval_count', 0)
+        eval_ms = data.get('eval_duration', 0) / 1e6
+        self.usage.update({
+            'calls': 1,
+            'prompt_eval_count': prompt_tokens,
+            'prompt_eval_ms': prompt_ms,
+            'eval_count': eval_tokens,
+            'eval_ms': eval_ms,
+        })
+        logger.debug(
+            "Ollama usage: prompt %d tok / %.0f ms, eval %d tok / %.0f ms",
+            prompt_tokens, prompt_ms, eval_tokens, eval_ms
+        )
+
+    def _record_timing(self, first_token: Optional[float], result: float, early_stop: bool):
+        self.timings.append(CallTiming(first_token=first_token, result=result, early_stop=early_stop))
+        logger.debug(
+            "Ollama stream: first token %s s, result %.3f s, early stop %s",
+            f"{first_token:.3f}" if first_token is not None else "-", result, early_stop
+        )
+
+    @staticmethod
+    def _system_prompt(categories: List[str], user_hints: str) -> str:
+        """Неизменная для пользователя часть промпта — одинаковая побайтно от вызова к вызову."""
+        # Максимально "сухой" промпт
+        return f"""ЗАДАЧА: Определи категорию траты и напиши короткий комментарий.
 
-        # Пытаемся найти границы JSON объекта { ... }
-        start_idx = clean_text.find('{')
-        end_idx = clean_text.rfind('}')
+СПИСОК КАТЕГОРИЙ (ВЫБЕРИ ОДНУ СТРОГО ИЗ СПИСКА):
+{json.dumps(categories, ensure_ascii=False)}
 
-        if start_idx != -1 and end_idx != -1:
-            clean_text = clean_text[start_idx:end_idx + 1]
+Глобальные подсказки: {user_hints}
 
-        return clean_text.strip()
+ИНСТРУКЦИЯ:
+1. Если в заметках есть совпадение по сумме или смыслу — используй информацию оттуда.
+2. Если заметок нет — угадай категорию по описанию транзакции.
+3. Верни ТОЛЬКО валидный JSON.
+
+ПРИМЕР ОТВЕТА:
+{{
+  "category": "Еда",
+  "comment": "Покупка в магазине (из заметки)"
+}}
+"""
 
     async def categorize_transaction(
             self,
@@ -33,6 +177,7 @@ class OllamaProvider(BaseLLMProvider):
             categories: List[str],
             user_hints: str
     ) -> dict:
+        """Бросает LLMProviderError при ошибке провайдера; кривой JSON от модели дает фолбэк 'Разное'."""
 
         # Формируем контекст заметок. Для глупой модели важно не перегружать контекст.
         if nearby_notes:
@@ -40,65 +185,46 @@ class OllamaProvider(BaseLLMProvider):
         else:
             notes_context = "Нет заметок."
 
-        # Максимально "сухой" промпт
-        prompt = f"""
-ЗАДАЧА: Определи категорию траты и напиши короткий комментарий.
-
-ВХОДНЫЕ ДАННЫЕ:
-Транзакция: "{transaction.description}"
+        # Короткая переменная часть: только сама транзакция
+        prompt = f"""Транзакция: "{transaction.description}"
 Сумма: {transaction.amount}
 Дата: {transaction.date.strftime('%Y-%m-%d')}
 Заметки пользователя (могут содержать подсказку):
 {notes_context}
-
-СПИСОК КАТЕГОРИЙ (ВЫБЕРИ ОДНУ СТРОГО ИЗ СПИСКА):
-{json.dumps(categories, ensure_ascii=False)}
-
-Глобальные подсказки: {user_hints}
-
-ИНСТРУКЦИЯ:
-1. Если в заметках есть совпадение по сумме или смыслу — используй информацию оттуда.
-2. Если заметок нет — угадай категорию по описанию транзакции.
-3. Верни ТОЛЬКО валидный JSON.
-
-ПРИМЕР ОТВЕТА:
-{{
-  "category": "Еда",
-  "comment": "Покупка в магазине (из заметки)"
-}}
 """
-        payload = {
-            "model": self.model,
-            "prompt": prompt,
-            "stream": False,
-            "format": "json",  # Ollama поддерживает enforced JSON mode
-            "options": {
-                "temperature": 0.1,  # Снижаем креативность для стабильности
-                "num_ctx": 4096
-            }
-        }
-
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(f"{self.base_url}/api/generate", json=payload) as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        raw_response = data.get('response', '{}')
-
-                        # Пытаемся почистить и распарсить
-                        clean_json_str = self._clean_json_response(raw_response)
-                        try:
-                            result = json.loads(clean_json_str)
-                            # Проверяем, что категория реально из списка, иначе "Разное"
-                            if result.get('category') not in categories:
-                                result['category'] = 'Разное'
-                            return result
-                        except json.JSONDecodeError:
-                            print(f"JSON Parse Error. Raw: {raw_response}")
-                            return {"category": "Разное", "comment": "Ошибка чтения ответа LLM"}
-                    else:
-                        print(f"Ollama Error {resp.status}")
-            except Exception as e:
-                print(f"Connection Error: {e}")
-
-        return {"category": "Разное", "comment": "Ошибка соединения"}
\ No newline at end of file
+        # Ошибки провайдера (LLMProviderError) пробрасываются в Processor
+        raw_response = await self._complete(
+            prompt,
+            system=self._system_prompt(categories, user_hints),
+            accept=lambda obj: obj.get('category') in categories
+        )
+
+        # Пытаемся почистить и распарсить
+        clean_json_str = self._clean_json_response(raw_response)
+        try:
+            result = json.loads(clean_json_str)
+        except json.JSONDecodeError:
+            result = None
+        # Валидный JSON, но не объект (список, строка) — такой же нечитаемый ответ
+        if not isinstance(result, dict):
+            logger.warning("JSON Parse Error. Raw: %s", raw_response)
+            metrics.inc('fallback', reason='json_error')
+            return {"category": "Разное", "comment": "Ошибка чтения ответа LLM"}
+        # Проверяем, что категория реально из списка, иначе "Разное"
+        if result.get('category') not in categories:
+            metrics.inc('fallback', reason='invalid_category')
+            result['category'] = 'Разное'
+        return result
+
+    async def categorize_batch(
+            self,
+            items: List[BatchItem],
+            categories: List[str],
+            user_hints: str
+    ) -> List[dict]:
+        """Вся пачка уходит одним запросом, невалидные элементы переспрашиваются по частям."""
+        return await categorize_with_resplit(
+            items, categories, user_hints,
+            complete=self._complete,
+            categorize_single=self.categorize_transaction
+        )
@@ -1,13 +1,23 @@
 import json
-import re
-import aiohttp
-from typing import List
+from typing import List, Optional
+from src.core import metrics
 from src.core.dtypes import Transaction, UserNote
-from src.core.interfaces import BaseLLMProvider
+from src.core.exceptions import LLMResponseError
+from src.infrastructure.llm.common import (
+    BatchItem, PooledHTTPProvider, categorize_with_resplit, clean_json_response
+)
 
 
-class YandexGPTProvider(BaseLLMProvider):
-    def __init__(self, api_key: str, folder_id: str, model_name: str = "yandexgpt-lite"):
+class YandexGPTProvider(PooledHTTPProvider):
+    def __init__(
+            self,
+            api_key: str,
+            folder_id: str,
+            model_name: str = "yandexgpt-lite",
+            max_connections: int = 4,
+            timeout: float = 120.0
+    ):
+        super().__init__(max_connections=max_connections, timeout=timeout)
         self.api_key = api_key
         self.folder_id = folder_id
         # Правильный путь для Assistant API согласно документации
@@ -15,13 +25,35 @@ class YandexGPTProvider(BaseLLMProvider):
         self.model_uri = f"gpt://{folder_id}/{model_name}"
 
     def _clean_json_response(self, response_text: str) -> str:
-        clean_text = re.sub(r'```json\s*', '', response_text, flags=re.IGNORECASE)
-        clean_text = re.sub(r'```', '', clean_text)
-        start_idx = clean_text.find('{')
-        end_idx = clean_text.rfind('}')
-        if start_idx != -1 and end_idx != -1:
-            clean_text = clean_text[start_idx:end_idx + 1]
-        return clean_text.strip()
+        return clean_json_response(response_text)
+
+    async def _complete(self, prompt: str, system: Optional[str] = None) -> str:
+        """Один запрос к Assistant API. Возвращает сырой текст ответа модели."""
+        # Структура payload должна соответствовать методу responses.create
+        payload = {
+            "model": self.model_uri,
+            "input": prompt,  # В Assistant API используется 'input', а не 'messages'
+            "completionConfig": {
+                "temperature": 0.1,
+                "maxTokens": 1500
+            }
+        }
+        if system:
+            # Неизменная часть промпта передается отдельно, как системная инструкция
+            payload["instructions"] = system
+
+        headers = {
+            "Authorization": f"Api-Key {self.api_key}",
+            "x-folder-id": self.folder_id
+        }
+
+        data = await self._post_json(self.url, payload, headers=headers, name="Yandex API")
+
+        # Доступ к тексту через output[0].content[0].text
+        try:
+            return data['output'][0]['content'][0]['text']
+        except (KeyError, IndexError, TypeError) as e:
+            raise LLMResponseError("Ошибка обработки формата Yandex") from e
 
     async def categorize_transaction(
             self,
@@ -42,39 +74,33 @@ class YandexGPTProvider(BaseLLMProvider):
 Верни ТОЛЬКО валидный JSON в формате:
 {{"category": "название_категории", "comment": "почему выбрана"}}"""
 
-        # Структура payload должна соответствовать методу responses.create
-        payload = {
-            "model": self.model_uri,
-            "input": prompt,  # В Assistant API используется 'input', а не 'messages'
-            "completionConfig": {
-                "temperature": 0.1,
-                "maxTokens": 1500
-            }
-        }
+        # Ошибки провайдера (LLMProviderError) пробрасываются в Processor
+        raw_response = await self._complete(prompt)
 
-        headers = {
-            "Authorization": f"Api-Key {self.api_key}",
-            "x-folder-id": self.folder_id
-        }
+        try:
+            clean_json_str = self._clean_json_response(raw_response)
+            result = json.loads(clean_json_str)
+        except json.JSONDecodeError:
+            result = None
+        # Валидный JSON, но не объект (список, строка) — такой же нечитаемый ответ
+        if not isinstance(result, dict):
+            metrics.inc('fallback', reason='json_error')
+            return {"category": "Разное", "comment": "Ошибка обработки формата Yandex"}
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(self.url, json=payload, headers=headers) as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        # Доступ к тексту через output[0].content[0].text
-                        try:
-                            raw_response = data['output'][0]['content'][0]['text']
-                            clean_json_str = self._clean_json_response(raw_response)
-                            result = json.loads(clean_json_str)
+        if result.get('category') not in categories:
+            metrics.inc('fallback', reason='invalid_category')
+            result['category'] = 'Разное'
+        return result
 
-                            if result.get('category') not in categories:
-                                result['category'] = 'Разное'
-                            return result
-                        except (KeyError, IndexError, json.JSONDecodeError):
-                            return {"category": "Разное", "comment": "Ошибка обработки формата Yandex"}
-                    else:
-                        # Если снова будет ошибка, мы увидим её статус в поле комментария
-                        return {"category": "Разное", "comment": f"Yandex API Error {resp.status}"}
-            except Exception as e:
-                return {"category": "Разное", "comment": f"Connection Error: {str(e)}"}
\ No newline at end of file
+    async def categorize_batch(
+            self,
+            items: List[BatchItem],
+            categories: List[str],
+            user_hints: str
+    ) -> List[dict]:
+        """Вся пачка уходит одним запросом, невалидные элементы переспрашиваются по частям."""
+        return await categorize_with_resplit(
+            items, categories, user_hints,
+            complete=self._complete,
+            categorize_single=self.categorize_transaction
+        )
@@ -0,0 +1,73 @@
+import logging
+from typing import Iterator, Optional, Sequence
+
+from src.core import metrics
+from src.core.dtypes import FileHead, Transaction
+from src.core.interfaces import BaseStreamingBankParser
+from src.infrastructure.parsers.sber import parse_amount, parse_date_robust
+from src.infrastructure.parsers.sniff import find_columns, iter_table_rows, normalize_cell, read_head
+
+logger = logging.getLogger(__name__)
+
+HEADER_KEYWORDS = ('дата операции', 'приход', 'расход')
+COLUMNS = ('дата операции', 'описание операции', 'приход', 'расход', 'валюта')
+
+
+class AlfaCSVParser(BaseStreamingBankParser):
+    """
+    CSV-выписка Альфа-Банка (Windows-1251, ';'): приход и расход в отдельных колонках,
+    год в дате двузначный. Сумма — приход минус расход, расходы отрицательные, как у Сбера.
+    """
+
+    def validate_format(self, file_path: str) -> bool:
+        return self.sniff(read_head(file_path))
+
+    def sniff(self, head: FileHead) -> bool:
+        return head.kind == 'csv' and head.find_header(*HEADER_KEYWORDS) is not None
+
+    def iter_parse(self, file_path: str, head: Optional[FileHead] = None) -> Iterator[Transaction]:
+        head = head or read_head(file_path)
+        header_pos = head.find_header(*HEADER_KEYWORDS)
+        if header_pos is None:
+            return
+
+        columns = None
+        for i, row in enumerate(iter_table_rows(file_path, head)):
+            if i < header_pos:
+                continue
+            if columns is None:
+                columns = find_columns([normalize_cell(v) for v in row], COLUMNS)
+                continue
+            tx = self._row_to_transaction(row, *columns)
+            if tx is not None:
+                yield tx
+
+    @staticmethod
+    def _row_to_transaction(
+            row: Sequence, idx_date: int, idx_desc: int, idx_income: int, idx_expense: int, idx_currency: int
+    ):
+        def cell(idx):
+            value = row[idx] if 0 <= idx < len(row) else None
+            return value.strip() if isinstance(value, str) else value
+
+        date_val = cell(idx_date)
+        if not date_val:
+            return None
+        try:
+            amount = parse_amount(cell(idx_income) or 0) - parse_amount(cell(idx_expense) or 0)
+            if amount == 0:
+                return None
+            desc_val = cell(idx_desc)
+            return Transaction(
+                date=parse_date_robust(date_val),
+                amount=amount,
+                # В выписке код валюты счета: RUR
+                currency={'RUR': 'RUB'}.get(cell(idx_currency), cell(idx_currency) or "RUB"),
+                description=desc_val or "Без описания",
+                category="",
+                comment=""
+            )
+        except ValueError as e:
+            logger.warning("Skipping row error: %s", e)
+            metrics.inc('parser_skipped_rows')
+            return None
@@ -0,0 +1,46 @@
+import logging
+from typing import Iterator, List, Optional, Tuple
+
+from src.core import metrics
+from src.core.interfaces import BaseBankParser, BaseStreamingBankParser
+from src.core.dtypes import FileHead, Transaction
+from src.infrastructure.parsers.sniff import read_head
+
+logger = logging.getLogger(__name__)
+
+
+class ParserRegistry(BaseStreamingBankParser):
+    """
+    Выбирает парсер по началу файла: шапка xlsx читается в read-only режиме,
+    у csv — первые килобайты. Чужой файл отклоняется сразу, без полного чтения.
+    Парсеры проверяются по порядку: более специфичные форматы — раньше общих.
+    Начало файла читается один раз и передается выбранному парсеру.
+    """
+
+    def __init__(self, parsers: List[BaseBankParser]):
+        self.parsers = parsers
+
+    def _sniff(self, file_path: str, head: Optional[FileHead] = None) -> Tuple[Optional[BaseBankParser], FileHead]:
+        if head is None:
+            with metrics.span('sniff'):
+                head = read_head(file_path)
+        parser = next((p for p in self.parsers if p.sniff(head)), None)
+        if parser is None:
+            logger.info("No parser for %s (%s, %d head rows)", file_path, head.kind, len(head.rows))
+        return parser, head
+
+    def detect(self, file_path: str) -> Optional[BaseBankParser]:
+        return self._sniff(file_path)[0]
+
+    def validate_format(self, file_path: str) -> bool:
+        return self.detect(file_path) is not None
+
+    def iter_parse(self, file_path: str, head: Optional[FileHead] = None) -> Iterator[Transaction]:
+        parser, head = self._sniff(file_path, head)
+        if parser is None:
+            raise ValueError("Формат файла не поддерживается.")
+        logger.info("Parsing %s with %s", file_path, type(parser).__name__)
+        if isinstance(parser, BaseStreamingBankParser):
+            yield from parser.iter_parse(file_path, head)
+        else:
+            yield from parser.parse(file_path)
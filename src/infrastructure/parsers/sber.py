@@ -1,47 +1,133 @@
 from datetime import datetime
-from typing import List
-import pandas as pd
+from typing import TYPE_CHECKING, List, Optional, Tuple
+import logging
 import re
 
-from src.core.dtypes import Transaction
+from src.core import metrics
+from src.core.dtypes import FileHead, Transaction
 from src.core.interfaces import BaseBankParser
 
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+# Русские месяцы (в т.ч. в родительном падеже и с точкой: "15 окт. 2023", "1 мая 2024")
+RU_MONTHS = {
+    'янв': '01', 'фев': '02', 'мар': '03', 'апр': '04', 'май': '05', 'мая': '05',
+    'июн': '06', 'июл': '07', 'авг': '08', 'сен': '09', 'окт': '10', 'ноя': '11', 'дек': '12'
+}
+
+DATE_FORMATS = [
+    "%d.%m.%Y %H:%M",
+    "%d.%m.%Y",
+    "%d %m %Y %H:%M",
+    "%d %m %Y",
+    "%Y-%m-%d",
+    # Тинькофф: с секундами; Альфа-Банк: двузначный год
+    "%d.%m.%Y %H:%M:%S",
+    "%d.%m.%y"
+]
+
+
+def resolve_columns(columns: List[str]) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    """Позиции колонок даты, суммы и описания по ключевым словам в нормализованных заголовках."""
+    col_date = next((i for i, c in enumerate(columns) if 'дата' in c), None)
+    col_amount = next((i for i, c in enumerate(columns) if 'сумма в руб' in c), None)
+    if col_amount is None:
+        col_amount = next((i for i, c in enumerate(columns) if 'сумма' in c), None)
+    col_desc = next((i for i, c in enumerate(columns) if 'описание' in c), None)
+    return col_date, col_amount, col_desc
+
+
+def parse_amount(val) -> float:
+    """'1 500,50' (в т.ч. с неразрывным пробелом) -> 1500.5. Бросает ValueError, если это не число."""
+    if isinstance(val, (int, float)):
+        return float(val)
+    return float(str(val).replace('\xa0', '').replace(' ', '').replace(',', '.'))
+
+
+def parse_date_robust(val) -> datetime:
+    """Более надежный парсинг даты."""
+    if isinstance(val, datetime):
+        return val
+
+    val_str = str(val).strip().lower()
+
+    # Заменяем буквенные месяцы на цифры
+    for k, v in RU_MONTHS.items():
+        if k in val_str:
+            val_str = val_str.replace(k, v).replace('.', ' ')
+            break
+
+    # Убираем все лишнее, оставляем цифры, точки, пробелы, двоеточия
+    val_str = re.sub(r'[^\d\s\.:]', '', val_str)
+    val_str = re.sub(r'\s+', ' ', val_str).strip()
+
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(val_str, fmt)
+        except ValueError:
+            continue
+
+    # Fallback: пробуем распарсить просто как день.месяц.год, если год в конце
+    try:
+        parts = val_str.split()
+        if len(parts) >= 3:
+            # Предполагаем формат ДД ММ ГГГГ
+            day, month, year = parts[0], parts[1], parts[2]
+            if len(year) == 4:
+                return datetime(int(year), int(month), int(day))
+    except:
+        pass
+
+    logger.warning("Failed to parse date: %r", val)
+    metrics.inc('parser_date_fallback')
+    return datetime.now()
+
 
 class SberParser(BaseBankParser):
+    def __init__(self, vectorized: bool = False):
+        # vectorized=True: один проход чтения и векторная очистка колонок вместо iterrows
+        self.vectorized = vectorized
+
     def validate_format(self, file_path: str) -> bool:
         return file_path.endswith('.xlsx') or file_path.endswith('.xls')
 
+    def sniff(self, head: FileHead) -> bool:
+        # .xls заглянуть нельзя — принимаем как раньше, по типу файла
+        return head.kind == 'xls' or (head.kind == 'xlsx' and head.find_header('дата', 'сумма') is not None)
+
     def parse(self, file_path: str) -> List[Transaction]:
+        if self.vectorized:
+            return self._parse_vectorized(file_path)
+
+        # pandas грузится при первой выписке, а не при старте бота
+        import pandas as pd
+
         # Читаем "сырой" файл
         df_raw = pd.read_excel(file_path, header=None)
-        start_row = 0
 
         # Ищем заголовок
-        for i, row in df_raw.iterrows():
-            row_str = row.astype(str).str.lower().tolist()
-            if any('дата' in s for s in row_str) and \
-                    (any('сумма' in s for s in row_str) or any('сумма в валюте операции' in s for s in row_str)):
-                start_row = i
-                break
+        start_row = self._find_header_row(df_raw)
 
         # Перечитываем с заголовком
         df = pd.read_excel(file_path, header=start_row)
         # Нормализация имен колонок: нижний регистр, убрать переносы
         df.columns = [str(c).strip().replace('\n', ' ').lower() for c in df.columns]
 
+        # Поиск колонок по ключевым словам (один раз на файл)
+        columns = list(df.columns)
+        idx_date, idx_amount, idx_desc = resolve_columns(columns)
+        if idx_date is None or idx_amount is None:
+            return []
+        col_date, col_amount = columns[idx_date], columns[idx_amount]
+        col_desc = columns[idx_desc] if idx_desc is not None else None
+
         transactions = []
         for _, row in df.iterrows():
             try:
-                # Поиск колонок по ключевым словам
-                col_date = next((c for c in df.columns if 'дата' in c), None)
-                col_amount = next((c for c in df.columns if 'сумма в руб' in c), None)
-                if not col_amount:
-                    col_amount = next((c for c in df.columns if 'сумма' in c), None)
-                col_desc = next((c for c in df.columns if 'описание' in c), None)
-
-                if not col_date or not col_amount:
-                    continue
-
                 date_val = row[col_date]
                 amount_val = row[col_amount]
                 desc_val = row[col_desc] if col_desc else "Без описания"
@@ -67,58 +153,127 @@ class SberParser(BaseBankParser):
                 ))
             except Exception as e:
                 # Логируем ошибку парсинга конкретной строки, но не падаем
-                print(f"Skipping row error: {e}")
+                logger.warning("Skipping row error: %s", e)
+                metrics.inc('parser_skipped_rows')
                 continue
 
         return transactions
 
-    def _parse_date_robust(self, val) -> datetime:
-        """Более надежный парсинг даты."""
-        if isinstance(val, datetime):
-            return val
-
-        val_str = str(val).strip().lower()
-
-        # Словарь замен
-        months = {
-            'янв': '01', 'фев': '02', 'мар': '03', 'апр': '04', 'май': '05', 'мая': '05',
-            'июн': '06', 'июл': '07', 'авг': '08', 'сен': '09', 'окт': '10', 'ноя': '11', 'дек': '12'
-        }
-
-        # Заменяем буквенные месяцы на цифры
-        for k, v in months.items():
-            if k in val_str:
-                val_str = val_str.replace(k, v).replace('.', ' ')
-                break
-
-        # Убираем все лишнее, оставляем цифры, точки, пробелы, двоеточия
-        val_str = re.sub(r'[^\d\s\.:]', '', val_str)
-        val_str = re.sub(r'\s+', ' ', val_str).strip()
-
-        formats = [
-            "%d.%m.%Y %H:%M",
-            "%d.%m.%Y",
-            "%d %m %Y %H:%M",
-            "%d %m %Y",
-            "%Y-%m-%d"
+    @staticmethod
+    def _find_header_row(df_raw: 'pd.DataFrame') -> int:
+        """Номер строки-заголовка: первая строка, где есть 'дата' и 'сумма'. Заголовок обычно в начале файла."""
+        for i, row in enumerate(df_raw.itertuples(index=False)):
+            row_str = [str(v).lower() for v in row]
+            if any('дата' in s for s in row_str) and any('сумма' in s for s in row_str):
+                return i
+        return 0
+
+    def _parse_vectorized(self, file_path: str) -> List[Transaction]:
+        """Один pd.read_excel, колонки определяются один раз, суммы и даты чистятся векторно."""
+        import pandas as pd
+
+        df_raw = pd.read_excel(file_path, header=None, dtype=object)
+        header_pos = self._find_header_row(df_raw)
+
+        columns = [str(c).strip().replace('\n', ' ').lower() for c in df_raw.iloc[header_pos]]
+        idx_date, idx_amount, idx_desc = resolve_columns(columns)
+        if idx_date is None or idx_amount is None:
+            return []
+
+        data = df_raw.iloc[header_pos + 1:]
+        date_raw = data.iloc[:, idx_date]
+        amount_raw = data.iloc[:, idx_amount]
+
+        # Очистка суммы: '1 500,50' -> 1500.50; нечисловые значения -> NaN и строка отбрасывается
+        amounts = pd.to_numeric(
+            amount_raw.astype(str)
+            .str.replace('\xa0', '', regex=False)
+            .str.replace(' ', '', regex=False)
+            .str.replace(',', '.', regex=False),
+            errors='coerce'
+        )
+
+        keep = date_raw.notna() & amount_raw.notna() & amounts.notna()
+        date_raw = date_raw[keep]
+        amounts = amounts[keep]
+
+        if idx_desc is not None:
+            descriptions = data.iloc[:, idx_desc][keep].map(str).str.strip().tolist()
+        else:
+            descriptions = ["Без описания"] * int(keep.sum())
+
+        dates = self._parse_dates_vectorized(date_raw)
+
+        return [
+            Transaction(
+                date=dt,
+                amount=float(amount),
+                currency="RUB",
+                description=desc,
+                category="",
+                comment=""
+            )
+            for dt, amount, desc in zip(dates, amounts.tolist(), descriptions)
         ]
 
-        for fmt in formats:
-            try:
-                return datetime.strptime(val_str, fmt)
-            except ValueError:
-                continue
+    @staticmethod
+    def _parse_dates_vectorized(values: 'pd.Series') -> List[datetime]:
+        """Векторный аналог _parse_date_robust: перебор форматов через pd.to_datetime по всей колонке."""
+        import pandas as pd
 
-        # Fallback: пробуем распарсить просто как день.месяц.год, если год в конце
-        try:
-            parts = val_str.split()
-            if len(parts) >= 3:
-                # Предполагаем формат ДД ММ ГГГГ
-                day, month, year = parts[0], parts[1], parts[2]
-                if len(year) == 4:
-                    return datetime(int(year), int(month), int(day))
-        except:
-            pass
-
-        print(f"!!! Failed to parse date: {val}")
-        return datetime.now()
\ No newline at end of file
+        is_datetime = values.map(lambda v: isinstance(v, datetime)).astype(bool)
+        result = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+        result[is_datetime] = pd.to_datetime(values[is_datetime])
+
+        text = values[~is_datetime].astype(str).str.strip().str.lower()
+        parsed = pd.Series(pd.NaT, index=text.index, dtype='datetime64[ns]')
+
+        def try_formats(source: 'pd.Series'):
+            for fmt in DATE_FORMATS:
+                missing = parsed.isna()
+                if not missing.any():
+                    return
+                parsed[missing] = pd.to_datetime(source[missing], format=fmt, errors='coerce')
+
+        # Быстрый путь: обычные "15.10.2023 12:30" разбираются без регулярок
+        try_formats(text)
+
+        # Остальное чистим как _parse_date_robust: буквенный месяц -> номер, точки -> пробелы
+        missing = parsed.isna()
+        if missing.any():
+            dirty = text[missing]
+            month_pattern = '|'.join(RU_MONTHS)
+            has_month = dirty.str.contains(month_pattern, regex=True)
+            dirty[has_month] = (
+                dirty[has_month]
+                .str.replace(month_pattern, lambda m: RU_MONTHS[m.group(0)], regex=True)
+                .str.replace('.', ' ', regex=False)
+            )
+            text = text.copy()
+            text[missing] = (
+                dirty.str.replace(r'[^\d\s\.:]', '', regex=True)
+                .str.replace(r'\s+', ' ', regex=True)
+                .str.strip()
+            )
+            try_formats(text)
+
+        # Fallback: "ДД ММ ГГГГ ..." с лишним хвостом
+        missing = parsed.isna()
+        if missing.any():
+            parts = text[missing].str.extract(r'^(\d{1,2}) (\d{1,2}) (\d{4})(?:\s|$)')
+            parsed[missing] = pd.to_datetime(
+                parts[2] + '-' + parts[1] + '-' + parts[0], format="%Y-%m-%d", errors='coerce'
+            )
+
+        result[~is_datetime] = parsed
+        failed = result.isna()
+        if failed.any():
+            for val in values[failed]:
+                logger.warning("Failed to parse date: %r", val)
+            metrics.inc('parser_date_fallback', int(failed.sum()))
+            result[failed] = pd.Timestamp(datetime.now())
+
+        return list(result.dt.to_pydatetime())
+
+    def _parse_date_robust(self, val) -> datetime:
+        return parse_date_robust(val)
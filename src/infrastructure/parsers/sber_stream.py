@@ -0,0 +1,78 @@
+from typing import Iterator, Optional, Sequence
+import logging
+
+from src.core import metrics
+from src.core.dtypes import FileHead, Transaction
+from src.core.interfaces import BaseStreamingBankParser
+from src.infrastructure.parsers.sber import parse_date_robust, resolve_columns
+
+logger = logging.getLogger(__name__)
+
+
+class SberStreamParser(BaseStreamingBankParser):
+    """
+    Потоковый парсер выписки Сбера для очень больших файлов (50–100 МБ).
+    openpyxl в режиме read_only читает лист построчно, поэтому потребление
+    памяти не зависит от размера файла; транзакции отдаются генератором.
+    """
+
+    def validate_format(self, file_path: str) -> bool:
+        # read_only-режим openpyxl не умеет старый .xls
+        return file_path.endswith('.xlsx')
+
+    def sniff(self, head: FileHead) -> bool:
+        return head.kind == 'xlsx' and head.find_header('дата', 'сумма') is not None
+
+    def iter_parse(self, file_path: str, head: Optional[FileHead] = None) -> Iterator[Transaction]:
+        # Заголовок ищется на лету при чтении листа, начало файла не нужно
+        import openpyxl
+
+        wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            ws = wb.active
+            columns = None
+            for row in ws.iter_rows(values_only=True):
+                # Заголовок ищем на лету: первая строка, где есть 'дата' и 'сумма'
+                if columns is None:
+                    row_str = [str(v).strip().replace('\n', ' ').lower() for v in row]
+                    if any('дата' in s for s in row_str) and any('сумма' in s for s in row_str):
+                        columns = resolve_columns(row_str)
+                    continue
+
+                tx = self._row_to_transaction(row, *columns)
+                if tx is not None:
+                    yield tx
+        finally:
+            wb.close()
+
+    @staticmethod
+    def _row_to_transaction(
+            row: Sequence,
+            idx_date: Optional[int],
+            idx_amount: Optional[int],
+            idx_desc: Optional[int]
+    ) -> Optional[Transaction]:
+        if idx_date is None or idx_amount is None:
+            return None
+        try:
+            date_val = row[idx_date] if idx_date < len(row) else None
+            amount_val = row[idx_amount] if idx_amount < len(row) else None
+            desc_val = row[idx_desc] if idx_desc is not None and idx_desc < len(row) else None
+
+            if date_val is None or amount_val is None or str(amount_val).strip() == '':
+                return None
+
+            amount_str = str(amount_val).replace('\xa0', '').replace(' ', '').replace(',', '.')
+            return Transaction(
+                date=parse_date_robust(date_val),
+                amount=float(amount_str),
+                currency="RUB",
+                description=str(desc_val).strip() if desc_val is not None else "Без описания",
+                category="",
+                comment=""
+            )
+        except Exception as e:
+            # Логируем ошибку парсинга конкретной строки, но не падаем
+            logger.warning("Skipping row error: %s", e)
+            metrics.inc('parser_skipped_rows')
+            return None
@@ -0,0 +1,105 @@
+import codecs
+import csv
+import io
+import logging
+import zipfile
+from typing import Iterator, List, Sequence
+
+from src.core.dtypes import FileHead
+
+logger = logging.getLogger(__name__)
+
+XLSX_MAGIC = b'PK\x03\x04'
+# OLE2-контейнер старого Excel (.xls)
+XLS_MAGIC = b'\xd0\xcf\x11\xe0'
+
+CSV_DELIMITERS = (';', ',', '\t')
+# Банки отдают CSV либо в UTF-8 (часто с BOM), либо в Windows-1251
+CSV_ENCODINGS = ('utf-8-sig', 'cp1251')
+
+
+def normalize_cell(value) -> str:
+    if value is None:
+        return ''
+    return str(value).strip().replace('\n', ' ').lower()
+
+
+def _decode_head(raw: bytes) -> tuple:
+    """(текст, кодировка). Последний символ UTF-8 может быть обрезан границей чтения — это не ошибка."""
+    for encoding in CSV_ENCODINGS:
+        try:
+            return codecs.getincrementaldecoder(encoding)().decode(raw, final=False), encoding
+        except UnicodeDecodeError:
+            continue
+    return raw.decode('latin-1'), 'latin-1'
+
+
+def read_head(file_path: str, max_rows: int = 30, max_bytes: int = 64 * 1024) -> FileHead:
+    """
+    Тип файла и первые max_rows строк таблицы. Для xlsx читается только начало
+    листа (openpyxl read-only), для csv — не больше max_bytes с начала файла.
+    """
+    with open(file_path, 'rb') as f:
+        raw = f.read(max_bytes)
+        truncated = bool(f.read(1))
+
+    if raw.startswith(XLSX_MAGIC):
+        # openpyxl (~0.3 с импорта) грузится при первом xlsx, а не при старте бота
+        import openpyxl
+
+        try:
+            wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        except (zipfile.BadZipFile, KeyError, OSError, ValueError) as e:
+            logger.info("Not an xlsx workbook %s: %s", file_path, e)
+            return FileHead('unknown', [])
+        try:
+            sheet_rows = wb.active.iter_rows(max_row=max_rows, values_only=True)
+            rows = [[normalize_cell(v) for v in row] for row in sheet_rows]
+        finally:
+            wb.close()
+        return FileHead('xlsx', rows)
+
+    if raw.startswith(XLS_MAGIC):
+        # Без xlrd заглянуть внутрь .xls дешево нельзя — решают по типу файла
+        return FileHead('xls', [])
+
+    if b'\x00' in raw:
+        return FileHead('unknown', [])
+
+    text, encoding = _decode_head(raw)
+    lines = text.splitlines()
+    if truncated and lines:
+        # Последняя строка могла оборваться на границе чтения
+        lines.pop()
+    lines = lines[:max_rows]
+    if not lines:
+        return FileHead('unknown', [])
+
+    sample = "\n".join(lines)
+    delimiter = max(CSV_DELIMITERS, key=sample.count)
+    if sample.count(delimiter) == 0:
+        return FileHead('unknown', [])
+
+    rows = [[normalize_cell(v) for v in row] for row in csv.reader(io.StringIO(sample), delimiter=delimiter)]
+    return FileHead('csv', rows, encoding=encoding, delimiter=delimiter)
+
+
+def iter_table_rows(file_path: str, head: FileHead) -> Iterator[Sequence]:
+    """Все строки таблицы по одной: csv — значения строками, xlsx — значения ячеек как есть."""
+    if head.kind == 'csv':
+        with open(file_path, encoding=head.encoding, newline='') as f:
+            yield from csv.reader(f, delimiter=head.delimiter)
+        return
+
+    import openpyxl
+
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        yield from wb.active.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def find_columns(header: List[str], keywords: Sequence[str]) -> List[int]:
+    """Позиция первой колонки, содержащей ключевое слово, для каждого слова (-1, если нет)."""
+    return [next((i for i, c in enumerate(header) if k in c), -1) for k in keywords]
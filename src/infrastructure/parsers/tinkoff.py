@@ -0,0 +1,71 @@
+import logging
+from typing import Iterator, Optional, Sequence
+
+from src.core import metrics
+from src.core.dtypes import FileHead, Transaction
+from src.core.interfaces import BaseStreamingBankParser
+from src.infrastructure.parsers.sber import parse_amount, parse_date_robust
+from src.infrastructure.parsers.sniff import find_columns, iter_table_rows, normalize_cell, read_head
+
+logger = logging.getLogger(__name__)
+
+# Колонки выгрузки "Операции" Тинькофф (одинаковые в CSV и XLSX)
+HEADER_KEYWORDS = ('дата операции', 'сумма операции', 'статус')
+COLUMNS = ('дата операции', 'сумма операции', 'валюта операции', 'описание', 'статус')
+
+
+class TinkoffParser(BaseStreamingBankParser):
+    """
+    Выгрузка операций Тинькофф: CSV (Windows-1251, ';') или XLSX с той же шапкой.
+    Отклоненные операции (статус FAILED) пропускаются.
+    """
+
+    def validate_format(self, file_path: str) -> bool:
+        return self.sniff(read_head(file_path))
+
+    def sniff(self, head: FileHead) -> bool:
+        return head.kind in ('csv', 'xlsx') and head.find_header(*HEADER_KEYWORDS) is not None
+
+    def iter_parse(self, file_path: str, head: Optional[FileHead] = None) -> Iterator[Transaction]:
+        head = head or read_head(file_path)
+        header_pos = head.find_header(*HEADER_KEYWORDS)
+        if header_pos is None:
+            return
+
+        columns = None
+        for i, row in enumerate(iter_table_rows(file_path, head)):
+            if i < header_pos:
+                continue
+            if columns is None:
+                columns = find_columns([normalize_cell(v) for v in row], COLUMNS)
+                continue
+            tx = self._row_to_transaction(row, *columns)
+            if tx is not None:
+                yield tx
+
+    @staticmethod
+    def _row_to_transaction(
+            row: Sequence, idx_date: int, idx_amount: int, idx_currency: int, idx_desc: int, idx_status: int
+    ):
+        def cell(idx):
+            return row[idx] if 0 <= idx < len(row) else None
+
+        if normalize_cell(cell(idx_status)) == 'failed':
+            return None
+        date_val, amount_val = cell(idx_date), cell(idx_amount)
+        if date_val in (None, '') or amount_val in (None, ''):
+            return None
+        try:
+            desc_val = cell(idx_desc)
+            return Transaction(
+                date=parse_date_robust(date_val),
+                amount=parse_amount(amount_val),
+                currency=str(cell(idx_currency) or "RUB").strip(),
+                description=str(desc_val).strip() if desc_val not in (None, '') else "Без описания",
+                category="",
+                comment=""
+            )
+        except ValueError as e:
+            logger.warning("Skipping row error: %s", e)
+            metrics.inc('parser_skipped_rows')
+            return None
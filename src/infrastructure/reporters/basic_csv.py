@@ -3,28 +3,34 @@ import io
 from typing import List
 
 from src.core.dtypes import Transaction, ExportFile
-from src.core.interfaces import BaseReportGenerator
-
-
-class BasicCSVReportGenerator(BaseReportGenerator):
-    def generate(self, transactions: List[Transaction]) -> ExportFile:
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Дата', 'Сумма', 'Валюта', 'Описание', 'Категория', 'Комментарий'])
-
-        for tx in transactions:
-            writer.writerow([
-                tx.date.strftime("%Y-%m-%d"),
-                tx.amount,
-                tx.currency,
-                tx.description,
-                tx.category,
-                tx.comment
-            ])
-
-        output.seek(0)
-        # Конвертируем в BytesIO для отправки телеграмом
-        return ExportFile(
-            'csv',
-            io.BytesIO(output.getvalue().encode('utf-8'))
-        )
+from src.core.interfaces import BaseReportWriter, BaseStreamingReportGenerator
+from src.infrastructure.reporters.common import REPORT_HEADER, SPOOL_MAX_SIZE, report_row, spooled_file
+
+
+class _CSVReportWriter(BaseReportWriter):
+    def __init__(self, max_size: int):
+        self._file = spooled_file(max_size)
+        # Текст кодируется сразу в файл, без промежуточной строки со всем отчетом
+        self._text = io.TextIOWrapper(self._file, encoding='utf-8', newline='')
+        self._writer = csv.writer(self._text)
+        self._writer.writerow(REPORT_HEADER)
+
+    def write(self, transactions: List[Transaction]):
+        self._writer.writerows(report_row(tx) for tx in transactions)
+
+    def finish(self) -> ExportFile:
+        self._text.flush()
+        self._text.detach()
+        self._file.seek(0)
+        return ExportFile('csv', self._file)
+
+    def close(self):
+        self._file.close()
+
+
+class BasicCSVReportGenerator(BaseStreamingReportGenerator):
+    def __init__(self, spool_max_size: int = SPOOL_MAX_SIZE):
+        self.spool_max_size = spool_max_size
+
+    def open(self) -> BaseReportWriter:
+        return _CSVReportWriter(self.spool_max_size)
@@ -0,0 +1,17 @@
+import tempfile
+from typing import BinaryIO
+
+from src.core.dtypes import Transaction
+
+REPORT_HEADER = ['Дата', 'Сумма', 'Валюта', 'Описание', 'Категория', 'Комментарий']
+
+# До этого размера отчет держится в памяти, дальше сбрасывается на диск
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+def spooled_file(max_size: int = SPOOL_MAX_SIZE) -> BinaryIO:
+    return tempfile.SpooledTemporaryFile(max_size=max_size, mode='w+b')
+
+
+def report_row(tx: Transaction) -> list:
+    return [tx.date.strftime("%Y-%m-%d"), tx.amount, tx.currency, tx.description, tx.category, tx.comment]
@@ -0,0 +1,74 @@
+import importlib.util
+from typing import List
+
+from src.core.dtypes import Transaction, ExportFile
+from src.core.interfaces import BaseReportWriter, BaseStreamingReportGenerator
+from src.infrastructure.reporters.common import SPOOL_MAX_SIZE, spooled_file
+
+# Английские имена колонок: Parquet читают pandas/duckdb/Spark, а не человек
+COLUMNS = ['date', 'amount', 'currency', 'description', 'category', 'comment']
+
+
+class _ParquetReportWriter(BaseReportWriter):
+    def __init__(self, max_size: int, row_group_size: int):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._schema = pa.schema([
+            ('date', pa.date32()),
+            ('amount', pa.float64()),
+            ('currency', pa.string()),
+            ('description', pa.string()),
+            ('category', pa.string()),
+            ('comment', pa.string()),
+        ])
+        self._file = spooled_file(max_size)
+        self._writer = pq.ParquetWriter(self._file, self._schema, compression='zstd')
+        self._row_group_size = row_group_size
+        self._buffer: List[Transaction] = []
+
+    def write(self, transactions: List[Transaction]):
+        self._buffer.extend(transactions)
+        # Буферизуем до полной группы строк: мелкие группы раздувают файл и замедляют чтение
+        while len(self._buffer) >= self._row_group_size:
+            self._flush(self._buffer[:self._row_group_size])
+            self._buffer = self._buffer[self._row_group_size:]
+
+    def _flush(self, transactions: List[Transaction]):
+        table = self._pa.Table.from_pydict({
+            'date': [tx.date.date() for tx in transactions],
+            'amount': [tx.amount for tx in transactions],
+            'currency': [tx.currency for tx in transactions],
+            'description': [tx.description for tx in transactions],
+            'category': [tx.category for tx in transactions],
+            'comment': [tx.comment for tx in transactions],
+        }, schema=self._schema)
+        self._writer.write_table(table)
+
+    def finish(self) -> ExportFile:
+        if self._buffer:
+            self._flush(self._buffer)
+            self._buffer = []
+        self._writer.close()
+        self._file.seek(0)
+        return ExportFile('parquet', self._file)
+
+    def close(self):
+        self._writer.close()
+        self._file.close()
+
+
+class ParquetReportGenerator(BaseStreamingReportGenerator):
+    """Отчет в Parquet. Нужен pyarrow (необязательная зависимость)."""
+
+    def __init__(self, spool_max_size: int = SPOOL_MAX_SIZE, row_group_size: int = 10_000):
+        self.spool_max_size = spool_max_size
+        self.row_group_size = max(1, row_group_size)
+
+    @staticmethod
+    def is_available() -> bool:
+        return importlib.util.find_spec('pyarrow') is not None
+
+    def open(self) -> BaseReportWriter:
+        return _ParquetReportWriter(self.spool_max_size, self.row_group_size)
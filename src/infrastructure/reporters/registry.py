@@ -0,0 +1,24 @@
+import logging
+from typing import Dict
+
+from src.core.interfaces import BaseReportGenerator
+from src.infrastructure.reporters.basic_csv import BasicCSVReportGenerator
+from src.infrastructure.reporters.parquet import ParquetReportGenerator
+from src.infrastructure.reporters.xlsx import XLSXReportGenerator
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPORT_FORMAT = 'csv'
+
+
+def build_report_generators(spool_max_size: int) -> Dict[str, BaseReportGenerator]:
+    """Форматы отчета, доступные в этой установке: расширение -> генератор."""
+    generators: Dict[str, BaseReportGenerator] = {
+        'csv': BasicCSVReportGenerator(spool_max_size),
+        'xlsx': XLSXReportGenerator(spool_max_size),
+    }
+    if ParquetReportGenerator.is_available():
+        generators['parquet'] = ParquetReportGenerator(spool_max_size)
+    else:
+        logger.info("pyarrow is not installed, parquet reports are disabled")
+    return generators
@@ -0,0 +1,39 @@
+from typing import List
+
+from src.core.dtypes import Transaction, ExportFile
+from src.core.interfaces import BaseReportWriter, BaseStreamingReportGenerator
+from src.infrastructure.reporters.common import REPORT_HEADER, SPOOL_MAX_SIZE, spooled_file
+
+
+class _XLSXReportWriter(BaseReportWriter):
+    def __init__(self, max_size: int):
+        # Как pyarrow у Parquet: openpyxl грузится при первом отчете в xlsx
+        import openpyxl
+
+        self._file = spooled_file(max_size)
+        # write-only: строки не держатся в памяти объектами ячеек, а сразу уходят в XML листа
+        self._workbook = openpyxl.Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet("Отчет")
+        self._sheet.append(REPORT_HEADER)
+
+    def write(self, transactions: List[Transaction]):
+        for tx in transactions:
+            # Дата и сумма — значения, а не текст: в Excel по ним можно фильтровать и считать
+            self._sheet.append([tx.date.date(), tx.amount, tx.currency, tx.description, tx.category, tx.comment])
+
+    def finish(self) -> ExportFile:
+        self._workbook.save(self._file)
+        self._file.seek(0)
+        return ExportFile('xlsx', self._file)
+
+    def close(self):
+        self._workbook.close()
+        self._file.close()
+
+
+class XLSXReportGenerator(BaseStreamingReportGenerator):
+    def __init__(self, spool_max_size: int = SPOOL_MAX_SIZE):
+        self.spool_max_size = spool_max_size
+
+    def open(self) -> BaseReportWriter:
+        return _XLSXReportWriter(self.spool_max_size)
@@ -1,25 +1,67 @@
 import asyncio
 import logging
+import math
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Tuple
+
 import yaml
 from aiogram import Bot, Dispatcher
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from sqlalchemy.ext.asyncio import async_sessionmaker
 
-from src.infrastructure.database.models import Base
-from src.infrastructure.reporters.basic_csv import BasicCSVReportGenerator
-from src.infrastructure.llm.yandex import YandexGPTProvider
-from src.infrastructure.llm.ollama import OllamaProvider
+from src.infrastructure.database.engine import build_engine
+from src.infrastructure.database.cache import CategorizationCache
+from src.infrastructure.database.transactions import TransactionStore
+from src.infrastructure.database.rules import RuleStore
+from src.infrastructure.database.users import UserCache
+from src.infrastructure.database.notes import NoteBuffer
+from src.infrastructure.database.fsm import SQLEventIsolation, SQLStorage
+from src.infrastructure.reporters.registry import DEFAULT_REPORT_FORMAT, build_report_generators
+from src.infrastructure.llm.hedged import HedgedProvider
 from src.infrastructure.parsers.sber import SberParser
+from src.infrastructure.parsers.sber_stream import SberStreamParser
+from src.infrastructure.parsers.tinkoff import TinkoffParser
+from src.infrastructure.parsers.alfa import AlfaCSVParser
+from src.infrastructure.parsers.registry import ParserRegistry
 from src.core.processor import Processor
+from src.core.jobs import JobQueue, requeue_interrupted
+from src.core.warmup import Warmup
 from src.bot.middlewares import AuthMiddleware
-from src.bot.handlers import common, settings
+from src.bot.handlers import common, settings, jobs, stats
 from dotenv import load_dotenv
 
+# Тяжелое для старта импортируется там, где нужно:
+# провайдеры LLM — только выбранные, FastAPI и uvicorn — для /metrics и webhook,
+# pandas и openpyxl — парсерами и отчетами при первой выписке (или фоновым прогревом)
 
-async def main():
-    logging.basicConfig(level=logging.INFO)
 
-    # 1. Загрузка конфигов
+def build_llm_provider(provider_type: str, config: dict, max_connections: int, timeout: float):
+    if provider_type == "yandex":
+        from src.infrastructure.llm.yandex import YandexGPTProvider
+
+        return YandexGPTProvider(
+            api_key=config['yandex_api_key'],
+            folder_id=config['yandex_folder_id'],
+            model_name=config['yandex_model_name'],
+            max_connections=max_connections,
+            timeout=timeout
+        )
+    if provider_type == "ollama":
+        from src.infrastructure.llm.ollama import OllamaProvider
+
+        return OllamaProvider(
+            config['ollama_url'],
+            config['ollama_model'],
+            max_connections=max_connections,
+            timeout=timeout,
+            streaming=config['processing'].get('ollama_streaming', False)
+        )
+    raise ValueError(f"Unknown LLM provider: {provider_type}")
+
+
+def load_config() -> dict:
     load_dotenv('config/.env')  # грузит .env
     with open('config/config.yaml', 'r', encoding='utf-8') as f:
         config_yaml = yaml.safe_load(f)
@@ -37,63 +79,290 @@ async def main():
         'yandex_api_key': os.getenv("YANDEX_CLOUD_API_KEY"),
         'yandex_folder_id': os.getenv("YANDEX_CLOUD_FOLDER"),
         'yandex_model_name': os.getenv("YANDEX_CLOUD_MODEL", "yandexgpt-lite"),
+        # Свой сервер Bot API (telegram-bot-api); по умолчанию api.telegram.org
+        'telegram_api_url': os.getenv("TELEGRAM_API_URL"),
+        # polling — один процесс; webhook — FastAPI в нескольких процессах uvicorn
+        'mode': os.getenv("BOT_MODE", "polling").lower(),
+        'webhook_url': os.getenv("WEBHOOK_URL"),
+        'webhook_secret': os.getenv("TELEGRAM_WEBHOOK_SECRET"),
     }
+    return config
+
+
+def warmup_modules(config: dict) -> List[str]:
+    """Модули, которые нужны первой выписке: openpyxl — всегда (определение формата, отчет xlsx)."""
+    modules = ['openpyxl']
+    if not config['processing'].get('streaming_parser', False):
+        modules.append('pandas')
+    return modules
+
+
+def create_bot(config: dict) -> Bot:
+    session = None
+    if config.get('telegram_api_url'):
+        session = AiohttpSession(api=TelegramAPIServer.from_base(config['telegram_api_url']))
+    return Bot(token=config['token'], session=session)
+
+
+async def build_dispatcher(config: dict) -> Tuple[Bot, Dispatcher]:
+    """
+    Собирает зависимости, бота и диспетчер; старт и остановка зарегистрированы в dp.startup/dp.shutdown.
+    В режиме webhook каждый процесс собирает свои, а общее между процессами
+    (FSM, блокировки чатов, очередь выписок) живет в БД.
+    """
+    webhook = config['mode'] == 'webhook'
+    webhook_config = config.get('webhook', {})
 
     # 2. Инициализация инфраструктуры
-    engine = create_async_engine(config['db_url'], echo=False)
+    # Схема БД создается и обновляется миграциями: alembic upgrade head (см. Dockerfile)
+    engine = build_engine(config['db_url'], config.get('database', {}))
     async_session = async_sessionmaker(engine, expire_on_commit=False)
 
-    # Создаем таблицы (в проде лучше использовать Alembic)
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-
     # 3. Сборка зависимостей (DI)
-    bank_parser = SberParser()
-    report_gen = BasicCSVReportGenerator()
+    if config['processing'].get('streaming_parser', False):
+        sber_parser = SberStreamParser()
+    else:
+        sber_parser = SberParser(vectorized=config['processing'].get('vectorized_parser', False))
+    # Банк определяется по шапке файла; Сбер — последним, он принимает любой Excel с датой и суммой
+    bank_parser = ParserRegistry([TinkoffParser(), AlfaCSVParser(), sber_parser])
+    # Отчет пишется во временный файл: в памяти до spool_max_mb, дальше на диске
+    reports_config = config.get('reports', {})
+    report_formats = build_report_generators(
+        spool_max_size=int(reports_config.get('spool_max_mb', 8) * 1024 * 1024)
+    )
+    report_gen = report_formats[DEFAULT_REPORT_FORMAT]
 
-    provider_type = os.getenv("LLM_PROVIDER_TYPE", "ollama").lower()
+    # Парсинг выписок и генерация отчетов — вне event loop: потоки или отдельные процессы
+    executor_workers = config['processing'].get('executor_workers', 2)
+    if config['processing'].get('executor', 'thread') == 'process':
+        cpu_executor = ProcessPoolExecutor(max_workers=executor_workers)
+    else:
+        cpu_executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix='fingram-cpu')
 
-    if provider_type == "yandex":
-        llm_provider = YandexGPTProvider(
-            api_key=config['yandex_api_key'],
-            folder_id=config['yandex_folder_id'],
-            model_name=config['yandex_model_name']
+    # Один провайдер или несколько через запятую (первый — основной): "ollama,yandex"
+    provider_types = [t.strip() for t in os.getenv("LLM_PROVIDER_TYPE", "ollama").lower().split(",") if t.strip()]
+    max_concurrency = config['processing'].get('max_concurrency', 4)
+    max_concurrency_limit = config['processing'].get('max_concurrency_limit', max_concurrency)
+    llm_timeout = config['processing'].get('llm_timeout_seconds', 120)
+
+    hedging = config.get('llm_hedging', {})
+    hedged = len(provider_types) > 1 or hedging.get('enabled', False)
+    max_connections = max_concurrency_limit
+    if hedged:
+        # Запас соединений под дубли: без него дубль ждет в очереди коннектора за основными запросами
+        max_connections += math.ceil(max_concurrency_limit * hedging.get('max_hedge_ratio', 0.1))
+    providers = [
+        build_llm_provider(t, config, max_connections, llm_timeout) for t in provider_types
+    ]
+    if hedged:
+        # Дубль запроса после p95 задержки и переключение на запасной провайдер при ошибках
+        llm_provider = HedgedProvider(
+            providers,
+            names=provider_types,
+            quantile=hedging.get('quantile', 0.95),
+            initial_delay=hedging.get('initial_delay_seconds', 5.0),
+            min_delay=hedging.get('min_delay_seconds', 0.2),
+            max_hedge_ratio=hedging.get('max_hedge_ratio', 0.1),
+            failure_threshold=hedging.get('failure_threshold', 3),
+            cooldown=hedging.get('cooldown_seconds', 30)
         )
-        logging.info("Using YandexGPT provider")
     else:
-        llm_provider = OllamaProvider(
-            config['ollama_url'],
-            config['ollama_model']
-        )
-        logging.info("Using Ollama provider")
+        llm_provider = providers[0]
+    logging.info("Using LLM providers: %s", ", ".join(provider_types))
+
+    # Заметки пишутся пачками: до max_batch штук или раз в max_delay_ms
+    notes_config = config.get('notes', {})
+    note_buffer = NoteBuffer(
+        async_session,
+        max_batch=notes_config.get('max_batch', 100),
+        max_delay=notes_config.get('max_delay_ms', 300) / 1000
+    )
+
+    categorization_cache = CategorizationCache()
+    rule_store = RuleStore()
 
-    # Дальнейшая инициализация processor не меняется
     processor = Processor(
         parser=bank_parser,
         llm=llm_provider,
         report_gen=report_gen,
-        window_days=config['processing']['search_window_days']
+        window_days=config['processing']['search_window_days'],
+        max_concurrency=max_concurrency,
+        max_concurrency_limit=max_concurrency_limit,
+        batch_size=config['processing'].get('llm_batch_size', 1),
+        cache=categorization_cache,
+        store=TransactionStore(),
+        rules=rule_store,
+        similarity_threshold=config['processing'].get('similarity_threshold'),
+        similarity_examples=config['processing'].get('similarity_examples', 5000),
+        report_formats=report_formats,
+        session_maker=async_session,
+        executor=cpu_executor,
+        note_buffer=note_buffer
     )
+    # Строки выписок рядом с новыми заметками помечаются в транзакции их вставки
+    note_buffer.on_flush = processor.notes_added
 
     # 4. Бот
-    bot = Bot(token=config['token'])
-    dp = Dispatcher()
+    bot = create_bot(config)
+    if webhook:
+        # Следующий апдейт чата может прийти в другой процесс: состояние диалога и
+        # очередность обработки событий чата — через БД
+        dp = Dispatcher(storage=SQLStorage(async_session), events_isolation=SQLEventIsolation(
+            async_session, ttl=webhook_config.get('event_lock_ttl_seconds', 60)
+        ))
+    else:
+        dp = Dispatcher()
+
+    # Очередь обработки выписок
+    jobs_config = config.get('jobs', {})
+    job_queue = JobQueue(
+        session_maker=async_session,
+        processor=processor,
+        deliver=jobs.build_job_notifier(bot),
+        workers=jobs_config.get('workers', 2),
+        per_user_limit=jobs_config.get('per_user_limit', 1),
+        progress=jobs.build_progress_tracker(
+            bot,
+            interval=jobs_config.get('progress_interval_seconds', 5),
+            checkpoints=jobs_config.get('partial_report_rows', [])
+        ),
+        # В webhook оборванные задачи возвращает в очередь запуск до старта процессов,
+        # а задачи, поставленные другими процессами, забираются опросом БД
+        recover=not webhook,
+        poll_interval=webhook_config.get('jobs_poll_seconds', 5) if webhook else None
+    )
 
     # Middleware
-    dp.message.middleware(AuthMiddleware(async_session, config))
+    users_config = config.get('users', {})
+    cache_ttl = users_config.get('cache_ttl_seconds', 300)
+    if webhook:
+        # Сброс кэша после /set_* видит только свой процесс: у остальных профиль живет не дольше этого
+        cache_ttl = min(cache_ttl, webhook_config.get('user_cache_ttl_seconds', 5))
+    user_cache = UserCache(
+        ttl=cache_ttl,
+        max_size=users_config.get('cache_size', 1024)
+    )
+    dp.message.middleware(AuthMiddleware(async_session, config, user_cache))
 
     # Внедряем зависимости в хендлеры
     # Простой способ DI через workflow_data
     dp["processor"] = processor
     dp["bot"] = bot
+    dp["job_queue"] = job_queue
+    dp["rule_store"] = rule_store
+    dp["note_buffer"] = note_buffer
+
+    # Жизненный цикл: HTTP-сессия LLM-провайдера и воркеры очереди
+    # (воркеры останавливаются раньше, чем закрывается сессия)
+    dp.startup.register(llm_provider.start)
+    dp.startup.register(job_queue.start)
+    dp.shutdown.register(job_queue.stop)
+    # Недописанные заметки сохраняются при остановке
+    dp.shutdown.register(note_buffer.stop)
+    dp.shutdown.register(llm_provider.close)
+
+    async def shutdown_executor():
+        cpu_executor.shutdown(wait=False, cancel_futures=True)
+
+    dp.shutdown.register(shutdown_executor)
+    dp.shutdown.register(engine.dispose)
+
+    # Prometheus: /metrics в том же процессе (в webhook — в самом приложении webhook)
+    metrics_config = config.get('metrics', {})
+    if metrics_config.get('enabled', False) and not webhook:
+        from src.api.metrics import MetricsServer
+
+        metrics_server = MetricsServer(
+            host=metrics_config.get('host', '127.0.0.1'),
+            port=metrics_config.get('port', 9100)
+        )
+        dp.startup.register(metrics_server.start)
+        dp.shutdown.register(metrics_server.stop)
+
+    # Прогрев: pandas и openpyxl грузятся в фоне, когда бот уже отвечает
+    startup_config = config.get('startup', {})
+    if startup_config.get('warmup', True):
+        warmup = Warmup(warmup_modules(config), delay=startup_config.get('warmup_delay_seconds', 1))
+        dp.startup.register(warmup.start)
+        dp.shutdown.register(warmup.stop)
 
     # Роутеры
     dp.include_router(settings.router)
+    dp.include_router(jobs.router)
+    dp.include_router(stats.router)
     dp.include_router(common.router)
+    return bot, dp
 
+
+async def main(config: dict):
+    bot, dp = await build_dispatcher(config)
     logging.info("🚀 Bot started")
     await dp.start_polling(bot)
 
 
+def require_webhook_secret(config: dict):
+    """Без секрета публичный webhook принял бы апдейт от кого угодно — такой режим не запускаем."""
+    if not config['webhook_secret']:
+        raise ValueError("TELEGRAM_WEBHOOK_SECRET is required in webhook mode")
+
+
+def create_webhook_server():
+    """Фабрика приложения для uvicorn (--factory): вызывается в каждом процессе-воркере."""
+    from src.api.webhook import create_webhook_app
+
+    logging.basicConfig(level=logging.INFO)
+    config = load_config()
+    require_webhook_secret(config)
+    return create_webhook_app(lambda: build_dispatcher(config), secret_token=config['webhook_secret'])
+
+
+async def prepare_webhook(config: dict):
+    """Один раз до запуска воркеров: оборванные задачи — в очередь, адрес webhook — в Telegram."""
+    from src.api.webhook import WEBHOOK_PATH
+
+    engine = build_engine(config['db_url'], config.get('database', {}))
+    try:
+        requeued = await requeue_interrupted(async_sessionmaker(engine))
+        if requeued:
+            logging.info("Requeued %d interrupted jobs", requeued)
+    finally:
+        await engine.dispose()
+
+    if not config['webhook_url']:
+        logging.warning("WEBHOOK_URL is not set, webhook is not registered in Telegram")
+        return
+    bot = create_bot(config)
+    try:
+        await bot.set_webhook(
+            config['webhook_url'].rstrip('/') + WEBHOOK_PATH,
+            secret_token=config['webhook_secret'],
+            drop_pending_updates=False
+        )
+    finally:
+        await bot.session.close()
+
+
+def run_webhook(config: dict):
+    import uvicorn
+
+    webhook_config = config.get('webhook', {})
+    require_webhook_secret(config)
+    asyncio.run(prepare_webhook(config))
+    logging.info("🚀 Webhook server with %d workers", webhook_config.get('workers', 1))
+    uvicorn.run(
+        "src.main:create_webhook_server",
+        factory=True,
+        host=webhook_config.get('host', '0.0.0.0'),
+        port=webhook_config.get('port', 8080),
+        workers=webhook_config.get('workers', 1),
+        log_level="warning"
+    )
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO)
+    app_config = load_config()
+    if app_config['mode'] == 'webhook':
+        run_webhook(app_config)
+    else:
+        asyncio.run(main(app_config))
\ No newline at end of file
@@ -1,6 +1,8 @@
 import pytest
+import pytest_asyncio
 from datetime import datetime
-from src.infrastructure.database.models import User
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from src.infrastructure.database.models import Base, User
 from src.core.dtypes import Transaction
 
 @pytest.fixture
@@ -21,4 +23,23 @@ def sample_transaction():
         amount=1500.50,
         description="Супермаркет Магнит",
         currency="RUB"
-    )
\ No newline at end of file
+    )
+
+
+@pytest_asyncio.fixture
+async def db_session():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def db_user(db_session):
+    user = User(telegram_id=12345, username="test_user", custom_prompts="")
+    user.set_categories(["Еда", "Транспорт"])
+    db_session.add(user)
+    await db_session.commit()
+    return user
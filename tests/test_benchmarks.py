@@ -0,0 +1,51 @@
+import json
+
+from benchmarks.run_benchmark import main, percentile
+from benchmarks.synthetic import generate_statement
+from src.infrastructure.parsers.sber import SberParser
+
+
+def test_synthetic_statement_is_deterministic_and_parsable(tmp_path):
+    """[Happy Path] Одинаковый seed — одинаковая выписка; SberParser читает все строки."""
+    first = generate_statement(str(tmp_path / "a.xlsx"), rows=200, merchants=30, notes_density=0.1, seed=7)
+    second = generate_statement(str(tmp_path / "b.xlsx"), rows=200, merchants=30, notes_density=0.1, seed=7)
+
+    assert first.notes == second.notes and first.notes
+    rows_a = SberParser(vectorized=True).parse(first.path)
+    rows_b = SberParser(vectorized=True).parse(second.path)
+    assert len(rows_a) == 200
+    assert [(t.date, t.amount, t.description) for t in rows_a] == \
+        [(t.date, t.amount, t.description) for t in rows_b]
+
+
+def test_percentile_nearest_rank():
+    """[Boundary Value Analysis] Перцентиль по ближайшему рангу."""
+    assert percentile([], 95) is None
+    assert percentile([3.0], 50) == 3.0
+    assert percentile([float(i) for i in range(1, 101)], 95) == 95.0
+
+
+def test_benchmark_runner_writes_results_and_flags_regression(tmp_path):
+    """
+    [Cause-Effect]
+    Прогон через заглушку с ошибками 503 сохраняет JSON; завышенный базовый
+    результат дает код возврата 1 (регрессия).
+    """
+    output = tmp_path / "result.json"
+    code = main([
+        "--rows", "60", "--repeat", "1", "--latency", "0", "--error-rate", "0.1",
+        "--batch-size", "5", "--output", str(output)
+    ])
+    assert code == 0
+    result = json.loads(output.read_text(encoding="utf-8"))
+    assert result["results"]["rows_per_sec"] > 0
+    assert result["results"]["llm_requests"] > 0
+    assert result["params"]["rows"] == 60
+
+    result["results"]["rows_per_sec"] *= 100
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps(result), encoding="utf-8")
+    assert main([
+        "--rows", "60", "--repeat", "1", "--latency", "0",
+        "--output", str(tmp_path / "second.json"), "--baseline", str(baseline)
+    ]) == 1
@@ -0,0 +1,91 @@
+import pytest
+from unittest.mock import MagicMock, AsyncMock
+from datetime import datetime
+
+from sqlalchemy import select
+
+from src.core.dtypes import Transaction
+from src.core.processor import Processor
+from src.infrastructure.database.cache import CategorizationCache, normalize_description
+from src.infrastructure.database.models import Note
+
+
+def test_normalize_description_equivalence():
+    """[Equivalence Partitioning] Номера терминалов, регистр и пунктуация не влияют на ключ."""
+    assert normalize_description("PYATEROCHKA 1234 Moscow") == normalize_description("Pyaterochka-5678  MOSCOW")
+    assert normalize_description("Яндекс.Такси") == "яндекс такси"
+    assert normalize_description("12345") == ""
+
+
+@pytest.mark.asyncio
+async def test_cache_roundtrip_and_invalidation(db_session, db_user):
+    """[State Transition] Промах -> запись -> попадание -> сброс -> промах."""
+    cache = CategorizationCache()
+    cats = ["Еда", "Транспорт"]
+
+    assert await cache.get_many(db_session, db_user.id, ["магнит"], cats) == {}
+    await cache.put_many(db_session, db_user.id, {"магнит": {"category": "Еда", "comment": "Ок"}}, cats)
+
+    found = await cache.get_many(db_session, db_user.id, ["магнит", "магнит"], cats)
+    assert found["магнит"]["category"] == "Еда"
+    # Другой набор категорий — другой ключ
+    assert await cache.get_many(db_session, db_user.id, ["магнит"], ["Еда"]) == {}
+
+    await cache.invalidate(db_session, db_user.id)
+    await db_session.commit()
+    assert await cache.get_many(db_session, db_user.id, ["магнит"], cats) == {}
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 3
+
+
+@pytest.mark.asyncio
+async def test_cache_conflict_keeps_pending_session_changes(db_session, db_user):
+    """
+    [Cause-Effect]
+    Причина: ключ уже записан параллельной выпиской, а в общей сессии задачи есть несохраненная заметка.
+    Следствие: повторная запись ключа пропускается, заметка сохраняется, профиль пользователя читается.
+    """
+    cache = CategorizationCache()
+    cats = ["Еда", "Транспорт"]
+    await cache.put_many(db_session, db_user.id, {"магнит": {"category": "Еда", "comment": "Ок"}}, cats)
+
+    db_session.add(Note(user_id=db_user.id, raw_text="Хлеб", created_at=datetime(2023, 10, 1)))
+    await cache.put_many(db_session, db_user.id, {"магнит": {"category": "Транспорт", "comment": ""}}, cats)
+
+    assert db_user.telegram_id == 12345
+    assert (await db_session.execute(select(Note.raw_text))).scalars().all() == ["Хлеб"]
+    assert (await cache.get_many(db_session, db_user.id, ["магнит"], cats))["магнит"]["category"] == "Еда"
+
+
+@pytest.mark.asyncio
+async def test_processor_cache_skips_llm_and_bypasses_notes(db_session, db_user):
+    """
+    [Cause-Effect]
+    Повторная выписка без заметок не обращается к LLM,
+    а транзакция с заметкой рядом всегда идет в LLM.
+    """
+    def statement():
+        return [
+            Transaction(date=datetime(2023, 10, 1, 12), amount=100, description="MAGNIT 001"),
+            Transaction(date=datetime(2023, 10, 20, 12), amount=100, description="MAGNIT 002"),
+        ]
+
+    db_session.add(Note(user_id=db_user.id, raw_text="Подарок", created_at=datetime(2023, 10, 20, 10)))
+    await db_session.commit()
+
+    parser = MagicMock()
+    parser.validate_format.return_value = True
+    mock_llm = AsyncMock()
+    mock_llm.categorize_transaction.return_value = {"category": "Еда", "comment": "Ок"}
+
+    processor = Processor(parser, mock_llm, MagicMock(), window_days=1, cache=CategorizationCache())
+
+    parser.parse.return_value = statement()
+    await processor.process_statement(db_user, "a.xlsx", db_session)
+    assert mock_llm.categorize_transaction.await_count == 2
+
+    parser.parse.return_value = statement()
+    await processor.process_statement(db_user, "b.xlsx", db_session)
+    # Во второй раз в LLM ушла только транзакция с заметкой
+    assert mock_llm.categorize_transaction.await_count == 3
+    assert processor.cache.hits == 1
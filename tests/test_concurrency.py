@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+
+from src.core.concurrency import AdaptiveLimiter
+from src.core.exceptions import LLMServerError, LLMResponseError
+
+
+@pytest.mark.asyncio
+async def test_limiter_additive_increase_while_latency_stable():
+    """[State Transition] Ровные задержки: лимит растет, но не выше потолка."""
+    limiter = AdaptiveLimiter(initial=2, max_limit=4)
+    for _ in range(50):
+        limiter.on_success(0.1)
+    assert limiter.limit == 4
+
+
+@pytest.mark.asyncio
+async def test_limiter_backs_off_once_per_burst_of_overload_errors():
+    """
+    [Cause-Effect]
+    Пачка одновременных 5xx уменьшает лимит один раз, ошибки формата ответа — не уменьшают.
+    """
+    limiter = AdaptiveLimiter(initial=8, max_limit=8)
+    for _ in range(5):
+        limiter.on_success(10.0)  # Медианная задержка задает окно, в котором не отступаем повторно
+
+    async def failing(error):
+        async with limiter.slot():
+            raise error
+
+    for error in (LLMServerError("Error 503", 503), LLMServerError("Error 503", 503)):
+        with pytest.raises(LLMServerError):
+            await failing(error)
+    assert limiter.limit == 4
+
+    with pytest.raises(LLMResponseError):
+        await failing(LLMResponseError("Error 400"))
+    assert limiter.limit == 4
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_limiter_caps_in_flight_requests():
+    """[Boundary Value Analysis] Одновременно выполняется не больше limit запросов."""
+    limiter = AdaptiveLimiter(initial=2, max_limit=2)
+    peak = 0
+
+    async def request():
+        nonlocal peak
+        async with limiter.slot():
+            peak = max(peak, limiter.in_flight)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*(request() for _ in range(6)))
+    assert peak == 2
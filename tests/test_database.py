@@ -0,0 +1,80 @@
+import os
+
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine, text
+
+from src.infrastructure.database.engine import build_engine
+from src.infrastructure.database.models import Base
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _alembic_config(url):
+    config = Config(os.path.join(ROOT, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(ROOT, "migrations"))
+    config.set_main_option("sqlalchemy.url", url)
+    config.attributes['configure_logger'] = False
+    return config
+
+
+def test_migrations_match_models(tmp_path):
+    """[Equivalence Partitioning] upgrade head дает ту же схему, что описана в моделях; downgrade откатывает все."""
+    path = tmp_path / "migrated.db"
+    config = _alembic_config(f"sqlite+aiosqlite:///{path}")
+    command.upgrade(config, "head")
+
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.connect() as conn:
+        diff = compare_metadata(MigrationContext.configure(conn, opts={'compare_type': True}), Base.metadata)
+    assert diff == []
+
+    command.downgrade(config, "base")
+    with engine.connect() as conn:
+        tables = conn.execute(text("SELECT name FROM sqlite_master WHERE type='table'")).scalars().all()
+    engine.dispose()
+    assert set(tables) <= {"alembic_version"}
+
+
+def test_baseline_database_upgrades_without_manual_stamp(tmp_path):
+    """
+    [State Transition]
+    База исходной версии бота (только users и notes, без alembic_version)
+    сама помечается ревизией 0001 и после upgrade head получает всю схему, данные сохраняются.
+    """
+    path = tmp_path / "legacy.db"
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE users (id INTEGER NOT NULL, telegram_id BIGINT NOT NULL, username VARCHAR, "
+            "categories TEXT, custom_prompts TEXT, created_at DATETIME, PRIMARY KEY (id), UNIQUE (telegram_id))"
+        ))
+        conn.execute(text(
+            "CREATE TABLE notes (id INTEGER NOT NULL, user_id INTEGER, raw_text TEXT NOT NULL, "
+            "created_at DATETIME, PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id))"
+        ))
+        conn.execute(text("INSERT INTO users (id, telegram_id, categories) VALUES (1, 42, '[\"Еда\"]')"))
+
+    config = _alembic_config(f"sqlite+aiosqlite:///{path}")
+    command.upgrade(config, "head")
+
+    with engine.connect() as conn:
+        diff = compare_metadata(MigrationContext.configure(conn, opts={'compare_type': True}), Base.metadata)
+        user = conn.execute(text("SELECT telegram_id, report_format FROM users")).one()
+    engine.dispose()
+    assert diff == []
+    assert tuple(user) == (42, 'csv')
+
+
+@pytest.mark.asyncio
+async def test_sqlite_engine_applies_pragmas(tmp_path):
+    """[Happy Path] Каждое соединение SQLite получает WAL, synchronous=NORMAL и busy_timeout из конфига."""
+    engine = build_engine(f"sqlite+aiosqlite:///{tmp_path / 'tuned.db'}", {'sqlite': {'busy_timeout_ms': 1234}})
+    async with engine.connect() as conn:
+        assert (await conn.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+        assert (await conn.execute(text("PRAGMA synchronous"))).scalar() == 1
+        assert (await conn.execute(text("PRAGMA busy_timeout"))).scalar() == 1234
+    await engine.dispose()
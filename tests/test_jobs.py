@@ -0,0 +1,276 @@
+import asyncio
+import io
+import os
+import pytest
+import pytest_asyncio
+from unittest.mock import AsyncMock, MagicMock
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.core.dtypes import ExportFile
+from src.core.jobs import JobQueue
+from src.infrastructure.database.models import Base, User, Job, JobStatus
+
+
+@pytest_asyncio.fixture
+async def session_maker(tmp_path):
+    # Файловая БД: у каждой сессии очереди свое соединение
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+async def _create_users(session_maker, count):
+    async with session_maker() as db:
+        users = [User(telegram_id=100 + i) for i in range(count)]
+        db.add_all(users)
+        await db.commit()
+        return [u.id for u in users]
+
+
+def _recording_processor(order):
+    processor = AsyncMock()
+
+    async def process_statement(user, file_path, db, on_progress=None):
+        order.append(file_path)
+        await asyncio.sleep(0)
+        return "report"
+
+    processor.process_statement.side_effect = process_statement
+    return processor
+
+
+async def _wait_for(condition, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("Условие не выполнилось")
+
+
+@pytest.mark.asyncio
+async def test_job_queue_round_robin_between_users(session_maker):
+    """
+    [State Transition]
+    Пользователь A ставит три выписки, B — одну. С одним воркером
+    B не ждет, пока обработаются все выписки A.
+    """
+    user_a, user_b = await _create_users(session_maker, 2)
+    order = []
+    deliver = AsyncMock()
+    queue = JobQueue(session_maker, _recording_processor(order), deliver, workers=1)
+
+    for name in ("a1", "a2", "a3"):
+        await queue.enqueue(user_a, 1, name, name)
+    await queue.enqueue(user_b, 2, "b1", "b1")
+
+    await queue.start()
+    await _wait_for(lambda: deliver.await_count == 4)
+    await queue.stop()
+
+    assert order == ["a1", "b1", "a2", "a3"]
+    jobs = await queue.list_jobs(user_a)
+    assert {job.status for job in jobs} == {JobStatus.DONE}
+
+
+@pytest.mark.asyncio
+async def test_job_queue_survives_restart_and_cancel(session_maker):
+    """
+    [Cause-Effect]
+    Задачи, принятые до остановки (в т.ч. прерванная 'running'), выполняются
+    после нового старта; отмененная задача не выполняется.
+    """
+    (user_id,) = await _create_users(session_maker, 1)
+    first = JobQueue(session_maker, AsyncMock(), AsyncMock())
+    kept = await first.enqueue(user_id, 1, "kept", "kept.xlsx")
+    cancelled = await first.enqueue(user_id, 1, "cancelled", "cancelled.xlsx")
+    assert await first.cancel(cancelled.id, user_id) is True
+
+    async with session_maker() as db:
+        interrupted = Job(user_id=user_id, chat_id=1, file_path="interrupted",
+                          file_name="i.xlsx", status=JobStatus.RUNNING)
+        db.add(interrupted)
+        await db.commit()
+
+    # "Перезапуск": новый экземпляр очереди поверх той же БД
+    order = []
+    deliver = AsyncMock()
+    second = JobQueue(session_maker, _recording_processor(order), deliver)
+    await second.start()
+    await _wait_for(lambda: deliver.await_count == 2)
+    await second.stop()
+
+    assert order == ["kept", "interrupted"]
+    statuses = {job.id: job.status for job in await second.list_jobs(user_id)}
+    assert statuses[kept.id] == JobStatus.DONE
+    assert statuses[cancelled.id] == JobStatus.CANCELLED
+
+
+@pytest.mark.asyncio
+async def test_progress_message_throttles_edits_and_sends_partial_report(sample_transaction):
+    """
+    [Boundary Value Analysis] Сообщение правится не чаще interval; на контрольной точке
+    уходит промежуточный отчет по готовому началу выписки, после готовности всего — нет.
+    """
+    from dataclasses import replace
+    from src.bot.handlers.jobs import ProgressMessage
+    from src.core.dtypes import StatementProgress
+    from src.infrastructure.reporters.basic_csv import BasicCSVReportGenerator
+
+    now = [0.0]
+    bot = AsyncMock()
+    job = Job(id=7, chat_id=42, file_name="statement.xlsx")
+    progress = ProgressMessage(bot, job, message_id=1, report_gen=BasicCSVReportGenerator(),
+                               interval=5, checkpoints=[2, 100], clock=lambda: now[0])
+    rows = [replace(sample_transaction, description=str(i)) for i in range(4)]
+
+    def update(done, reading, ready, elapsed):
+        now[0] = elapsed
+        progress.update(StatementProgress(done=done, total=4, reading=reading, elapsed=elapsed, ready=ready))
+
+    update(1, True, rows[:1], 1)
+    update(2, True, rows[1:2], 2)
+    update(3, False, rows[2:3], 6)
+    update(3, False, [], 7)
+    await asyncio.sleep(0.05)
+
+    assert bot.edit_message_text.await_count == 1
+    assert "готово 3 из 4 строк (75%)" in bot.edit_message_text.call_args.args[0]
+    assert "Осталось примерно 2 с" in bot.edit_message_text.call_args.args[0]
+    bot.send_document.assert_awaited_once()
+    assert "Первые 2 строк" in bot.send_document.call_args.kwargs['caption']
+
+    update(4, False, rows[3:], 8)
+    await progress.finish(JobStatus.DONE)
+    assert bot.send_document.await_count == 1
+    assert bot.edit_message_text.call_args.args[0].startswith("✅ Задача #7")
+
+
+@pytest.mark.asyncio
+async def test_job_queues_in_two_processes_claim_each_job_once(session_maker):
+    """
+    [State Transition]
+    Две очереди над одной БД (два воркера webhook) видят одни и те же задачи.
+    Каждая задача выполняется один раз, и у пользователя одновременно не больше per_user_limit.
+    """
+    user_a, user_b = await _create_users(session_maker, 2)
+    order, running, peak = [], {}, {}
+
+    def processor():
+        mock = AsyncMock()
+
+        async def process_statement(user, file_path, db, on_progress=None):
+            running[user.id] = running.get(user.id, 0) + 1
+            peak[user.id] = max(peak.get(user.id, 0), running[user.id])
+            order.append(file_path)
+            await asyncio.sleep(0.02)
+            running[user.id] -= 1
+            return "report"
+
+        mock.process_statement.side_effect = process_statement
+        return mock
+
+    deliver = AsyncMock()
+    first = JobQueue(session_maker, processor(), deliver, workers=2, retry_delay=0.01)
+    second = JobQueue(session_maker, processor(), deliver, workers=2, recover=False, poll_interval=0.01,
+                      retry_delay=0.01)
+    for i in range(4):
+        await first.enqueue(user_a, 1, f"a{i}", "a.xlsx")
+        await first.enqueue(user_b, 2, f"b{i}", "b.xlsx")
+
+    await first.start()
+    await second.start()
+    await _wait_for(lambda: deliver.await_count == 8)
+    await first.stop()
+    await second.stop()
+
+    assert sorted(order) == sorted(f"{u}{i}" for u in "ab" for i in range(4))
+    assert peak == {user_a: 1, user_b: 1}
+
+
+@pytest.mark.asyncio
+async def test_job_queue_retries_claim_after_database_error(session_maker):
+    """
+    [Cause-Effect]
+    Ошибка БД при захвате не теряет задачу: она остается в очереди,
+    захват повторяется с паузой, и после восстановления БД задача выполняется.
+    """
+    (user_id,) = await _create_users(session_maker, 1)
+    order = []
+    deliver = AsyncMock()
+    queue = JobQueue(session_maker, _recording_processor(order), deliver, retry_delay=0.01)
+    claim, attempts = queue._claim, []
+
+    async def flaky_claim(job_id, user_id):
+        attempts.append(job_id)
+        if len(attempts) <= 2:
+            raise OperationalError("UPDATE jobs", {}, Exception("database is locked"))
+        return await claim(job_id, user_id)
+
+    queue._claim = flaky_claim
+    job = await queue.enqueue(user_id, 1, "a0", "a.xlsx")
+    await queue.start()
+    await _wait_for(lambda: deliver.await_count == 1)
+    await queue.stop()
+
+    assert attempts == [job.id] * 3
+    assert order == ["a0"]
+    assert queue._claim_errors == {}
+    async with session_maker() as db:
+        assert (await db.get(Job, job.id)).status == JobStatus.DONE
+
+
+@pytest.mark.asyncio
+async def test_unknown_statement_rejected_before_enqueue(tmp_path, monkeypatch):
+    """
+    [Equivalence Partitioning]
+    Файл чужого формата отклоняется при приеме: в очередь не попадает и с диска удаляется.
+    Выписку известного банка обработчик ставит в очередь.
+    """
+    from src.bot.handlers import common
+
+    monkeypatch.setattr(common, "JOBS_DIR", str(tmp_path))
+    bot = AsyncMock()
+    bot.download_file.side_effect = lambda source, path: open(path, "w").close()
+    job_queue = AsyncMock()
+    job_queue.enqueue.return_value = Job(id=7)
+    processor = MagicMock()
+
+    def message(file_name):
+        msg = AsyncMock()
+        msg.document.file_name = file_name
+        msg.chat.id = 1
+        return msg
+
+    processor.parser.validate_format.return_value = False
+    rejected = message("other.csv")
+    await common.handle_document(rejected, User(id=1), bot, job_queue, processor)
+
+    job_queue.enqueue.assert_not_awaited()
+    assert os.listdir(tmp_path) == []
+    assert rejected.answer.await_args.args[0].startswith("❌")
+
+    processor.parser.validate_format.return_value = True
+    await common.handle_document(message("operations.csv"), User(id=1), bot, job_queue, processor)
+    job_queue.enqueue.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_report_of_cancelled_job_is_closed(session_maker):
+    """
+    [State Transition]
+    Задачу отменили, пока строился отчет: отчет не отправляется, но его файл закрывается.
+    """
+    (user_id,) = await _create_users(session_maker, 1)
+    deliver = AsyncMock()
+    queue = JobQueue(session_maker, AsyncMock(), deliver)
+    job = await queue.enqueue(user_id, 1, "", "a.xlsx")
+    assert await queue.cancel(job.id, user_id)
+
+    report = ExportFile("csv", io.BytesIO(b"date;amount"))
+    await queue._finish(job, JobStatus.DONE, report, None)
+
+    deliver.assert_not_awaited()
+    assert report.file_content.closed
@@ -1,12 +1,20 @@
 import pytest
+import pytest_asyncio
+import asyncio
 import json
+from dataclasses import replace
 from unittest.mock import AsyncMock, patch, MagicMock
+from src.core.exceptions import LLMConnectionError, LLMRateLimitError, LLMResponseError, LLMServerError
+from src.infrastructure.llm.common import JsonObjectScanner
+from src.infrastructure.llm.hedged import HedgedProvider
 from src.infrastructure.llm.ollama import OllamaProvider
 
 
-@pytest.fixture
-def ollama_provider():
-    return OllamaProvider("http://localhost:11434", "llama3")
+@pytest_asyncio.fixture
+async def ollama_provider():
+    provider = OllamaProvider("http://localhost:11434", "llama3")
+    yield provider
+    await provider.close()
 
 
 @pytest.mark.asyncio
@@ -36,19 +44,58 @@ async def test_llm_resilience_to_malformed_json(ollama_provider, sample_transact
         assert "Ошибка чтения ответа" in result["comment"]
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("reply", ['[]', '"Еда"', '42'])
+async def test_llm_json_that_is_not_object_falls_back(ollama_provider, sample_transaction, reply):
+    """
+    [Error Guessing]
+    Модель возвращает валидный JSON, но не объект (список, строка, число).
+    Ожидание: оба провайдера отдают фолбэк 'Разное', а не падают с AttributeError.
+    """
+    from src.infrastructure.llm.yandex import YandexGPTProvider
+
+    yandex_provider = YandexGPTProvider("key", "folder")
+    try:
+        for provider in (ollama_provider, yandex_provider):
+            with patch.object(provider, "_complete", AsyncMock(return_value=reply)):
+                result = await provider.categorize_transaction(
+                    transaction=sample_transaction,
+                    nearby_notes=[],
+                    categories=["Еда"],
+                    user_hints=""
+                )
+            assert result["category"] == "Разное"
+            assert "Ошибка" in result["comment"]
+    finally:
+        await yandex_provider.close()
+
+
 @pytest.mark.asyncio
 async def test_llm_connection_error_handling(ollama_provider, sample_transaction):
     """
     [Cause-Effect]
     Причина: Исключение при попытке запроса (сервер выключен).
-    Следствие: Возврат 'Разное' и комментарий 'Ошибка соединения'.
+    Следствие: Типизированное LLMConnectionError (фолбэк 'Разное' подставляет Processor).
     """
     with patch("aiohttp.ClientSession.post", side_effect=Exception("Connection refused")):
-        result = await ollama_provider.categorize_transaction(
-            sample_transaction, [], ["Еда"], ""
-        )
-        assert result["category"] == "Разное"
-        assert "Ошибка соединения" in result["comment"]
+        with pytest.raises(LLMConnectionError):
+            await ollama_provider.categorize_transaction(
+                sample_transaction, [], ["Еда"], ""
+            )
+
+
+@pytest.mark.asyncio
+async def test_llm_http_status_mapping(ollama_provider, sample_transaction):
+    """[Equivalence Partitioning] 429 и 5xx — ошибки перегрузки, 4xx — нет."""
+    cases = [(429, LLMRateLimitError, True), (503, LLMServerError, True), (400, LLMResponseError, False)]
+    for status, error_type, overload in cases:
+        mock_resp = AsyncMock()
+        mock_resp.status = status
+        with patch("aiohttp.ClientSession.post") as mock_post:
+            mock_post.return_value.__aenter__.return_value = mock_resp
+            with pytest.raises(error_type) as exc_info:
+                await ollama_provider.categorize_transaction(sample_transaction, [], ["Еда"], "")
+        assert exc_info.value.overload is overload
 
 
 @pytest.mark.asyncio
@@ -67,4 +114,284 @@ async def test_llm_success_path(ollama_provider, sample_transaction):
             sample_transaction, [], ["Еда"], ""
         )
         assert result["category"] == "Еда"
-        assert result["comment"] == "Из заметки"
\ No newline at end of file
+        assert result["comment"] == "Из заметки"
+
+@pytest.mark.asyncio
+async def test_llm_batch_single_request(ollama_provider, sample_transaction):
+    """[Happy Path] Пачка из трех транзакций разбирается из одного ответа."""
+    reply = {"results": [
+        {"id": 0, "category": "Еда", "comment": "a"},
+        {"id": 1, "category": "Транспорт", "comment": "b"},
+        {"id": 2, "category": "Еда", "comment": "c"},
+    ]}
+    ollama_provider._complete = AsyncMock(return_value=json.dumps(reply, ensure_ascii=False))
+
+    items = [(sample_transaction, [])] * 3
+    results = await ollama_provider.categorize_batch(items, ["Еда", "Транспорт"], "")
+
+    assert ollama_provider._complete.await_count == 1
+    assert [r["category"] for r in results] == ["Еда", "Транспорт", "Еда"]
+    assert results[1]["comment"] == "b"
+
+
+@pytest.mark.asyncio
+async def test_llm_batch_resplits_only_failed_items(ollama_provider, sample_transaction):
+    """
+    [Error Guessing]
+    Модель выдумала категорию для одного элемента и пропустила другой.
+    Ожидание: переспрашиваются только они, остальные результаты сохраняются.
+    """
+    first = {"results": [
+        {"id": 0, "category": "Еда", "comment": "ok"},
+        {"id": 1, "category": "Несуществующая", "comment": "bad"},
+        {"id": 3, "category": "Транспорт", "comment": "ok"},
+    ]}
+    second = {"results": [
+        {"id": 0, "category": "Транспорт", "comment": "retry-1"},
+        {"id": 1, "category": "ЖКХ", "comment": "retry-2"},
+    ]}
+    ollama_provider._complete = AsyncMock(side_effect=[
+        json.dumps(first, ensure_ascii=False),
+        json.dumps(second, ensure_ascii=False),
+    ])
+
+    items = [(sample_transaction, [])] * 4
+    results = await ollama_provider.categorize_batch(items, ["Еда", "Транспорт", "ЖКХ"], "")
+
+    assert ollama_provider._complete.await_count == 2
+    # Во второй запрос ушли только два элемента
+    assert '1. Транзакция' in ollama_provider._complete.await_args_list[1].args[0]
+    assert '2. Транзакция' not in ollama_provider._complete.await_args_list[1].args[0]
+    assert [r["comment"] for r in results] == ["ok", "retry-1", "retry-2", "ok"]
+
+
+@pytest.mark.asyncio
+async def test_llm_session_reused_between_calls(ollama_provider, sample_transaction):
+    """[State Transition] Одна HTTP-сессия на все запросы; close() ее закрывает."""
+    mock_resp = AsyncMock()
+    mock_resp.status = 200
+    mock_resp.json.return_value = {"response": json.dumps({"category": "Еда", "comment": ""})}
+
+    with patch("aiohttp.ClientSession.post") as mock_post:
+        mock_post.return_value.__aenter__.return_value = mock_resp
+
+        await ollama_provider.categorize_transaction(sample_transaction, [], ["Еда"], "")
+        session = ollama_provider._session
+        await ollama_provider.categorize_transaction(sample_transaction, [], ["Еда"], "")
+
+        assert ollama_provider._session is session
+        assert session.connector.limit_per_host == ollama_provider.max_connections
+
+    await ollama_provider.close()
+    assert session.closed
+
+
+def test_json_object_scanner_handles_braces_in_strings():
+    """[Boundary Value Analysis] Скобки и кавычки внутри строки не закрывают объект раньше времени."""
+    scanner = JsonObjectScanner()
+    parts = ['{"category": "Еда", ', r'"comment": "чек {1} \"}\""', '}', ' хвост']
+    found = [scanner.feed(p) for p in parts]
+    assert found[:2] == [None, None]
+    assert json.loads(found[2]) == {"category": "Еда", "comment": 'чек {1} "}"'}
+    assert found[3] is None
+
+
+@pytest.mark.asyncio
+async def test_ollama_streaming_stops_after_complete_json(sample_transaction):
+    """
+    [Cause-Effect]
+    Причина: модель выдала JSON с валидной категорией и продолжает генерировать хвост.
+    Следствие: запрос закрывается сразу, хвост не дочитывается, замер сохранен.
+    """
+    from aiohttp import web
+
+    answer = json.dumps({"category": "Еда", "comment": "ok"}, ensure_ascii=False)
+    tail = {"sent": 0}
+
+    async def handler(request):
+        resp = web.StreamResponse()
+        await resp.prepare(request)
+        try:
+            for token in (answer[:10], answer[10:]):
+                await resp.write((json.dumps({"response": token, "done": False}) + "\n").encode())
+            # Длинный хвост генерации: клиент должен закрыть запрос, не дожидаясь его
+            for _ in range(100):
+                await asyncio.sleep(0.02)
+                await resp.write((json.dumps({"response": " ", "done": False}) + "\n").encode())
+                tail["sent"] += 1
+            await resp.write((json.dumps({"response": "", "done": True}) + "\n").encode())
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        return resp
+
+    app = web.Application()
+    app.router.add_post("/api/chat", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    provider = OllamaProvider(f"http://127.0.0.1:{port}", "llama3", streaming=True)
+    try:
+        result = await asyncio.wait_for(
+            provider.categorize_transaction(sample_transaction, [], ["Еда"], ""), timeout=2
+        )
+    finally:
+        await provider.close()
+        await runner.cleanup()
+
+    assert result == {"category": "Еда", "comment": "ok"}
+    assert tail["sent"] < 100
+    assert len(provider.timings) == 1
+    assert provider.timings[0].early_stop is True
+    assert provider.timings[0].result < 2
+
+
+@pytest.mark.asyncio
+async def test_ollama_chat_prompt_has_stable_prefix(ollama_provider, sample_transaction):
+    """
+    [Cause-Effect]
+    Причина: две разные транзакции одного пользователя.
+    Следствие: системное сообщение совпадает побайтно, транзакция только в коротком user-сообщении;
+    ответ /api/chat (message.content) разбирается, счетчики Ollama накапливаются.
+    """
+    mock_resp = AsyncMock()
+    mock_resp.status = 200
+    mock_resp.json.return_value = {
+        "message": {"role": "assistant", "content": json.dumps({"category": "Еда", "comment": "ok"})},
+        "done": True,
+        "prompt_eval_count": 12,
+        "prompt_eval_duration": 3_000_000,
+        "eval_count": 9,
+        "eval_duration": 5_000_000,
+    }
+    other = replace(sample_transaction, description="Такси")
+
+    with patch("aiohttp.ClientSession.post") as mock_post:
+        mock_post.return_value.__aenter__.return_value = mock_resp
+        first = await ollama_provider.categorize_transaction(sample_transaction, [], ["Еда"], "подсказка")
+        await ollama_provider.categorize_transaction(other, [], ["Еда"], "подсказка")
+
+    assert first == {"category": "Еда", "comment": "ok"}
+    (url,), kwargs = mock_post.call_args_list[0]
+    assert url.endswith("/api/chat")
+    first_messages = kwargs["json"]["messages"]
+    second_messages = mock_post.call_args_list[1].kwargs["json"]["messages"]
+    assert first_messages[0]["role"] == "system"
+    assert first_messages[0] == second_messages[0]
+    assert "подсказка" in first_messages[0]["content"]
+    assert sample_transaction.description in first_messages[1]["content"]
+    assert sample_transaction.description not in first_messages[0]["content"]
+    assert ollama_provider.usage["calls"] == 2
+    assert ollama_provider.usage["prompt_eval_count"] == 24
+
+
+class _FakeProvider(OllamaProvider):
+    """Провайдер с заданными задержками ответов; фиксирует отмененные запросы."""
+
+    def __init__(self, delays, error=None, category="Еда", max_connections=4):
+        super().__init__("http://localhost:11434", "llama3", max_connections=max_connections)
+        self.delays = list(delays)
+        self.error = error
+        self.category = category
+        self.calls = 0
+        self.cancelled = 0
+
+    async def categorize_transaction(self, transaction, nearby_notes, categories, user_hints):
+        delay = self.delays[min(self.calls, len(self.delays) - 1)]
+        self.calls += 1
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        return {"category": self.category, "comment": f"{type(self).__name__}:{self.calls}"}
+
+
+@pytest.mark.asyncio
+async def test_hedged_provider_bounds_tail_by_hedge_delay(sample_transaction):
+    """
+    [Boundary Value Analysis] Основной отвечает быстро, но каждый 10-й запрос залипает.
+    Дубль уходит после p95 обычных задержек, худший запрос не ждет залипшего, проигравший отменяется.
+    """
+    primary = _FakeProvider([0.01] * 9 + [5.0])
+    secondary = _FakeProvider([0.01])
+    hedged = HedgedProvider([primary, secondary], initial_delay=0.05, min_delay=0.02, min_samples=5,
+                            max_hedge_ratio=0.5)
+
+    worst = 0.0
+    for _ in range(20):
+        started = asyncio.get_running_loop().time()
+        result = await hedged.categorize_transaction(sample_transaction, [], ["Еда"], "")
+        worst = max(worst, asyncio.get_running_loop().time() - started)
+        assert result["category"] == "Еда"
+
+    assert worst < 0.5
+    assert secondary.calls >= 2
+    assert primary.cancelled == secondary.calls
+
+
+@pytest.mark.asyncio
+async def test_hedged_provider_fails_over_after_repeated_errors(sample_transaction):
+    """
+    [State Transition] Ошибки основного сразу уходят на запасной; после failure_threshold
+    ошибок подряд запросы идут запасному первым, пока не истечет cooldown.
+    """
+    now = [0.0]
+    primary = _FakeProvider([0], error=LLMServerError("Ollama Error 503", 503))
+    secondary = _FakeProvider([0])
+    hedged = HedgedProvider([primary, secondary], failure_threshold=2, cooldown=30, clock=lambda: now[0])
+
+    for _ in range(2):
+        result = await hedged.categorize_transaction(sample_transaction, [], ["Еда"], "")
+        assert result["comment"].startswith("_FakeProvider")
+    assert primary.calls == 2
+
+    await hedged.categorize_transaction(sample_transaction, [], ["Еда"], "")
+    assert primary.calls == 2
+    assert secondary.calls == 3
+
+    now[0] = 31
+    await hedged.categorize_transaction(sample_transaction, [], ["Еда"], "")
+    assert primary.calls == 3
+
+    secondary.error = LLMServerError("Yandex Error 500", 500)
+    with pytest.raises(LLMServerError):
+        await hedged.categorize_transaction(sample_transaction, [], ["Еда"], "")
+
+
+@pytest.mark.asyncio
+async def test_hedged_single_provider_hedges_only_into_free_connections(sample_transaction):
+    """
+    [Boundary Value Analysis] Один провайдер, все запросы залипли. Пул занят основными
+    запросами — дубль не отправляется; одно свободное соединение — уходит ровно один дубль.
+    """
+    for max_connections, expected_calls in ((2, 2), (3, 3)):
+        provider = _FakeProvider([0.2], max_connections=max_connections)
+        hedged = HedgedProvider([provider], initial_delay=0.02, min_delay=0.02, max_hedge_ratio=1.0)
+
+        results = await asyncio.gather(*(
+            hedged.categorize_transaction(sample_transaction, [], ["Еда"], "") for _ in range(2)
+        ))
+
+        assert [r["category"] for r in results] == ["Еда", "Еда"]
+        assert provider.calls == expected_calls
+
+
+@pytest.mark.asyncio
+async def test_hedged_provider_prefers_answer_from_category_list(sample_transaction):
+    """
+    [Equivalence Partitioning] Категория не из списка (фолбэк) не принимается, пока можно
+    спросить запасной; если запасного нет, возвращается фолбэк, а не ошибка.
+    """
+    primary = _FakeProvider([0], category="Разное")
+    secondary = _FakeProvider([0])
+    result = await HedgedProvider([primary, secondary]).categorize_transaction(sample_transaction, [], ["Еда"], "")
+    assert result["category"] == "Еда"
+    assert (primary.calls, secondary.calls) == (1, 1)
+
+    result = await HedgedProvider([primary]).categorize_transaction(sample_transaction, [], ["Еда"], "")
+    assert result["category"] == "Разное"
@@ -0,0 +1,70 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from src.core import metrics
+from src.core.exceptions import LLMConnectionError
+from src.core.metrics import MetricsRegistry
+from src.core.processor import Processor
+
+
+def test_registry_renders_prometheus_text():
+    """[Happy Path] Счетчики с метками и гистограмма в текстовом формате Prometheus."""
+    registry = MetricsRegistry()
+    registry.inc('fallback', reason='json_error')
+    registry.inc('fallback', 2, reason='json_error')
+    registry.observe('llm', 0.3, provider='OllamaProvider')
+    registry.observe('llm', 7.0, provider='OllamaProvider')
+
+    text = registry.render()
+    assert '# TYPE fingram_fallback_total counter' in text
+    assert 'fingram_fallback_total{reason="json_error"} 3' in text
+    assert 'fingram_llm_seconds_bucket{provider="OllamaProvider",le="0.5"} 1' in text
+    assert 'fingram_llm_seconds_bucket{provider="OllamaProvider",le="+Inf"} 2' in text
+    assert 'fingram_llm_seconds_count{provider="OllamaProvider"} 2' in text
+
+
+@pytest.mark.asyncio
+async def test_processor_collects_run_stats(mock_user, sample_transaction):
+    """
+    [Cause-Effect]
+    Причина: выписка из одной строки, LLM недоступна.
+    Следствие: в сводке выписки есть этапы parse/notes/llm/report и счетчик фолбэка на 'Разное'.
+    """
+    parser = MagicMock()
+    parser.validate_format.return_value = True
+    parser.parse.return_value = [sample_transaction]
+    mock_llm = AsyncMock()
+    mock_llm.categorize_transaction.side_effect = LLMConnectionError("down")
+
+    mock_result = MagicMock()
+    mock_result.scalars.return_value.all.return_value = []
+    db_mock = AsyncMock()
+    db_mock.execute.return_value = mock_result
+
+    before = metrics.REGISTRY.counter_value('fallback', reason='llm_error')
+    processor = Processor(parser, mock_llm, MagicMock(), llm_retries=0)
+    await processor.process_statement(mock_user, "/tmp/statement.xlsx", db_mock)
+
+    stats = processor.last_runs[mock_user.id]
+    assert stats.file_name == "statement.xlsx"
+    assert stats.rows == 1
+    assert stats.duration is not None
+    assert {'parse', 'notes', 'llm_queue_wait', 'llm', 'report'} <= set(stats.spans)
+    assert stats.counters['fallback:llm_error'] == 1
+    assert metrics.REGISTRY.counter_value('fallback', reason='llm_error') == before + 1
+    assert any(line.startswith('llm:') for line in stats.summary())
+
+
+def test_metrics_endpoint_serves_registry():
+    """[Happy Path] /metrics отдает текст реестра."""
+    from fastapi.testclient import TestClient
+    from src.api.metrics import create_metrics_app
+
+    registry = MetricsRegistry()
+    registry.inc('jobs', status='done')
+    client = TestClient(create_metrics_app(registry))
+
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    assert 'fingram_jobs_total{status="done"} 1' in resp.text
@@ -17,4 +17,16 @@ def test_user_categories_exhaustive():
     ]
     for case in cases:
         user.set_categories(case)
-        assert user.get_categories() == case
\ No newline at end of file
+        assert user.get_categories() == case
+
+def test_user_categories_decoded_once_per_value():
+    """[State Transition] Разобранные категории переиспользуются до set_categories; копия не портит кэш."""
+    user = User()
+    user.set_categories(["Еда", "Транспорт"])
+
+    first = user.get_categories()
+    first.append("Мусор")
+    assert user.get_categories() == ["Еда", "Транспорт"]
+
+    user.set_categories(["Дом"])
+    assert user.get_categories() == ["Дом"]
@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.infrastructure.database.models import Base, Note, User
+from src.infrastructure.database.notes import NoteBuffer
+
+
+@pytest_asyncio.fixture
+async def session_maker(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'notes.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with maker() as db:
+        db.add(User(id=1, telegram_id=100))
+        await db.commit()
+    yield maker
+    await engine.dispose()
+
+
+async def _count_notes(session_maker):
+    async with session_maker() as db:
+        return await db.scalar(select(func.count()).select_from(Note))
+
+
+@pytest.mark.asyncio
+async def test_note_buffer_groups_burst_into_one_transaction(session_maker):
+    """[Happy Path] Пачка сообщений пишется одной вставкой; add() возвращается уже после коммита."""
+    flushes = []
+
+    async def on_flush(db, notes):
+        flushes.append(len(notes))
+
+    buffer = NoteBuffer(session_maker, max_batch=100, max_delay=0.05, on_flush=on_flush)
+    when = datetime(2024, 1, 1, 12)
+    await asyncio.gather(*(buffer.add(1, f"{i * 100} кофе", when + timedelta(minutes=i)) for i in range(20)))
+
+    assert flushes == [20]
+    assert await _count_notes(session_maker) == 20
+
+
+@pytest.mark.asyncio
+async def test_note_buffer_flushes_at_max_batch_and_on_stop(session_maker):
+    """[Boundary Value Analysis] Полная пачка пишется сразу, не дожидаясь таймера; остаток — при остановке."""
+    buffer = NoteBuffer(session_maker, max_batch=3, max_delay=60)
+    when = datetime(2024, 1, 1, 12)
+
+    await asyncio.wait_for(
+        asyncio.gather(*(buffer.add(1, "такси", when) for _ in range(3))), timeout=5
+    )
+    assert await _count_notes(session_maker) == 3
+
+    late = asyncio.create_task(buffer.add(1, "обед", when))
+    await asyncio.sleep(0)
+    assert buffer.pending == 1
+    await buffer.stop()
+    await late
+    assert await _count_notes(session_maker) == 4
+    with pytest.raises(RuntimeError):
+        await buffer.add(1, "после остановки", when)
+
+
+@pytest.mark.asyncio
+async def test_note_buffer_failure_is_reported_to_sender(session_maker):
+    """[Cause-Effect] Ошибка записи доходит до отправителя, чтобы бот не ответил 'Запомнил'."""
+    async def broken(db, notes):
+        raise RuntimeError("disk full")
+
+    buffer = NoteBuffer(session_maker, max_batch=1, on_flush=broken)
+    with pytest.raises(RuntimeError):
+        await buffer.add(1, "кофе", datetime(2024, 1, 1))
+    assert await _count_notes(session_maker) == 0
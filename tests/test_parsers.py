@@ -1,9 +1,31 @@
+import os
 import pytest
+from datetime import datetime
 from unittest.mock import patch, MagicMock
 from src.infrastructure.parsers.sber import SberParser
 from src.core.dtypes import Transaction
 
 
+def _write_statement(path):
+    """Выписка в формате Сбера: шапка, пустые строки, разные форматы дат и сумм."""
+    import openpyxl
+
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["Выписка по счету"])
+    ws.append([])
+    ws.append(["Дата операции", "Категория", "Описание операции", "Сумма в рублях"])
+    ws.append([datetime(2023, 1, 2, 10, 5), "Супермаркеты", "Магнит", "1\xa0500,50"])
+    ws.append(["15.10.2023 12:30", "Транспорт", "Яндекс Такси", -300.0])
+    ws.append(["15 окт. 2023", "Прочее", None, "100"])
+    ws.append(["1 мая 2024", "Прочее", "Подписка", 299])
+    ws.append([])
+    ws.append(["03.02.2024", "Прочее", "Без суммы", None])
+    ws.append(["04.02.2024", "Прочее", "Кривая сумма", "abc"])
+    wb.save(path)
+    return str(path)
+
+
 class TestSberParser:
     def test_sber_parser_format_validation(self):
         parser = SberParser()
@@ -35,4 +57,123 @@ class TestSberParser:
         assert len(transactions) == 1
         assert isinstance(transactions[0], Transaction)
         assert transactions[0].amount == 1500.50
-        assert transactions[0].description == "Магнит"
\ No newline at end of file
+        assert transactions[0].description == "Магнит"
+
+    def test_vectorized_mode_matches_row_by_row(self, tmp_path):
+        """
+        [Equivalence Partitioning]
+        Векторный режим на реальном xlsx дает тот же список Transaction, что и построчный.
+        Покрыты: шапка над заголовком, пустые строки, datetime-ячейки, строковые даты
+        с русскими месяцами, суммы с пробелами/запятыми, пустое описание.
+        """
+        path = _write_statement(tmp_path / "statement.xlsx")
+
+        legacy = SberParser().parse(path)
+        fast = SberParser(vectorized=True).parse(path)
+
+        assert len(fast) == 4
+        assert fast == legacy
+        assert fast[0].amount == 1500.50
+        assert fast[2].date == datetime(2023, 10, 15)
+        assert fast[3].date == datetime(2024, 5, 1)
+
+
+class TestSberStreamParser:
+    def test_stream_parser_yields_same_rows(self, tmp_path):
+        """[Equivalence Partitioning] Потоковый парсер отдает те же строки, что и pandas-парсер."""
+        from src.infrastructure.parsers.sber_stream import SberStreamParser
+
+        path = _write_statement(tmp_path / "statement.xlsx")
+        parser = SberStreamParser()
+
+        stream = parser.iter_parse(path)
+        first = next(stream)
+        assert first.description == "Магнит"
+
+        streamed = [first] + list(stream)
+        reference = SberParser(vectorized=True).parse(path)
+        assert [(t.date, t.amount) for t in streamed] == [(t.date, t.amount) for t in reference]
+        # Пустое описание не превращается в 'nan'
+        assert streamed[2].description == "Без описания"
+        assert parser.validate_format("big.xls") is False
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def _write_tinkoff_xlsx(path):
+    import openpyxl
+
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["Дата операции", "Дата платежа", "Номер карты", "Статус", "Сумма операции",
+               "Валюта операции", "Сумма платежа", "Валюта платежа", "Категория", "MCC", "Описание"])
+    ws.append([datetime(2024, 1, 31, 19, 42), datetime(2024, 1, 31), "*1234", "OK", -1250.0,
+               "RUB", -1250.0, "RUB", "Супермаркеты", 5411, "Пятёрочка"])
+    wb.save(path)
+    return str(path)
+
+
+def _registry():
+    from src.infrastructure.parsers.alfa import AlfaCSVParser
+    from src.infrastructure.parsers.registry import ParserRegistry
+    from src.infrastructure.parsers.tinkoff import TinkoffParser
+
+    return ParserRegistry([TinkoffParser(), AlfaCSVParser(), SberParser(vectorized=True)])
+
+
+class TestParserRegistry:
+    def test_detects_bank_by_content(self, tmp_path):
+        """[Equivalence Partitioning] Банк определяется по шапке, а не по расширению файла."""
+        registry = _registry()
+        sber = _write_statement(tmp_path / "statement.xlsx")
+        tinkoff_xlsx = _write_tinkoff_xlsx(tmp_path / "operations.xlsx")
+
+        assert type(registry.detect(sber)).__name__ == "SberParser"
+        assert type(registry.detect(tinkoff_xlsx)).__name__ == "TinkoffParser"
+        assert type(registry.detect(os.path.join(FIXTURES, "tinkoff_operations.csv"))).__name__ == "TinkoffParser"
+        assert type(registry.detect(os.path.join(FIXTURES, "alfa_statement.csv"))).__name__ == "AlfaCSVParser"
+
+        rows = list(registry.iter_parse(sber))
+        assert rows == SberParser(vectorized=True).parse(sber)
+
+    def test_tinkoff_csv_rows(self):
+        """[Cause-Effect] Отклоненные операции пропускаются, валюта и секунды в дате сохраняются."""
+        rows = list(_registry().iter_parse(os.path.join(FIXTURES, "tinkoff_operations.csv")))
+
+        assert [tx.description for tx in rows] == ["Пятёрочка", "Яндекс Go", "Пополнение. Зарплата", "Steam"]
+        assert rows[0].date == datetime(2024, 1, 31, 19, 42, 10)
+        assert rows[0].amount == -1250.0
+        assert rows[3].currency == "USD"
+
+    def test_alfa_csv_rows(self):
+        """[Cause-Effect] Сумма = приход - расход, двузначный год, нулевая блокировка отбрасывается."""
+        rows = list(_registry().iter_parse(os.path.join(FIXTURES, "alfa_statement.csv")))
+
+        assert [tx.amount for tx in rows] == [-843.4, -1120.0, 85000.0]
+        assert rows[0].date == datetime(2024, 1, 31)
+        assert rows[0].currency == "RUB"
+
+    def test_file_head_read_once_per_statement(self):
+        """[Boundary Value Analysis] Реестр читает начало файла один раз и передает его выбранному парсеру."""
+        from src.infrastructure.parsers import registry, sniff, tinkoff
+
+        with patch.object(registry, "read_head", wraps=sniff.read_head) as registry_head, \
+                patch.object(tinkoff, "read_head", wraps=sniff.read_head) as parser_head:
+            rows = list(_registry().iter_parse(os.path.join(FIXTURES, "tinkoff_operations.csv")))
+
+        assert len(rows) == 4
+        assert registry_head.call_count == 1
+        assert parser_head.call_count == 0
+
+    def test_unknown_file_rejected_without_full_read(self, tmp_path):
+        """[Boundary Value Analysis] Чужой CSV и не-таблица отклоняются по началу файла, pandas не вызывается."""
+        other = tmp_path / "other.csv"
+        other.write_text("id,name\n" + "1,x\n" * 100_000, encoding="utf-8")
+        garbage = tmp_path / "photo.xlsx"
+        garbage.write_bytes(b"\x89PNG\r\n\x1a\n" + b"\x00" * 1024)
+
+        registry = _registry()
+        with patch("pandas.read_excel", side_effect=AssertionError("полное чтение файла")):
+            assert registry.validate_format(str(other)) is False
+            assert registry.validate_format(str(garbage)) is False
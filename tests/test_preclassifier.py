@@ -0,0 +1,146 @@
+import logging
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+from src.core.dtypes import Transaction
+from src.core.preclassifier import Rule, RuleSet, SimilarityIndex, format_rules, parse_rules
+from src.core.processor import Processor
+from src.infrastructure.database.rules import RuleStore
+from src.infrastructure.database.transactions import TransactionStore
+
+
+def test_rules_parse_and_priority():
+    """
+    [Equivalence Partitioning]
+    Слова и регулярки разбираются; при нескольких совпадениях побеждает правило выше.
+    """
+    rules = parse_rules("Пятерочка, ВкусВилл -> Продукты\n\n/яндекс\\s*go/ → Транспорт\nЯндекс -> Подписки")
+    assert [(r.pattern, r.category, r.is_regex) for r in rules] == [
+        ("Пятерочка", "Продукты", False),
+        ("ВкусВилл", "Продукты", False),
+        ("яндекс\\s*go", "Транспорт", True),
+        ("Яндекс", "Подписки", False),
+    ]
+    assert parse_rules(format_rules(rules)) == rules
+
+    rule_set = RuleSet(rules)
+    assert rule_set.match("ПЯТЁРОЧКА 1234 Москва").category == "Продукты"
+    assert rule_set.match("Оплата Яндекс Go поездка").category == "Транспорт"
+    assert rule_set.match("Яндекс Плюс").category == "Подписки"
+    assert rule_set.match("Аптека") is None
+
+    with pytest.raises(ValueError, match="Строка 2"):
+        parse_rules("Пятерочка -> Продукты\nбез стрелки")
+
+
+def test_rules_reject_global_flags_and_backreferences():
+    """
+    [Boundary Value Analysis]
+    Регулярки с флагом на все выражение и с обратной ссылкой отклоняются при вводе;
+    флаг на группу и экранированная косая черта допустимы.
+    """
+    with pytest.raises(ValueError, match="Строка 1: флаги"):
+        parse_rules("/(?i)uber/ -> Транспорт")
+    with pytest.raises(ValueError, match="Строка 2: обратные ссылки"):
+        parse_rules("Метро -> Транспорт\n/(a)\\1/ -> Прочее")
+    assert len(parse_rules("/(?i:uber)\\s+trip/ -> Транспорт\n/c:\\\\1/ -> Прочее")) == 2
+
+
+def test_rule_set_earlier_rule_wins_and_skips_broken_rules():
+    """
+    [Cause-Effect]
+    Причина: раннее правило совпадает с частью текста, пересекаясь с совпадением позднего;
+    среди сохраненных правил есть регулярки с (?i), с обратной ссылкой и не компилирующаяся.
+    Следствие: побеждает раннее правило, (?i) и обратная ссылка работают, плохое пропускается.
+    """
+    rule_set = RuleSet([
+        Rule(pattern="(?i)uber", category="Такси", is_regex=True),
+        Rule(pattern="(о)\\1", category="Зоо", is_regex=True),
+        Rule(pattern="[", category="Прочее", is_regex=True),
+        Rule(pattern="кс т", category="A"),
+        Rule(pattern="яндекс", category="B"),
+    ])
+    assert len(rule_set) == 4
+    assert rule_set.match("UBER trip").category == "Такси"
+    assert rule_set.match("Зоомагазин").category == "Зоо"
+    assert rule_set.match("Яндекс Такси").category == "A"
+    assert rule_set.match("Яндекс Еда").category == "B"
+
+
+@pytest.mark.asyncio
+async def test_settings_escapes_regex_rules_for_markdown():
+    """
+    [Error Guessing]
+    Регулярка с '.*', '_' и '[' показывается в /settings экранированной,
+    иначе Telegram отклонил бы сообщение с parse_mode=Markdown.
+    """
+    from src.bot.handlers.settings import cmd_settings
+
+    user = MagicMock(id=1, custom_prompts="Кафе_и_бары", report_format="csv")
+    user.get_categories.return_value = ["Еда", "Транспорт"]
+    rule_store = MagicMock(load=AsyncMock(return_value=parse_rules("/яндекс.*go_[0-9]/ -> Транспорт")))
+    message = AsyncMock()
+
+    await cmd_settings(message, user, MagicMock(), rule_store)
+
+    text = message.answer.await_args.args[0]
+    assert "/яндекс.\\*go\\_\\[0-9]/ -> Транспорт" in text
+    assert "Кафе\\_и\\_бары" in text
+    assert message.answer.await_args.kwargs["parse_mode"] == "Markdown"
+
+
+def test_similarity_index_confidence():
+    """[Boundary Value Analysis] Похожее описание получает категорию, непохожее и спорное — нет."""
+    index = SimilarityIndex([
+        ("PYATEROCHKA 1234 MOSCOW", "Продукты"),
+        ("YANDEX TAXI 77", "Транспорт"),
+        ("APTEKA RIGLA", "Здоровье"),
+    ], threshold=0.6)
+
+    category, score, neighbour = index.predict("Pyaterochka 9876 Moscow obl")
+    assert category == "Продукты" and score >= 0.6
+    assert neighbour == "pyaterochka moscow"
+    assert index.predict("Ozon marketplace") is None
+
+
+@pytest.mark.asyncio
+async def test_processor_local_tiers_before_llm(db_session, db_user, caplog):
+    """
+    [Cause-Effect]
+    Причина: правило на 'Метро' и ранее категоризированная 'Пятерочка'.
+    Следствие: в LLM уходит только незнакомая строка, статистика уровней в логе.
+    """
+    await RuleStore().replace(db_session, db_user.id, parse_rules("Метро -> Транспорт"))
+    await db_session.commit()
+
+    store = TransactionStore()
+    first = [Transaction(date=datetime(2023, 9, 1), amount=500.0, description="PYATEROCHKA 1234 MOSCOW")]
+    await store.save(db_session, db_user.id, [("fp-1", Transaction(
+        date=first[0].date, amount=500.0, description=first[0].description, category="Еда"
+    ))], {})
+
+    rows = [
+        Transaction(date=datetime(2023, 10, 1), amount=60.0, description="Метро Москва"),
+        Transaction(date=datetime(2023, 10, 2), amount=700.0, description="Pyaterochka 5678 Moscow"),
+        Transaction(date=datetime(2023, 10, 3), amount=900.0, description="Неизвестный магазин"),
+    ]
+    parser = MagicMock()
+    parser.validate_format.return_value = True
+    parser.parse.return_value = rows
+    mock_llm = AsyncMock()
+    mock_llm.categorize_transaction.return_value = {"category": "Еда", "comment": "LLM"}
+
+    processor = Processor(
+        parser, mock_llm, MagicMock(), store=store, rules=RuleStore(), similarity_threshold=0.6
+    )
+    with caplog.at_level(logging.INFO, logger="src.core.processor"):
+        await processor.process_statement(db_user, "dummy.xlsx", db_session)
+
+    assert mock_llm.categorize_transaction.await_count == 1
+    assert mock_llm.categorize_transaction.call_args.kwargs['transaction'] is rows[2]
+    assert rows[0].category == "Транспорт"
+    assert rows[1].category == "Еда"
+    assert "rules 1 (33%)" in caplog.text
+    assert "similarity 1 (33%)" in caplog.text
+    assert "llm 1 (33%)" in caplog.text
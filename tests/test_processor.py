@@ -1,8 +1,11 @@
+import csv
+from dataclasses import replace
+
 import pytest
 from unittest.mock import MagicMock, AsyncMock
-from datetime import datetime
+from datetime import datetime, timedelta
 from src.core.processor import Processor
-from src.core.dtypes import UserNote
+from src.core.dtypes import ExportFile, Transaction, UserNote
 
 
 @pytest.mark.asyncio
@@ -40,4 +43,536 @@ async def test_processor_note_mapping_and_llm_call(mock_user, sample_transaction
     note_dto = kwargs['nearby_notes'][0]
     assert isinstance(note_dto, UserNote)
     assert note_dto.text == "Купил хлеб"  # Проверка маппинга из processor.py
-    assert note_dto.id == 101
\ No newline at end of file
+    assert note_dto.id == 101
+
+@pytest.mark.asyncio
+async def test_processor_batch_mode_uses_categorize_batch(mock_user, sample_transaction):
+    """[Equivalence Partitioning] При batch_size > 1 LLM вызывается один раз на пачку."""
+    # Разные магазины: одинаковые строки ушли бы одним запросом
+    transactions = [replace(sample_transaction, description=f"Магазин {name}") for name in "АБВГД"]
+
+    parser = MagicMock()
+    parser.validate_format.return_value = True
+    parser.parse.return_value = transactions
+
+    mock_llm = AsyncMock()
+    mock_llm.categorize_batch.side_effect = lambda items, categories, user_hints: [
+        {"category": "Еда", "comment": "Пачка"} for _ in items
+    ]
+
+    mock_result = MagicMock()
+    mock_result.scalars.return_value.all.return_value = []
+    db_mock = AsyncMock()
+    db_mock.execute.return_value = mock_result
+
+    processor = Processor(parser, mock_llm, MagicMock(), batch_size=2)
+    await processor.process_statement(mock_user, "dummy.xlsx", db_mock)
+
+    assert mock_llm.categorize_batch.await_count == 3
+    mock_llm.categorize_transaction.assert_not_called()
+    assert all(tx.category == "Еда" for tx in transactions)
+
+
+def test_note_index_window_boundaries():
+    """[Boundary Value Analysis] Границы окна включаются, соседние значения — нет."""
+    from src.core.notes_index import NoteIndex
+
+    base = datetime(2023, 10, 15, 12, 0)
+    notes = [UserNote(id=i, text=str(i), timestamp=base + timedelta(hours=h))
+             for i, h in enumerate([5, -24, -25, 24, 0, 25])]
+    index = NoteIndex(notes)
+
+    found = index.between(base - timedelta(days=1), base + timedelta(days=1))
+    assert [n.timestamp for n in found] == sorted(n.timestamp for n in found)
+    assert {n.id for n in found} == {0, 1, 3, 4}
+
+
+@pytest.mark.asyncio
+async def test_processor_loads_notes_with_single_query(mock_user, sample_transaction):
+    """[Cause-Effect] Заметки для всей выписки загружаются одним запросом к БД."""
+
+    parser = MagicMock()
+    parser.validate_format.return_value = True
+    parser.parse.return_value = [replace(sample_transaction, description=f"Магазин {name}") for name in "АБВГДЕЖЗИК"]
+
+    mock_llm = AsyncMock()
+    mock_llm.categorize_transaction.return_value = {"category": "Еда", "comment": "Ок"}
+
+    mock_result = MagicMock()
+    mock_result.scalars.return_value.all.return_value = []
+    db_mock = AsyncMock()
+    db_mock.execute.return_value = mock_result
+
+    processor = Processor(parser, mock_llm, MagicMock())
+    await processor.process_statement(mock_user, "dummy.xlsx", db_mock)
+
+    assert db_mock.execute.await_count == 1
+    assert mock_llm.categorize_transaction.await_count == 10
+
+
+@pytest.mark.asyncio
+async def test_processor_categorizes_while_streaming_parser_reads(mock_user, sample_transaction):
+    """
+    [Cause-Effect]
+    Потоковый парсер не дочитывает файл, пока LLM не получит первую порцию.
+    Если бы Processor ждал полного разбора, тест завис бы на event.wait.
+    """
+    import threading
+    from src.core.interfaces import BaseStreamingBankParser
+
+    first_llm_call = threading.Event()
+
+    class SlowParser(BaseStreamingBankParser):
+        def validate_format(self, file_path):
+            return True
+
+        def iter_parse(self, file_path):
+            yield replace(sample_transaction)
+            yield replace(sample_transaction)
+            assert first_llm_call.wait(timeout=5), "LLM не вызвана до конца чтения файла"
+            yield replace(sample_transaction)
+
+    async def categorize(**kwargs):
+        first_llm_call.set()
+        return {"category": "Еда", "comment": ""}
+
+    mock_llm = AsyncMock()
+    mock_llm.categorize_transaction.side_effect = categorize
+
+    mock_result = MagicMock()
+    mock_result.scalars.return_value.all.return_value = []
+    db_mock = AsyncMock()
+    db_mock.execute.return_value = mock_result
+
+    report_gen = MagicMock()
+    processor = Processor(SlowParser(), mock_llm, report_gen, stream_chunk_size=2)
+    await processor.process_statement(mock_user, "big.xlsx", db_mock)
+
+    transactions = report_gen.generate.call_args.args[0]
+    assert len(transactions) == 3
+    assert all(tx.category == "Еда" for tx in transactions)
+
+
+@pytest.mark.asyncio
+async def test_processor_incremental_reprocessing(db_session, db_user):
+    """
+    [State Transition]
+    1) Полмесяца -> все строки в LLM.
+    2) Полный месяц -> в LLM только новые строки.
+    3) Заметка рядом со старой строкой -> только эта строка пересчитывается.
+    """
+    from src.infrastructure.database.transactions import TransactionStore
+    from src.infrastructure.database.models import Note
+
+    def month(days):
+        rows = [Transaction(date=datetime(2023, 10, d, 12), amount=100.0 * d, description=f"Магазин {chr(0x410 + d)}")
+                for d in days]
+        # Две одинаковые покупки в одну минуту — разные строки (в LLM — один запрос на обе)
+        rows.append(Transaction(date=datetime(2023, 10, 1, 9), amount=150.0, description="Кофе"))
+        rows.append(Transaction(date=datetime(2023, 10, 1, 9), amount=150.0, description="Кофе"))
+        return rows
+
+    parser = MagicMock()
+    parser.validate_format.return_value = True
+    mock_llm = AsyncMock()
+    mock_llm.categorize_transaction.return_value = {"category": "Еда", "comment": "Ок"}
+    processor = Processor(parser, mock_llm, MagicMock(), window_days=1, store=TransactionStore())
+
+    parser.parse.return_value = month(range(1, 16))
+    await processor.process_statement(db_user, "half.xlsx", db_session)
+    assert mock_llm.categorize_transaction.await_count == 16
+
+    parser.parse.return_value = month(range(1, 31))
+    await processor.process_statement(db_user, "full.xlsx", db_session)
+    assert mock_llm.categorize_transaction.await_count == 16 + 15
+
+    note = Note(user_id=db_user.id, raw_text="Подарок маме", created_at=datetime(2023, 10, 20, 12))
+    db_session.add(note)
+    await processor.note_added(db_session, db_user.id, note.created_at)
+    await db_session.commit()
+
+    parser.parse.return_value = month(range(1, 31))
+    await processor.process_statement(db_user, "full.xlsx", db_session)
+    # Окно ±1 день: 19, 20 и 21 октября
+    assert mock_llm.categorize_transaction.await_count == 16 + 15 + 3
+
+
+@pytest.mark.asyncio
+async def test_transaction_store_conflict_keeps_pending_session_changes(db_session, db_user):
+    """
+    [Cause-Effect]
+    Причина: строку выписки уже сохранила параллельная задача, в общей сессии есть несохраненная заметка.
+    Следствие: повторная вставка пропускается, заметка и новая строка сохраняются, профиль читается.
+    """
+    from sqlalchemy import select
+    from src.infrastructure.database.models import Note, TransactionRecord
+    from src.infrastructure.database.transactions import TransactionStore
+
+    store = TransactionStore()
+    tx = Transaction(date=datetime(2023, 10, 1), amount=100.0, description="MAGNIT", category="Еда")
+    await store.save(db_session, db_user.id, [("fp-1", tx)], {})
+
+    db_session.add(Note(user_id=db_user.id, raw_text="Хлеб", created_at=datetime(2023, 10, 1)))
+    again = replace(tx, category="Транспорт")
+    await store.save(db_session, db_user.id, [("fp-1", again), ("fp-2", again)], {})
+
+    assert db_user.telegram_id == 12345
+    assert (await db_session.execute(select(Note.raw_text))).scalars().all() == ["Хлеб"]
+    rows = (await db_session.execute(
+        select(TransactionRecord.fingerprint, TransactionRecord.category).order_by(TransactionRecord.fingerprint)
+    )).all()
+    assert [tuple(r) for r in rows] == [("fp-1", "Еда"), ("fp-2", "Транспорт")]
+
+
+@pytest.mark.asyncio
+async def test_processor_keeps_no_transaction_open_during_llm_calls(tmp_path):
+    """
+    [State Transition]
+    Пока идут запросы к LLM, сессия выписки не держит открытую транзакцию чтения;
+    кэш и результаты записываются короткими сессиями, повторный прогон обновляет записи.
+    """
+    from sqlalchemy import select
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from src.infrastructure.database.cache import CategorizationCache
+    from src.infrastructure.database.models import Base, TransactionRecord, User
+    from src.infrastructure.database.transactions import TransactionStore
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'bot.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+
+    rows = [Transaction(date=datetime(2023, 10, d, 12), amount=10.0 * d, description=f"Магазин {d}")
+            for d in range(1, 4)]
+    parser = MagicMock()
+    parser.parse.side_effect = lambda path: [replace(tx) for tx in rows]
+    open_during_llm = []
+    answer = {"category": "Еда"}
+
+    async with session_maker() as db:
+        user = User(telegram_id=1)
+        user.set_categories(["Еда", "Транспорт"])
+        db.add(user)
+        await db.commit()
+
+        async def categorize(**kwargs):
+            open_during_llm.append(db.in_transaction())
+            return {**answer, "comment": ""}
+
+        llm = AsyncMock()
+        llm.categorize_transaction.side_effect = categorize
+        processor = Processor(
+            parser, llm, MagicMock(), store=TransactionStore(), cache=CategorizationCache(),
+            session_maker=session_maker
+        )
+        await processor.process_statement(user, "october.xlsx", db)
+        assert not db.in_transaction()
+
+        await processor.settings_changed(db, user.id)
+        await db.commit()
+        answer["category"] = "Транспорт"
+        await processor.process_statement(user, "october.xlsx", db)
+
+    async with session_maker() as db:
+        saved = (await db.execute(select(TransactionRecord.category, TransactionRecord.dirty))).all()
+    await engine.dispose()
+
+    assert open_during_llm == [False] * 6
+    assert [tuple(r) for r in saved] == [("Транспорт", False)] * 3
+
+
+@pytest.mark.asyncio
+async def test_processor_retries_overload_and_falls_back(mock_user, sample_transaction):
+    """
+    [Cause-Effect]
+    Причина: провайдер отвечает 429, затем успешно; для второй — ошибка 400 (не перегрузка).
+    Следствие: первая получает ответ после повтора, вторая — фолбэк 'Разное', лимит снижен.
+    """
+    from src.core.exceptions import LLMRateLimitError, LLMResponseError
+
+    ok_tx = Transaction(date=sample_transaction.date, amount=-100.0, description="ok")
+    broken_tx = Transaction(date=sample_transaction.date, amount=-200.0, description="broken")
+
+    parser = MagicMock()
+    parser.validate_format.return_value = True
+    parser.parse.return_value = [ok_tx, broken_tx]
+
+    calls = {"ok": 0}
+
+    async def categorize(transaction, nearby_notes, categories, user_hints):
+        if transaction is broken_tx:
+            raise LLMResponseError("Ollama Error 400")
+        calls["ok"] += 1
+        if calls["ok"] == 1:
+            raise LLMRateLimitError("Ollama Error 429")
+        return {"category": "Еда", "comment": ""}
+
+    mock_llm = AsyncMock()
+    mock_llm.categorize_transaction.side_effect = categorize
+
+    mock_result = MagicMock()
+    mock_result.scalars.return_value.all.return_value = []
+    db_mock = AsyncMock()
+    db_mock.execute.return_value = mock_result
+
+    processor = Processor(parser, mock_llm, MagicMock(), max_concurrency=4)
+    await processor.process_statement(mock_user, "dummy.xlsx", db_mock)
+
+    assert ok_tx.category == "Еда"
+    assert calls["ok"] == 2
+    # Ошибка не из-за перегрузки не повторяется
+    assert broken_tx.category == "Разное"
+    assert broken_tx.comment == "Ошибка соединения"
+    assert processor.limiter.limit == 2
+
+
+@pytest.mark.asyncio
+async def test_processor_parses_off_event_loop(mock_user, sample_transaction):
+    """[Cause-Effect] Пока медленный парсер читает файл, event loop обслуживает другие задачи."""
+    import asyncio
+    import time
+
+    def slow_parse(file_path):
+        time.sleep(0.3)
+        return [sample_transaction]
+
+    parser = MagicMock()
+    parser.validate_format.return_value = True
+    parser.parse.side_effect = slow_parse
+
+    mock_llm = AsyncMock()
+    mock_llm.categorize_transaction.return_value = {"category": "Еда", "comment": ""}
+    mock_result = MagicMock()
+    mock_result.scalars.return_value.all.return_value = []
+    db_mock = AsyncMock()
+    db_mock.execute.return_value = mock_result
+
+    ticks = 0
+
+    async def other_user():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker = asyncio.create_task(other_user())
+    processor = Processor(parser, mock_llm, MagicMock())
+    await processor.process_statement(mock_user, "statement.xlsx", db_mock)
+    ticker.cancel()
+
+    assert ticks >= 10
+
+
+@pytest.mark.asyncio
+async def test_processor_writes_streaming_report_off_event_loop(mock_user, sample_transaction):
+    """[Cause-Effect] Порции потокового отчета пишутся в потоке, по порядку выписки, до finish()."""
+    import threading
+    from src.core.interfaces import BaseReportWriter, BaseStreamingReportGenerator
+
+    rows = [replace(sample_transaction, description=f"Магазин {name}") for name in "АБВГД"]
+    writes = []
+
+    class RecordingWriter(BaseReportWriter):
+        def write(self, transactions):
+            writes.append((threading.get_ident(), [tx.description for tx in transactions]))
+
+        def finish(self):
+            return ExportFile('csv', b"")
+
+        def close(self):
+            pass
+
+    class RecordingGenerator(BaseStreamingReportGenerator):
+        def open(self):
+            return RecordingWriter()
+
+    parser = MagicMock()
+    parser.validate_format.return_value = True
+    parser.parse.return_value = rows
+    mock_llm = AsyncMock()
+    mock_llm.categorize_transaction.return_value = {"category": "Еда", "comment": ""}
+    mock_result = MagicMock()
+    mock_result.scalars.return_value.all.return_value = []
+    db_mock = AsyncMock()
+    db_mock.execute.return_value = mock_result
+
+    processor = Processor(parser, mock_llm, RecordingGenerator())
+    await processor.process_statement(mock_user, "statement.xlsx", db_mock)
+
+    assert writes
+    assert all(ident != threading.get_ident() for ident, _ in writes)
+    assert [d for _, batch in writes for d in batch] == [tx.description for tx in rows]
+
+
+@pytest.mark.asyncio
+async def test_processor_process_pool_parsing(tmp_path, mock_user):
+    """[Equivalence Partitioning] С пулом процессов выписка разбирается в дочернем процессе целиком."""
+    from concurrent.futures import ProcessPoolExecutor
+    from benchmarks.synthetic import generate_statement
+    from src.infrastructure.parsers.sber import SberParser
+    from src.infrastructure.reporters.basic_csv import BasicCSVReportGenerator
+
+    statement = generate_statement(str(tmp_path / "statement.xlsx"), rows=30, notes_density=0, seed=3)
+
+    mock_llm = AsyncMock()
+    mock_llm.categorize_transaction.return_value = {"category": "Еда", "comment": ""}
+    mock_result = MagicMock()
+    mock_result.scalars.return_value.all.return_value = []
+    db_mock = AsyncMock()
+    db_mock.execute.return_value = mock_result
+
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        processor = Processor(
+            SberParser(vectorized=True), mock_llm, BasicCSVReportGenerator(), executor=executor
+        )
+        report = await processor.process_statement(mock_user, statement.path, db_mock)
+
+    lines = report.file_content.read().decode('utf-8').splitlines()
+    assert len(lines) == 31
+    # Повторяющиеся магазины синтетической выписки спрашиваются один раз
+    descriptions = {row[3].strip() for row in csv.reader(lines[1:])}
+    assert mock_llm.categorize_transaction.await_count == len(descriptions)
+
+
+@pytest.mark.asyncio
+async def test_processor_flushes_note_buffer_and_merges_windows(mock_user, sample_transaction):
+    """[Cause-Effect] Перед выпиской дописываются заметки; близкие заметки помечают строки одним запросом."""
+    parser = MagicMock()
+    parser.validate_format.return_value = True
+    parser.parse.return_value = []
+    note_buffer = AsyncMock()
+    store = AsyncMock()
+    store.load.return_value = {}
+
+    processor = Processor(parser, AsyncMock(), MagicMock(), window_days=1, store=store, note_buffer=note_buffer)
+    await processor.process_statement(mock_user, "statement.xlsx", AsyncMock())
+    note_buffer.flush.assert_awaited_once()
+
+    day = datetime(2024, 1, 10)
+    await processor.notes_added(AsyncMock(), [(1, day), (1, day + timedelta(hours=5)), (1, day + timedelta(days=5))])
+    windows = [call.args[2:] for call in store.mark_dirty.await_args_list]
+    assert windows == [
+        (day - timedelta(days=1), day + timedelta(days=1, hours=5)),
+        (day + timedelta(days=4), day + timedelta(days=6)),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_processor_coalesces_identical_inflight_requests(mock_user, sample_transaction, caplog):
+    """
+    [Equivalence Partitioning] Десять поездок с одним описанием и разными суммами, без заметок, —
+    один запрос к LLM (без кэша), ответ получают все строки; строка с заметкой рядом спрашивается отдельно.
+    """
+    import asyncio
+    import logging
+
+    taxi = [replace(sample_transaction, description="Яндекс Такси", amount=300.0 + i) for i in range(10)]
+    with_note = replace(sample_transaction, description="Яндекс Такси", date=datetime(2023, 11, 20, 12))
+
+    parser = MagicMock()
+    parser.validate_format.return_value = True
+    parser.parse.return_value = taxi + [with_note]
+
+    async def categorize(transaction, nearby_notes, **kwargs):
+        await asyncio.sleep(0.01)
+        return {"category": "Транспорт", "comment": "Такси" + (" (заметка)" if nearby_notes else "")}
+
+    mock_llm = AsyncMock()
+    mock_llm.categorize_transaction.side_effect = categorize
+
+    note = MagicMock(id=1, raw_text="Ехал в аэропорт", created_at=datetime(2023, 11, 20, 11))
+    mock_result = MagicMock()
+    mock_result.scalars.return_value.all.return_value = [note]
+    db_mock = AsyncMock()
+    db_mock.execute.return_value = mock_result
+
+    report_gen = MagicMock()
+    processor = Processor(parser, mock_llm, report_gen, window_days=1)
+    with caplog.at_level(logging.INFO, logger="src.core.processor"):
+        await processor.process_statement(mock_user, "dummy.xlsx", db_mock)
+
+    assert mock_llm.categorize_transaction.await_count == 2
+    assert all(tx.category == "Транспорт" and tx.comment == "Такси" for tx in taxi)
+    assert with_note.comment == "Такси (заметка)"
+    assert processor._inflight == {}
+    assert "9 of 11 rows waited for an identical request" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_processor_does_not_coalesce_rows_with_notes_or_different_numbers(mock_user, sample_transaction):
+    """
+    [Cause-Effect]
+    Причина: две строки отличаются только суммой, рядом с каждой своя заметка;
+    еще две — только цифрами в описании.
+    Следствие: каждая строка спрашивается отдельно и получает свой комментарий.
+    """
+    import asyncio
+
+    coffee = [
+        replace(sample_transaction, description="Кофейня", amount=150.0, date=datetime(2023, 10, 15, 9)),
+        replace(sample_transaction, description="Кофейня", amount=900.0, date=datetime(2023, 10, 15, 9)),
+    ]
+    terminals = [replace(sample_transaction, description=f"Терминал {n}", amount=100.0) for n in (1, 2)]
+
+    parser = MagicMock()
+    parser.validate_format.return_value = True
+    parser.parse.return_value = coffee + terminals
+
+    async def categorize(transaction, nearby_notes, **kwargs):
+        await asyncio.sleep(0.01)
+        note = next((n.text for n in nearby_notes if str(int(transaction.amount)) in n.text), "")
+        return {"category": "Еда", "comment": note or transaction.description}
+
+    mock_llm = AsyncMock()
+    mock_llm.categorize_transaction.side_effect = categorize
+
+    notes = [
+        MagicMock(id=1, raw_text="150 кофе себе", created_at=datetime(2023, 10, 15, 9)),
+        MagicMock(id=2, raw_text="900 кофе на всю команду", created_at=datetime(2023, 10, 15, 9)),
+    ]
+    mock_result = MagicMock()
+    mock_result.scalars.return_value.all.return_value = notes
+    db_mock = AsyncMock()
+    db_mock.execute.return_value = mock_result
+
+    processor = Processor(parser, mock_llm, MagicMock(), window_days=1)
+    await processor.process_statement(mock_user, "dummy.xlsx", db_mock)
+
+    assert mock_llm.categorize_transaction.await_count == 4
+    assert [tx.comment for tx in coffee] == ["150 кофе себе", "900 кофе на всю команду"]
+    assert [tx.comment for tx in terminals] == ["Терминал 1", "Терминал 2"]
+
+
+@pytest.mark.asyncio
+async def test_processor_reports_progress_in_statement_order(mock_user, sample_transaction):
+    """
+    [State Transition] Готовые строки приходят в колбэк по порядку выписки, даже если
+    LLM ответила не по порядку; последний вызов — файл дочитан, готово все.
+    """
+    import asyncio
+
+    rows = [replace(sample_transaction, description=f"Магазин {name}") for name in "АБВ"]
+    parser = MagicMock()
+    parser.validate_format.return_value = True
+    parser.parse.return_value = rows
+
+    async def categorize(transaction, **kwargs):
+        # Первая строка отвечает последней
+        await asyncio.sleep(0.03 if transaction is rows[0] else 0.01)
+        return {"category": "Еда", "comment": ""}
+
+    mock_llm = AsyncMock()
+    mock_llm.categorize_transaction.side_effect = categorize
+    mock_result = MagicMock()
+    mock_result.scalars.return_value.all.return_value = []
+    db_mock = AsyncMock()
+    db_mock.execute.return_value = mock_result
+
+    updates = []
+    processor = Processor(parser, mock_llm, MagicMock())
+    await processor.process_statement(mock_user, "dummy.xlsx", db_mock, on_progress=updates.append)
+
+    assert [u.done for u in updates] == [0, 1, 2, 3]
+    assert [tx for u in updates for tx in u.ready] == rows
+    assert updates[-1].ready == rows
+    assert not updates[-1].reading and updates[-1].total == 3
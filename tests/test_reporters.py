@@ -0,0 +1,111 @@
+import asyncio
+import csv
+import io
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+import openpyxl
+import pytest
+
+from src.core.dtypes import Transaction
+from src.core.processor import Processor
+from src.infrastructure.reporters.basic_csv import BasicCSVReportGenerator
+from src.infrastructure.reporters.xlsx import XLSXReportGenerator
+
+
+def _transactions(n):
+    return [
+        Transaction(date=datetime(2024, 1, 1 + i % 28), amount=10.0 * i, description=f"Магазин {chr(0x410 + i)}",
+                    category="Еда", comment="")
+        for i in range(n)
+    ]
+
+
+def test_csv_writer_appends_rows_and_spills_to_disk():
+    """[Boundary Value Analysis] Отчет больше порога уходит на диск, строки дописываются порциями."""
+    writer = BasicCSVReportGenerator(spool_max_size=1024).open()
+    rows = _transactions(100)
+    writer.write(rows[:40])
+    writer.write(rows[40:])
+    report = writer.finish()
+
+    assert report.file_ext == 'csv'
+    assert report.file_content._rolled
+    lines = list(csv.reader(io.TextIOWrapper(report.file_content, encoding='utf-8', newline='')))
+    report.close()
+    assert lines[0][0] == 'Дата'
+    assert [line[3] for line in lines[1:]] == [tx.description for tx in rows]
+
+
+def test_xlsx_generate_keeps_dates_and_amounts_typed():
+    """[Happy Path] XLSX открывается openpyxl, дата и сумма — значения, а не текст."""
+    report = XLSXReportGenerator().generate(_transactions(3))
+
+    sheet = openpyxl.load_workbook(report.file_content, read_only=True).active
+    rows = list(sheet.iter_rows(values_only=True))
+    assert rows[0][:2] == ('Дата', 'Сумма')
+    assert rows[2][0] == datetime(2024, 1, 2)
+    assert rows[2][1] == 10.0
+    assert report.file_ext == 'xlsx'
+
+
+def test_parquet_roundtrip():
+    """[Happy Path] Parquet читается pyarrow с исходным числом строк."""
+    pq = pytest.importorskip("pyarrow.parquet")
+    from src.infrastructure.reporters.parquet import ParquetReportGenerator
+
+    report = ParquetReportGenerator(row_group_size=4).generate(_transactions(10))
+    table = pq.read_table(report.file_content)
+    assert table.num_rows == 10
+    assert table.column('description').to_pylist()[-1] == "Магазин Й"
+
+
+@pytest.mark.asyncio
+async def test_processor_streams_rows_in_statement_order(mock_user):
+    """
+    [State Transition] Ответы LLM приходят в обратном порядке, а строки
+    попадают в отчет в порядке выписки и только после ответа.
+    """
+    rows = _transactions(4)
+    parser = MagicMock()
+    parser.validate_format.return_value = True
+    parser.parse.return_value = rows
+
+    release = {tx.description: asyncio.Event() for tx in rows}
+
+    async def categorize(transaction, **kwargs):
+        await release[transaction.description].wait()
+        return {"category": "Еда", "comment": transaction.description}
+
+    mock_llm = AsyncMock()
+    mock_llm.categorize_transaction.side_effect = categorize
+
+    mock_result = MagicMock()
+    mock_result.scalars.return_value.all.return_value = []
+    db_mock = AsyncMock()
+    db_mock.execute.return_value = mock_result
+
+    written = []
+    generator = BasicCSVReportGenerator()
+    open_writer = generator.open
+
+    def spy_open():
+        writer = open_writer()
+        original = writer.write
+        writer.write = lambda txs: (written.append([tx.description for tx in txs]), original(txs))
+        return writer
+
+    generator.open = spy_open
+    mock_user.report_format = "csv"
+    processor = Processor(parser, mock_llm, MagicMock(), report_formats={"csv": generator})
+    task = asyncio.create_task(processor.process_statement(mock_user, "statement.xlsx", db_mock))
+
+    for tx in reversed(rows[1:]):
+        release[tx.description].set()
+        await asyncio.sleep(0.01)
+    assert written == []
+
+    release[rows[0].description].set()
+    report = await task
+    assert written == [[tx.description for tx in rows]]
+    assert len(report.file_content.read().decode('utf-8').splitlines()) == 5
@@ -0,0 +1,71 @@
+import asyncio
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, Tuple
+
+import pytest
+
+from src.core.warmup import Warmup
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Не должны грузиться при старте бота: нужны первой выписке, /metrics или webhook
+DEFERRED_MODULES = [
+    'pandas', 'numpy', 'openpyxl', 'fastapi', 'uvicorn',
+    'src.infrastructure.llm.yandex', 'src.infrastructure.llm.ollama',
+]
+# Бюджет импорта src.main без aiogram (его типы — основная часть старта, отложить их нельзя)
+IMPORT_BUDGET_SECONDS = 1.0
+
+IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)')
+
+
+def import_profile(module: str) -> Dict[str, Tuple[float, float]]:
+    """Модуль -> (собственное, накопленное время импорта в секундах) по выводу python -X importtime."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    )
+    profile = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            profile[match.group(4)] = (int(match.group(1)) / 1e6, int(match.group(2)) / 1e6)
+    return profile
+
+
+def test_bot_startup_defers_heavy_imports():
+    """
+    [Boundary Value Analysis]
+    Импорт src.main не тянет pandas, openpyxl, FastAPI и провайдеров LLM,
+    а все, кроме aiogram, укладывается в бюджет.
+    """
+    profile = import_profile('src.main')
+
+    assert 'src.main' in profile
+    assert [m for m in DEFERRED_MODULES if m in profile] == []
+    own_time = profile['src.main'][1] - profile.get('aiogram', (0, 0))[1]
+    assert own_time < IMPORT_BUDGET_SECONDS, f"src.main imports in {own_time:.2f} s without aiogram"
+
+
+@pytest.mark.asyncio
+async def test_warmup_imports_in_background_and_skips_missing():
+    """
+    [State Transition]
+    start() возвращается сразу, модули грузятся после задержки; отсутствующий
+    модуль пропускается. stop() до конца задержки отменяет прогрев.
+    """
+    sys.modules.pop('colorsys', None)
+    warmup = Warmup(['no_such_module_fingram', 'colorsys'], delay=0.05)
+    await warmup.start()
+    assert 'colorsys' not in sys.modules
+
+    await asyncio.wait_for(warmup._task, 5)
+    assert 'colorsys' in sys.modules
+
+    slow = Warmup(['colorsys'], delay=60)
+    await slow.start()
+    await slow.stop()
+    assert slow._task.cancelled()
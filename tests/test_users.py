@@ -0,0 +1,66 @@
+import pytest
+
+from src.infrastructure.database.models import User
+from src.infrastructure.database.users import UserCache, update_settings
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _user(telegram_id):
+    user = User(id=telegram_id, telegram_id=telegram_id)
+    user.set_categories(["Еда"])
+    return user
+
+
+def test_user_cache_lru_and_ttl():
+    """[Boundary Value Analysis] Вытесняется давно не читанный профиль; запись живет ровно ttl."""
+    clock = FakeClock()
+    cache = UserCache(ttl=10, max_size=2, clock=clock)
+    cache.put(_user(1))
+    cache.put(_user(2))
+    assert cache.get(1) is not None  # 1 теперь свежее, чем 2
+    cache.put(_user(3))
+
+    assert cache.get(2) is None
+    assert cache.get(1) is not None and cache.get(3) is not None
+
+    clock.now = 10
+    assert cache.get(1) is None
+    assert len(cache) == 1
+
+
+@pytest.mark.asyncio
+async def test_user_cache_skips_db_until_invalidated(db_session, db_user):
+    """[State Transition] Промах -> попадание без запроса в БД -> update_settings + invalidate -> новые данные."""
+    cache = UserCache()
+    loaded = await cache.load(db_session, db_user.telegram_id)
+    assert loaded.get_categories() == ["Еда", "Транспорт"]
+
+    db_session.expunge_all()
+    queries = []
+    original_scalar = db_session.scalar
+
+    async def counting_scalar(*args, **kwargs):
+        queries.append(args)
+        return await original_scalar(*args, **kwargs)
+
+    db_session.scalar = counting_scalar
+    cached = await cache.load(db_session, db_user.telegram_id)
+    assert cached is loaded and queries == []
+
+    await update_settings(db_session, cached, categories=["Дом"], custom_prompts="Коротко")
+    await db_session.commit()
+    assert cached.get_categories() == ["Дом"]
+    cache.invalidate(db_user.telegram_id)
+
+    db_session.expunge_all()
+    fresh = await cache.load(db_session, db_user.telegram_id)
+    assert len(queries) == 1
+    assert fresh is not cached
+    assert fresh.get_categories() == ["Дом"] and fresh.custom_prompts == "Коротко"
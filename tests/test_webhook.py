@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from aiogram import Bot, Dispatcher, Router, types
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from src.api.webhook import SECRET_HEADER, WEBHOOK_PATH, create_webhook_app
+from src.bot.handlers.settings import SettingsStates
+from src.infrastructure.database.fsm import SQLEventIsolation, SQLStorage
+from src.infrastructure.database.models import Base, FSMRecord
+
+KEY = StorageKey(bot_id=1, chat_id=42, user_id=42)
+
+
+@pytest_asyncio.fixture
+async def session_maker(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'bot.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_sql_storage_shares_fsm_between_workers(session_maker):
+    """
+    [State Transition] Состояние и данные, записанные одним процессом, читает другой;
+    после clear() запись удаляется.
+    """
+    worker_a, worker_b = SQLStorage(session_maker), SQLStorage(session_maker)
+
+    await FSMContext(worker_a, KEY).set_state(SettingsStates.waiting_categories)
+    await FSMContext(worker_a, KEY).update_data(draft=["Еда", "Такси"])
+
+    context_b = FSMContext(worker_b, KEY)
+    assert await context_b.get_state() == SettingsStates.waiting_categories.state
+    assert await context_b.get_data() == {"draft": ["Еда", "Такси"]}
+
+    await context_b.clear()
+    assert await FSMContext(worker_a, KEY).get_state() is None
+    async with session_maker() as db:
+        assert (await db.execute(select(FSMRecord))).first() is None
+
+
+@pytest.mark.asyncio
+async def test_sql_event_isolation_serializes_chat_across_workers(session_maker):
+    """
+    [Cause-Effect] Событие чата во втором процессе ждет, пока первый снимет блокировку;
+    блокировка упавшего процесса истекает по ttl.
+    """
+    worker_a = SQLEventIsolation(session_maker, poll_interval=0.005)
+    worker_b = SQLEventIsolation(session_maker, poll_interval=0.005)
+    events = []
+
+    async def handle(isolation, name):
+        async with isolation.lock(KEY):
+            events.append(f"{name} start")
+            await asyncio.sleep(0.05)
+            events.append(f"{name} end")
+
+    await asyncio.gather(handle(worker_a, "a"), handle(worker_b, "b"))
+    assert events in (["a start", "a end", "b start", "b end"], ["b start", "b end", "a start", "a end"])
+
+    crashed = SQLEventIsolation(session_maker, ttl=0.05)
+    assert await crashed._acquire("1:42:42:::default", "dead")
+    await asyncio.wait_for(handle(worker_b, "after crash"), timeout=2)
+
+
+@pytest.mark.asyncio
+async def test_sql_event_isolation_renews_lock_of_long_handler(session_maker):
+    """
+    [Boundary Value Analysis] Обработчик, который работает в несколько раз дольше ttl,
+    не теряет блокировку: второй процесс входит только после его выхода.
+    """
+    worker_a = SQLEventIsolation(session_maker, ttl=0.1, poll_interval=0.005)
+    worker_b = SQLEventIsolation(session_maker, ttl=0.1, poll_interval=0.005)
+    events = []
+
+    async def long_handler():
+        async with worker_a.lock(KEY):
+            events.append("a start")
+            await asyncio.sleep(0.4)
+            events.append("a end")
+
+    async def next_event():
+        await asyncio.sleep(0.02)
+        async with worker_b.lock(KEY):
+            events.append("b start")
+
+    await asyncio.gather(long_handler(), next_event())
+    assert events == ["a start", "a end", "b start"]
+
+
+def test_webhook_app_checks_secret_and_feeds_dispatcher():
+    """[Equivalence Partitioning] Апдейт с неверным секретом отклоняется, с верным — доходит до хендлера."""
+    received = []
+    router = Router()
+
+    @router.message()
+    async def on_message(message: types.Message):
+        received.append(message.text)
+
+    async def build():
+        bot, dp = Bot(token="42:TEST"), Dispatcher()
+        dp.include_router(router)
+        # Как в build_dispatcher: бот лежит и в workflow_data
+        dp["bot"] = bot
+        return bot, dp
+
+    update = {
+        "update_id": 1,
+        "message": {
+            "message_id": 1, "date": 0, "text": "Кофе 300",
+            "chat": {"id": 7, "type": "private"},
+            "from": {"id": 7, "is_bot": False, "first_name": "Test"},
+        },
+    }
+    with TestClient(create_webhook_app(build, secret_token="s3cret")) as client:
+        assert client.post(WEBHOOK_PATH, json=update, headers={SECRET_HEADER: "wrong"}).status_code == 401
+        assert client.post(WEBHOOK_PATH, json=update, headers={SECRET_HEADER: "s3cret"}).status_code == 200
+        assert client.get("/healthz").json() == {"status": "ok"}
+
+    assert received == ["Кофе 300"]
+
+
+def test_webhook_requires_secret():
+    """
+    [Boundary Value Analysis] Без секрета приложение отклоняет любой апдейт,
+    а запуск в режиме webhook прерывается ошибкой.
+    """
+    from src.main import require_webhook_secret
+
+    async def build():
+        return Bot(token="42:TEST"), Dispatcher()
+
+    update = {"update_id": 1}
+    with TestClient(create_webhook_app(build, secret_token=None)) as client:
+        assert client.post(WEBHOOK_PATH, json=update).status_code == 401
+        assert client.post(WEBHOOK_PATH, json=update, headers={SECRET_HEADER: ""}).status_code == 401
+
+    with pytest.raises(ValueError, match="TELEGRAM_WEBHOOK_SECRET"):
+        require_webhook_secret({'webhook_secret': None})
+    require_webhook_secret({'webhook_secret': "s3cret"})